@@ -0,0 +1,168 @@
+"""
+Denormalized per-album member counters.
+
+`album_stats` holds one doc per album: {album_id, member_count, updated_at}.
+activate/deactivate apply an atomic $inc, so reading the member count is a
+single indexed lookup instead of count_documents over album_members.
+
+Albums without a counter doc (created before the counters existed) are
+counted from album_members instead: `backfill` runs at startup, and a join,
+leave or read that finds no doc recounts that album rather than starting
+from 0. Backfills only insert missing docs ($setOnInsert), so they never
+overwrite a live counter. The repair job recounts every album and fixes
+any drift (e.g. after manual data cleanup).
+
+CLI:
+    python album_counters.py repair [album_id ...]
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+ALBUM_STATS_COLLECTION = "album_stats"
+
+
+async def member_joined(db, album_id: str):
+    await _inc_members(db, album_id, 1)
+
+
+async def member_left(db, album_id: str):
+    await _inc_members(db, album_id, -1)
+
+
+async def _inc_members(db, album_id: str, delta: int):
+    result = await db[ALBUM_STATS_COLLECTION].update_one(
+        {"album_id": album_id},
+        {
+            "$inc": {"member_count": delta},
+            "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
+        }
+    )
+    if result.matched_count == 0:
+        # No counter yet: album_members already reflects this change, count it
+        await _write_counts(db, await _count_members(db, [album_id]), overwrite=False)
+
+
+async def get_member_counts(db, album_ids: Iterable[str]) -> Dict[str, int]:
+    """Member count per album ({album_id: count}), one indexed read."""
+    album_ids = list(album_ids)
+    if not album_ids:
+        return {}
+    docs = await db[ALBUM_STATS_COLLECTION].find(
+        {"album_id": {"$in": album_ids}},
+        {"_id": 0, "album_id": 1, "member_count": 1}
+    ).to_list(None)
+    counts = {doc['album_id']: max(0, doc.get('member_count', 0)) for doc in docs}
+
+    missing = [aid for aid in album_ids if aid not in counts]
+    if missing:
+        counts.update(await _write_counts(db, await _count_members(db, missing), overwrite=False))
+    return counts
+
+
+async def _count_members(db, album_ids: Optional[List[str]] = None) -> Dict[str, int]:
+    """Members per album from album_members (every album with members when album_ids is None)."""
+    match = {"album_id": {"$in": album_ids}} if album_ids is not None else {}
+    rows = await db.album_members.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$album_id", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    counts = {album_id: 0 for album_id in album_ids or []}
+    counts.update({row['_id']: row['count'] for row in rows})
+    return counts
+
+
+async def _write_counts(db, counts: Dict[str, int], overwrite: bool) -> Dict[str, int]:
+    """
+    Store recounted values. With overwrite=False only missing docs are created
+    and an existing counter (e.g. one a concurrent join just created) wins.
+    Returns {album_id: stored member_count}.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    result = {}
+    for album_id, count in counts.items():
+        if overwrite:
+            update = {"$set": {"member_count": count, "updated_at": now}}
+        else:
+            update = {"$setOnInsert": {"member_count": count, "updated_at": now}}
+        try:
+            doc = await db[ALBUM_STATS_COLLECTION].find_one_and_update(
+                {"album_id": album_id}, update,
+                upsert=True,
+                projection={"_id": 0, "member_count": 1},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # A concurrent recount created the doc first; keep its value
+            doc = await db[ALBUM_STATS_COLLECTION].find_one({"album_id": album_id}, {"_id": 0, "member_count": 1})
+        result[album_id] = max(0, doc.get('member_count', 0)) if doc else count
+    return result
+
+
+async def backfill(db) -> int:
+    """
+    Create the counter of every album that has none, counted from
+    album_members. Existing counters are left alone. Returns the number created.
+    """
+    existing = set(await db[ALBUM_STATS_COLLECTION].distinct("album_id"))
+    album_ids = [a['id'] for a in await db.albums.find({}, {"_id": 0, "id": 1}).to_list(None)]
+    missing = [aid for aid in album_ids if aid not in existing]
+    if not missing:
+        return 0
+    await _write_counts(db, await _count_members(db, missing), overwrite=False)
+    logger.info(f"[ALBUM_COUNTERS] Backfilled {len(missing)} album counters")
+    return len(missing)
+
+
+async def repair(db, album_ids: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Recount members from album_members and overwrite the counters.
+    With no album_ids every album that has members or a counter is repaired.
+    Returns {album_id: member_count}.
+    """
+    counts = await _count_members(db, album_ids)
+    if album_ids is None:
+        for album_id in await db[ALBUM_STATS_COLLECTION].distinct("album_id"):
+            counts.setdefault(album_id, 0)
+    result = await _write_counts(db, counts, overwrite=True)
+    logger.info(f"[ALBUM_COUNTERS] Repaired {len(result)} album counters")
+    return result
+
+
+async def ensure_indexes(db):
+    await db[ALBUM_STATS_COLLECTION].create_index("album_id", unique=True)
+
+
+async def _main(album_ids: List[str]):
+    import os
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        await ensure_indexes(db)
+        counts = await repair(db, album_ids or None)
+        for album_id, count in sorted(counts.items()):
+            print(f"  {album_id}: {count} members")
+        print(f"✅ Repaired {len(counts)} album counters")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    import sys
+    args = sys.argv[1:]
+    if not args or args[0] != "repair":
+        print(__doc__)
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args[1:]))
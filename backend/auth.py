@@ -1,9 +1,11 @@
 from fastapi import HTTPException, Depends, Header
-from typing import Optional
+from typing import Awaitable, Callable, Optional
+from collections import OrderedDict
 import jwt
 import os
 import random
 import logging
+import time
 from datetime import datetime, timedelta, timezone
 
 logger = logging.getLogger(__name__)
@@ -11,6 +13,16 @@ logger = logging.getLogger(__name__)
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 
+# Short-lived, single-purpose tokens for the SSE stream (EventSource can only
+# send them in the URL, so they must be useless anywhere else and soon expire)
+STREAM_TOKEN_SCOPE = 'events'
+STREAM_TOKEN_TTL_SECONDS = 60
+
+# Verified token -> claims. Only signature-checked tokens are cached and each
+# entry is dropped once its `exp` passes, so a hit is as good as jwt.decode.
+TOKEN_CACHE_SIZE = 10000
+_token_cache: "OrderedDict[str, dict]" = OrderedDict()
+
 otp_storage = {}
 
 def generate_otp() -> str:
@@ -61,13 +73,41 @@ def create_token(user_id: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def create_stream_token(user_id: str) -> str:
+    payload = {
+        'user_id': user_id,
+        'scope': STREAM_TOKEN_SCOPE,
+        'exp': datetime.now(timezone.utc) + timedelta(seconds=STREAM_TOKEN_TTL_SECONDS)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+def decode_stream_token(token: str) -> dict:
+    """Claims of a stream token; session tokens are rejected."""
+    payload = decode_token(token)
+    if payload.get('scope') != STREAM_TOKEN_SCOPE:
+        raise HTTPException(status_code=401, detail='Invalid token')
+    return payload
+
 def decode_token(token: str) -> dict:
+    claims = _token_cache.get(token)
+    if claims is not None:
+        if 'exp' not in claims or claims['exp'] > time.time():
+            _token_cache.move_to_end(token)
+            return claims
+        del _token_cache[token]
+        raise HTTPException(status_code=401, detail='Token expired')
+    
     try:
-        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        claims = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail='Token expired')
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail='Invalid token')
+    
+    _token_cache[token] = claims
+    if len(_token_cache) > TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)  # Least recently used
+    return claims
 
 async def get_current_user(authorization: Optional[str] = Header(None)) -> str:
     if not authorization:
@@ -81,4 +121,26 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> str:
         raise HTTPException(status_code=401, detail='Invalid authorization header format')
     
     payload = decode_token(token)
+    if payload.get('scope'):
+        # Scoped tokens (e.g. stream tokens) are not session tokens
+        raise HTTPException(status_code=401, detail='Invalid token')
     return payload['user_id']
+
+class CurrentUser:
+    """
+    The authenticated user of a request: the id from the token, plus the user
+    document loaded on the first `await load()` and reused afterwards.
+    Handlers that never call load() cost no DB read.
+    """
+    
+    def __init__(self, user_id: str, loader: Callable[[str], Awaitable[Optional[dict]]]):
+        self.id = user_id
+        self._loader = loader
+        self._loaded = False
+        self._user: Optional[dict] = None
+    
+    async def load(self) -> Optional[dict]:
+        if not self._loaded:
+            self._user = await self._loader(self.id)
+            self._loaded = True
+        return self._user
@@ -0,0 +1,87 @@
+"""
+Micro-benchmark: scalar haversine loop vs. vectorized NumPy radius filter.
+
+Times filtering N candidates around Buenos Aires with the per-member
+is_within_radius-style loop and with geo.filter_within_radius().
+
+Usage:
+    python benchmarks/bench_geo_filter.py [--radius 10]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import geo  # noqa: E402
+from geo import haversine_distance, get_user_coordinates  # noqa: E402
+
+CANDIDATE_COUNTS = [10, 100, 1_000, 10_000, 100_000]
+REPEATS = 5
+
+
+def scalar_filter(user, candidates, radius_km):
+    """Per-member loop, equivalent to calling is_within_radius on each candidate."""
+    origin = get_user_coordinates(user)
+    result = []
+    for c in candidates:
+        coords = get_user_coordinates(c)
+        if origin is None or coords is None or haversine_distance(*origin, *coords) <= radius_km:
+            result.append(c)
+    return result
+
+
+def best_of(fn, *args):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--radius', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=2026)
+    args = parser.parse_args()
+
+    if not geo.NUMPY_AVAILABLE:
+        print("NumPy is not installed - nothing to compare.")
+        return
+
+    rng = random.Random(args.seed)
+    me = {"latitude": -34.6037, "longitude": -58.3816}
+
+    print(f"Radius: {args.radius} km (best of {REPEATS})")
+    print(f"{'candidates':>11} {'scalar (ms)':>12} {'numpy (ms)':>11} {'speedup':>9} {'kept':>7}")
+    for count in CANDIDATE_COUNTS:
+        candidates = []
+        for i in range(count):
+            if i % 20 == 0:
+                candidates.append({"id": str(i)})  # no location -> always kept
+            else:
+                candidates.append({
+                    "id": str(i),
+                    "latitude": me["latitude"] + rng.uniform(-0.5, 0.5),
+                    "longitude": me["longitude"] + rng.uniform(-0.5, 0.5),
+                })
+
+        scalar_time, expected = best_of(scalar_filter, me, candidates, args.radius)
+        # Force the vectorized path even for tiny inputs so the crossover is visible
+        threshold = geo.VECTORIZE_MIN_CANDIDATES
+        geo.VECTORIZE_MIN_CANDIDATES = 0
+        try:
+            numpy_time, result = best_of(geo.filter_within_radius, me, candidates, args.radius)
+        finally:
+            geo.VECTORIZE_MIN_CANDIDATES = threshold
+
+        assert [c["id"] for c in result] == [c["id"] for c in expected], "results differ"
+        print(f"{count:>11} {scalar_time * 1000:>12.3f} {numpy_time * 1000:>11.3f} "
+              f"{scalar_time / numpy_time:>8.1f}x {len(result):>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark: legacy list-scan matching vs. the bitset match engine.
+
+Simulates the per-request work of GET /albums/{id}/matches for an album of
+~670 stickers (World Cup size) at 1k, 10k and 100k album members.
+Database access is excluded - only the in-process matching is timed.
+
+Usage:
+    python benchmarks/bench_match_engine.py [--stickers 670] [--legacy-sample 1000]
+
+The legacy algorithm is quadratic in the catalog size, so for large member
+counts it is timed on a sample of members and extrapolated (marked with *).
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from match_engine import AlbumStickerIndex, compare, can_match_anyone  # noqa: E402
+
+MEMBER_COUNTS = [1_000, 10_000, 100_000]
+INVENTORY_POOL_SIZE = 2_000  # distinct inventories, reused across members to bound memory
+
+
+def make_inventory(rng: random.Random, sticker_ids: list) -> dict:
+    """Random inventory: ~80% owned, a few duplicates - most pairs still match."""
+    inv = {}
+    for sid in sticker_ids:
+        roll = rng.random()
+        if roll < 0.2:
+            continue
+        inv[sid] = 2 + int(rng.random() * 3) if roll > 0.995 else 1
+    return inv
+
+
+def legacy_match(sticker_ids, my_inv_map, other_inv_map) -> bool:
+    """Copy of the original list-based algorithm from server.py."""
+    my_duplicates = [sid for sid in sticker_ids if my_inv_map.get(sid, 0) >= 2]
+    my_missing = [sid for sid in sticker_ids if my_inv_map.get(sid, 0) == 0]
+    other_duplicates = [sid for sid in sticker_ids if other_inv_map.get(sid, 0) >= 2]
+    other_missing = [sid for sid in sticker_ids if other_inv_map.get(sid, 0) == 0]
+    i_can_give = [sid for sid in my_duplicates if sid in other_missing]
+    i_can_get = [sid for sid in other_duplicates if sid in my_missing]
+    return bool(i_can_give and i_can_get)
+
+
+def run_legacy(sticker_ids, my_inv, pool, members) -> int:
+    matches = 0
+    for m in members:
+        if legacy_match(sticker_ids, my_inv, pool[m]):
+            matches += 1
+    return matches
+
+
+def run_engine(sticker_ids, my_inv, pool, members) -> int:
+    index = AlbumStickerIndex(sticker_ids)
+    my_bits = index.encode(my_inv)
+    if not can_match_anyone(my_bits):
+        return 0
+    matches = 0
+    for m in members:
+        if compare(my_bits, index.encode(pool[m])).is_mutual:
+            matches += 1
+    return matches
+
+
+def run_engine_preencoded(my_bits, encoded_pool, members) -> int:
+    """Compare-only cost, for when member bitmaps are already cached."""
+    matches = 0
+    for m in members:
+        if compare(my_bits, encoded_pool[m]).is_mutual:
+            matches += 1
+    return matches
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stickers', type=int, default=670)
+    parser.add_argument('--legacy-sample', type=int, default=1_000,
+                        help='max members to time the legacy algorithm on before extrapolating')
+    parser.add_argument('--seed', type=int, default=2022)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sticker_ids = [f"sticker-{i:04d}" for i in range(args.stickers)]
+    my_inv = make_inventory(rng, sticker_ids)
+    pool = [make_inventory(rng, sticker_ids) for _ in range(INVENTORY_POOL_SIZE)]
+    index = AlbumStickerIndex(sticker_ids)
+    my_bits = index.encode(my_inv)
+    encoded_pool = [index.encode(inv) for inv in pool]
+
+    print(f"Album size: {args.stickers} stickers")
+    print(f"{'members':>10} {'legacy (s)':>14} {'bitset (s)':>12} {'speedup':>10} "
+          f"{'cached (s)':>12} {'speedup':>10} {'matches':>9}")
+    for count in MEMBER_COUNTS:
+        members = [rng.randrange(INVENTORY_POOL_SIZE) for _ in range(count)]
+
+        sample = members[:args.legacy_sample]
+        legacy_time, _ = timed(run_legacy, sticker_ids, my_inv, pool, sample)
+        extrapolated = len(sample) < count
+        if extrapolated:
+            legacy_time = legacy_time * count / len(sample)
+
+        engine_time, matches = timed(run_engine, sticker_ids, my_inv, pool, members)
+        cached_time, _ = timed(run_engine_preencoded, my_bits, encoded_pool, members)
+
+        legacy_label = f"{legacy_time:.3f}{'*' if extrapolated else ''}"
+        print(f"{count:>10} {legacy_label:>14} {engine_time:>12.3f} {legacy_time / engine_time:>9.1f}x "
+              f"{cached_time:>12.3f} {legacy_time / cached_time:>9.0f}x {matches:>9}")
+
+    print("\n* extrapolated from the first --legacy-sample members")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Process-local sticker catalog cache.
+
+Album catalogs are effectively static: they are only rewritten by
+init_albums.py and the migration scripts. Instead of reloading the full
+sticker list on every request, each album's catalog is loaded once and kept
+in memory with:
+- the stickers sorted by number,
+- an id -> sticker map,
+- a dense AlbumStickerIndex (for the bitset match engine).
+
+Invalidation: every catalog carries the version found in the
+`catalog_versions` collection ({album_id, version}) when it was loaded.
+Scripts that rewrite stickers call bump_catalog_version(); running servers
+notice the new version on their next check (at most every
+VERSION_CHECK_INTERVAL_SECONDS) and reload that album lazily.
+
+Cached sticker dicts are shared - callers that modify stickers (e.g. to
+merge in owned_qty) must use copy_stickers() / stickers_by_ids().
+"""
+import logging
+import time
+from typing import Dict, Iterable, List, Optional
+
+from match_engine import AlbumStickerIndex
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSIONS_COLLECTION = "catalog_versions"
+
+# How often a process re-reads catalog_versions to detect rewritten catalogs
+VERSION_CHECK_INTERVAL_SECONDS = 30
+
+
+class AlbumCatalog:
+    """Immutable snapshot of one album's stickers."""
+
+    def __init__(self, album_id: str, stickers: Iterable[dict], version: int = 0):
+        self.album_id = album_id
+        self.version = version
+        self.stickers: List[dict] = sorted(stickers, key=lambda s: (s.get('number') or 0, s['id']))
+        self.by_id: Dict[str, dict] = {s['id']: s for s in self.stickers}
+        self.sticker_index = AlbumStickerIndex(s['id'] for s in self.stickers)
+
+    def __len__(self) -> int:
+        return len(self.stickers)
+
+    def __contains__(self, sticker_id: str) -> bool:
+        return sticker_id in self.by_id
+
+    def get(self, sticker_id: str) -> Optional[dict]:
+        """Cached sticker (do not modify) or None if not in this album."""
+        return self.by_id.get(sticker_id)
+
+    def copy_stickers(self) -> List[dict]:
+        """Sorted catalog as fresh dicts, safe for per-request mutation."""
+        return [dict(s) for s in self.stickers]
+
+    def stickers_by_ids(self, sticker_ids: Iterable[str]) -> List[dict]:
+        """Copies of the given stickers in the given order; unknown ids are skipped."""
+        by_id = self.by_id
+        return [dict(by_id[sid]) for sid in sticker_ids if sid in by_id]
+
+
+_catalogs: Dict[str, AlbumCatalog] = {}
+_versions: Dict[str, int] = {}
+_versions_checked_at = 0.0
+
+
+async def _refresh_versions(db, force: bool = False):
+    """Re-read catalog versions and drop catalogs that were rewritten."""
+    global _versions_checked_at
+    now = time.monotonic()
+    if not force and now - _versions_checked_at < VERSION_CHECK_INTERVAL_SECONDS:
+        return
+    docs = await db[CATALOG_VERSIONS_COLLECTION].find({}, {"_id": 0}).to_list(None)
+    _versions.clear()
+    _versions.update({d['album_id']: d.get('version', 0) for d in docs})
+    _versions_checked_at = now
+
+    for album_id, catalog in list(_catalogs.items()):
+        if catalog.version != _versions.get(album_id, 0):
+            logger.info(f"Sticker catalog changed for album {album_id}, reloading")
+            del _catalogs[album_id]
+
+
+async def _load_catalog(db, album_id: str) -> AlbumCatalog:
+    stickers = await db.stickers.find({"album_id": album_id}, {"_id": 0}).to_list(None)
+    catalog = AlbumCatalog(album_id, stickers, _versions.get(album_id, 0))
+    _catalogs[album_id] = catalog
+    return catalog
+
+
+async def get_catalog(db, album_id: str) -> AlbumCatalog:
+    """Catalog for an album, loaded on first use (empty if the album has no stickers)."""
+    await _refresh_versions(db)
+    catalog = _catalogs.get(album_id)
+    if catalog is None:
+        catalog = await _load_catalog(db, album_id)
+    return catalog
+
+
+async def find_sticker(db, sticker_id: str) -> Optional[dict]:
+    """
+    Look up a sticker by id across all albums (do not modify the result).
+    Falls back to the database for albums not loaded yet.
+    """
+    await _refresh_versions(db)
+    for catalog in _catalogs.values():
+        sticker = catalog.get(sticker_id)
+        if sticker is not None:
+            return sticker
+    doc = await db.stickers.find_one({"id": sticker_id}, {"_id": 0, "album_id": 1})
+    if not doc:
+        return None
+    catalog = await get_catalog(db, doc['album_id'])
+    return catalog.get(sticker_id)
+
+
+async def warm(db) -> int:
+    """Load every album catalog (called at startup). Returns the number of albums."""
+    await _refresh_versions(db, force=True)
+    album_ids = await db.stickers.distinct("album_id")
+    for album_id in album_ids:
+        await _load_catalog(db, album_id)
+    return len(album_ids)
+
+
+def invalidate(album_id: Optional[str] = None):
+    """Drop one (or every) cached catalog in this process."""
+    if album_id is None:
+        _catalogs.clear()
+    else:
+        _catalogs.pop(album_id, None)
+
+
+async def bump_catalog_version(db, album_ids: Optional[List[str]] = None):
+    """
+    Mark catalogs as rewritten so running servers reload them.
+    Call after inserting, deleting or updating stickers; with no album_ids
+    every album that has (or had) a catalog is bumped.
+    """
+    if album_ids is None:
+        album_ids = set(await db.stickers.distinct("album_id"))
+        album_ids.update(await db[CATALOG_VERSIONS_COLLECTION].distinct("album_id"))
+    for album_id in album_ids:
+        await db[CATALOG_VERSIONS_COLLECTION].update_one(
+            {"album_id": album_id},
+            {"$inc": {"version": 1}},
+            upsert=True
+        )
+        invalidate(album_id)
+
+
+async def ensure_indexes(db):
+    await db[CATALOG_VERSIONS_COLLECTION].create_index("album_id", unique=True)
+    await db.stickers.create_index("album_id")
+    await db.stickers.create_index("id")
@@ -0,0 +1,152 @@
+"""
+Per-user append-only change feed.
+
+Mutation paths append small events ({type, data}) to `user_events` with a
+per-user, strictly increasing `seq` (allocated from `user_event_counters`).
+Clients remember the last seq they saw and call GET /me/changes?since=<seq>
+to learn what changed - one indexed query when nothing did.
+
+Events expire after EVENT_RETENTION_DAYS. Whether a cursor is still usable
+is decided from the user's seq counter and the retained events, never from
+the gap between `since` and the next event (a failed insert also leaves a
+gap). A client whose cursor is older than the oldest retained event, or
+ahead of the counter, is told to do a full refresh (`reset`).
+
+Allocating a seq and inserting its event are two writes, so concurrent
+records can commit out of order: seq 6 may be visible before seq 5. A poll
+therefore only returns the contiguous run after `since` and stops before a
+missing seq while the event after it is younger than GAP_GRACE_SECONDS
+(the missing one was allocated even earlier, so its insert may still land).
+Older holes are failed inserts and are skipped.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+EVENTS_COLLECTION = "user_events"
+COUNTERS_COLLECTION = "user_event_counters"
+
+EVENT_RETENTION_DAYS = 30
+
+# How long a missing seq may still be an insert in flight
+GAP_GRACE_SECONDS = 30
+
+
+def _aware(value: datetime) -> datetime:
+    # Mongo returns naive UTC datetimes unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+async def _next_seq(db, user_id: str) -> int:
+    counter = await db[COUNTERS_COLLECTION].find_one_and_update(
+        {"user_id": user_id},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter['seq']
+
+
+async def record(db, user_ids: Iterable[str], event_type: str, data: dict):
+    """Append one event to each user's feed. Never raises (best effort)."""
+    for user_id in dict.fromkeys(user_ids):
+        try:
+            seq = await _next_seq(db, user_id)
+            # Stamped after the seq is allocated: every earlier seq was allocated before created_at
+            await db[EVENTS_COLLECTION].insert_one({
+                "user_id": user_id,
+                "seq": seq,
+                "type": event_type,
+                "data": data,
+                "created_at": datetime.now(timezone.utc)
+            })
+        except Exception as e:
+            logger.warning(f"[CHANGE_FEED] Could not record {event_type} for {user_id}: {e}")
+
+
+async def get_changes(db, user_id: str, since: int, limit: int) -> Optional[dict]:
+    """
+    Events with seq > since, oldest first, up to the first missing seq whose
+    insert may still be in flight. None when nothing (readable yet) was
+    recorded after `since` (one counter lookup when idle). `has_more` is set
+    when more than `limit` events are pending; `reset` when events after
+    `since` are no longer retained (expired) or the cursor is ahead of the
+    counter.
+    """
+    counter = await db[COUNTERS_COLLECTION].find_one({"user_id": user_id}, {"_id": 0, "seq": 1})
+    latest_seq = counter['seq'] if counter else 0
+    if since == latest_seq:
+        return None
+    if since > latest_seq:
+        return _reset(latest_seq)
+
+    events: List[dict] = await db[EVENTS_COLLECTION].find(
+        {"user_id": user_id, "seq": {"$gt": since}},
+        {"_id": 0, "user_id": 0}
+    ).sort("seq", 1).to_list(limit + 1)
+    if not events:
+        # Recorded after `since` but not retained: expired, or still being inserted
+        if since > 0 and await _expired_through(db, user_id, since):
+            return _reset(latest_seq)
+        return None if since > 0 else {
+            "events": [], "latest_seq": latest_seq, "has_more": False, "reset": False
+        }
+
+    # A gap after `since` is only a reset when it expired; a seq whose insert
+    # failed (or is still running) leaves a gap too
+    reset = since > 0 and events[0]['seq'] > since + 1 and await _expired_through(db, user_id, since)
+
+    has_more = len(events) > limit
+    events = events[:limit]
+    readable = _contiguous(events, events[0]['seq'] if reset else since + 1)
+    if len(readable) < len(events):
+        has_more = False  # Stopped at a pending insert; the next poll picks it up
+        if not readable:
+            return None
+    for event in readable:
+        event['created_at'] = event['created_at'].isoformat()
+    return {
+        "events": readable,
+        "latest_seq": readable[-1]['seq'],
+        "has_more": has_more,
+        "reset": reset
+    }
+
+
+def _contiguous(events: List[dict], expected: int) -> List[dict]:
+    """
+    The leading events without a recent hole: stops before a missing seq
+    when the event after it is younger than GAP_GRACE_SECONDS.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=GAP_GRACE_SECONDS)
+    for i, event in enumerate(events):
+        if event['seq'] != expected and _aware(event['created_at']) > cutoff:
+            return events[:i]
+        expected = event['seq'] + 1
+    return events
+
+
+async def _expired_through(db, user_id: str, since: int) -> bool:
+    """
+    True when no event at or before `since` is retained. Expiry removes the
+    oldest events first, so while one is left nothing after it has expired.
+    """
+    return await db[EVENTS_COLLECTION].find_one(
+        {"user_id": user_id, "seq": {"$lte": since}}, {"_id": 1}
+    ) is None
+
+
+def _reset(latest_seq: int) -> dict:
+    return {"events": [], "latest_seq": latest_seq, "has_more": False, "reset": True}
+
+
+async def ensure_indexes(db):
+    await db[EVENTS_COLLECTION].create_index([("user_id", 1), ("seq", 1)], unique=True)
+    await db[EVENTS_COLLECTION].create_index(
+        "created_at", expireAfterSeconds=EVENT_RETENTION_DAYS * 24 * 3600
+    )
+    await db[COUNTERS_COLLECTION].create_index("user_id", unique=True)
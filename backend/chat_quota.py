@@ -0,0 +1,88 @@
+"""
+Daily new-chat quota.
+
+`chat_quotas` holds one small doc per user and day: {user_id, date, used,
+created_at}, unique on (user_id, date). Taking a chat from the quota is a
+single conditional upsert:
+
+    filter  {user_id, date: today, used: {$lt: limit}}
+    update  {$inc: {used: 1}}
+
+- first chat of the day: no doc matches, the upsert inserts used=1
+- under the limit: the doc matches and is incremented
+- at the limit: the filter misses, the upsert collides with today's doc on
+  the unique index and raises DuplicateKeyError
+- concurrent first chats of the day: both upsert, one insert loses on the
+  unique index with the same DuplicateKeyError
+
+A DuplicateKeyError is therefore retried once: today's doc exists by then,
+so the retry is a plain conditional update and only a miss there means the
+user is at the limit.
+
+So concurrent requests can never take more than `limit` chats, the day
+rolls over by itself (a new date is a new doc) and the user document is
+not rewritten. Old days expire through a TTL index.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+QUOTA_COLLECTION = "chat_quotas"
+
+# Quota docs are only needed for the current day
+QUOTA_RETENTION_DAYS = 2
+
+
+def today_str() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+
+async def consume(db, user_id: str, limit: int) -> Tuple[bool, int]:
+    """
+    Take one chat from today's quota.
+    Returns (allowed, used) - used is today's count after the call.
+    """
+    today = today_str()
+    for _ in range(2):
+        try:
+            doc = await db[QUOTA_COLLECTION].find_one_and_update(
+                {"user_id": user_id, "date": today, "used": {"$lt": limit}},
+                {"$inc": {"used": 1}, "$setOnInsert": {"created_at": datetime.now(timezone.utc)}},
+                upsert=True,
+                projection={"_id": 0, "used": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            return True, doc['used']
+        except DuplicateKeyError:
+            continue  # At the limit, or a concurrent first chat created today's doc; retry as an update
+    # Today's doc exists and is at the limit
+    return False, await get_used(db, user_id)
+
+
+async def release(db, user_id: str):
+    """Give back a chat taken by consume() that ended up not being used."""
+    await db[QUOTA_COLLECTION].update_one(
+        {"user_id": user_id, "date": today_str(), "used": {"$gt": 0}},
+        {"$inc": {"used": -1}}
+    )
+
+
+async def get_used(db, user_id: str) -> int:
+    """Chats taken today."""
+    doc = await db[QUOTA_COLLECTION].find_one(
+        {"user_id": user_id, "date": today_str()},
+        {"_id": 0, "used": 1}
+    )
+    return doc['used'] if doc else 0
+
+
+async def ensure_indexes(db):
+    await db[QUOTA_COLLECTION].create_index([("user_id", 1), ("date", 1)], unique=True)
+    await db[QUOTA_COLLECTION].create_index(
+        "created_at", expireAfterSeconds=QUOTA_RETENTION_DAYS * 24 * 3600
+    )
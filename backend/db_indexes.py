@@ -0,0 +1,249 @@
+"""
+Declarative index spec for the core collections.
+
+INDEX_SPECS lists every index the API relies on. reconcile() creates the
+missing ones (at server startup and from the CLI) and reports indexes whose
+options differ from the spec. HOT_QUERIES lists the query shapes served on
+every request; verify() runs explain() on each and fails if any of them
+falls back to a collection scan.
+
+Indexes of self-contained modules stay with their module
+(match_index.ensure_indexes, catalog_cache.ensure_indexes).
+
+CLI:
+    python db_indexes.py reconcile [--drop-extra]
+    python db_indexes.py verify
+"""
+import asyncio
+import logging
+import sys
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from geo import LOCATION_POINT_FIELD
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSpec(NamedTuple):
+    collection: str
+    keys: List[Tuple[str, Any]]
+    unique: bool = False
+    sparse: bool = False
+    partial: Optional[Dict[str, Any]] = None
+
+    @property
+    def name(self) -> str:
+        """MongoDB's default index name, so existing indexes are recognised."""
+        return "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+    def options(self) -> Dict[str, Any]:
+        options = {"name": self.name}
+        if self.unique:
+            options["unique"] = True
+        if self.sparse:
+            options["sparse"] = True
+        if self.partial:
+            options["partialFilterExpression"] = self.partial
+        return options
+
+
+class HotQuery(NamedTuple):
+    name: str
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[List[Tuple[str, int]]] = None
+
+
+# Placeholder values - explain() only needs the query shape
+_ID = "00000000-0000-0000-0000-000000000000"
+
+INDEX_SPECS: List[IndexSpec] = [
+    # Users
+    IndexSpec("users", [("id", 1)], unique=True),
+    IndexSpec("users", [("email", 1)], unique=True, sparse=True),
+    IndexSpec("users", [(LOCATION_POINT_FIELD, "2dsphere")]),
+    # Albums and membership
+    IndexSpec("albums", [("id", 1)], unique=True),
+    IndexSpec("user_album_activations", [("user_id", 1), ("album_id", 1)], unique=True),
+    IndexSpec("album_members", [("album_id", 1), ("user_id", 1)]),
+    # Inventory (album scoped and legacy group scoped)
+    IndexSpec("user_inventory", [("user_id", 1), ("album_id", 1), ("sticker_id", 1)]),
+    IndexSpec("user_inventory", [("user_id", 1), ("group_id", 1), ("sticker_id", 1)]),
+    # Groups and invites
+    IndexSpec("groups", [("id", 1)], unique=True),
+    IndexSpec("group_members", [("group_id", 1), ("user_id", 1)]),
+    IndexSpec("group_members", [("user_id", 1)]),
+    IndexSpec("email_invites", [("invite_code", 1)], unique=True),
+    IndexSpec("email_invites", [("id", 1)], unique=True),
+    IndexSpec("email_invites", [("invited_email", 1), ("used_at", 1)]),
+    IndexSpec("email_invites", [("group_id", 1), ("invited_email", 1)]),
+    # Exchanges: one index per participant side so both $or branches are indexed
+    IndexSpec("exchanges", [("id", 1)], unique=True),
+    IndexSpec("exchanges", [("user_a_id", 1), ("album_id", 1), ("status", 1)]),
+    IndexSpec("exchanges", [("user_b_id", 1), ("album_id", 1), ("status", 1)]),
+    IndexSpec("exchanges", [("album_id", 1), ("status", 1)]),
+    # At most one pending exchange per album + user pair (see models.exchange_pair_key)
+    IndexSpec("exchanges", [("pair_key", 1)], unique=True, partial={"status": "pending"}),
+    # Expiry sweeper (exchange_expiry.py)
+    IndexSpec("exchanges", [("status", 1), ("expires_at", 1)]),
+    IndexSpec("exchanges", [("expiry_claim", 1)], sparse=True),
+    # Chats
+    IndexSpec("chats", [("id", 1)], unique=True),
+    IndexSpec("chats", [("exchange_id", 1)], unique=True),
+    IndexSpec("chat_messages", [("chat_id", 1), ("created_at", 1), ("id", 1)]),
+    IndexSpec("chat_messages", [("chat_id", 1), ("id", 1)]),
+    IndexSpec("chat_messages", [("chat_id", 1), ("sender_id", 1), ("created_at", 1)]),
+    # Reputation
+    IndexSpec("user_reputation", [("user_id", 1)], unique=True),
+]
+
+HOT_QUERIES: List[HotQuery] = [
+    HotQuery("user by id", "users", {"id": _ID}),
+    HotQuery("user by email", "users", {"email": "verify@example.com"}),
+    HotQuery("album by id", "albums", {"id": _ID}),
+    HotQuery("album activation", "user_album_activations", {"user_id": _ID, "album_id": _ID}),
+    HotQuery("user activations", "user_album_activations", {"user_id": _ID}),
+    HotQuery("album members", "album_members", {"album_id": _ID}),
+    HotQuery("album inventory", "user_inventory", {"user_id": _ID, "album_id": _ID}),
+    HotQuery("group inventory", "user_inventory", {"user_id": _ID, "group_id": _ID}),
+    HotQuery("group membership", "group_members", {"group_id": _ID, "user_id": _ID}),
+    HotQuery("invite by code", "email_invites", {"invite_code": "ABCDEF"}),
+    HotQuery("exchange by id", "exchanges", {"id": _ID}),
+    HotQuery("user exchanges in album", "exchanges", {
+        "album_id": _ID,
+        "$or": [{"user_a_id": _ID}, {"user_b_id": _ID}]
+    }),
+    HotQuery("pending exchange for pair", "exchanges", {
+        "pair_key": f"{_ID}:{_ID}:{_ID}", "status": "pending"
+    }),
+    HotQuery("overdue exchanges", "exchanges", {
+        "status": "pending", "expires_at": {"$lte": "2024-01-01T00:00:00"}
+    }, [("expires_at", 1)]),
+    HotQuery("chat by exchange", "chats", {"exchange_id": _ID}),
+    HotQuery("chat messages", "chat_messages", {"chat_id": _ID}, [("created_at", -1), ("id", -1)]),
+    HotQuery("chat cursor message", "chat_messages", {"chat_id": _ID, "id": _ID}),
+    HotQuery("unread messages", "chat_messages", {
+        "chat_id": _ID, "sender_id": _ID, "created_at": {"$gt": "2024-01-01T00:00:00"}
+    }),
+    HotQuery("reputation by user", "user_reputation", {"user_id": _ID}),
+]
+
+
+def _key_matches(existing_key, spec: IndexSpec) -> bool:
+    # The server may report numeric directions as floats (1.0)
+    def normalize(keys):
+        return [(f, int(d) if isinstance(d, (int, float)) else d) for f, d in keys]
+    return normalize(existing_key) == normalize(spec.keys)
+
+
+async def reconcile(db, drop_extra: bool = False) -> Dict[str, List[str]]:
+    """
+    Create missing indexes from INDEX_SPECS.
+    Indexes with a spec'd name but different keys/options are reported as
+    conflicts and left alone (fix them by hand). With drop_extra, indexes on
+    spec'd collections that are not in the spec are dropped.
+    """
+    summary: Dict[str, List[str]] = {"created": [], "existing": [], "conflicts": [], "failed": [], "dropped": []}
+    by_collection: Dict[str, List[IndexSpec]] = {}
+    for spec in INDEX_SPECS:
+        by_collection.setdefault(spec.collection, []).append(spec)
+
+    for collection, specs in by_collection.items():
+        existing = await db[collection].index_information()
+        for spec in specs:
+            label = f"{collection}.{spec.name}"
+            info = existing.get(spec.name)
+            if info is not None:
+                if (not _key_matches(info['key'], spec)
+                        or bool(info.get('unique')) != spec.unique
+                        or bool(info.get('sparse')) != spec.sparse
+                        or (info.get('partialFilterExpression') or None) != spec.partial):
+                    summary["conflicts"].append(label)
+                    logger.warning(f"[INDEXES] {label} exists with different options: {info}")
+                else:
+                    summary["existing"].append(label)
+                continue
+            try:
+                await db[collection].create_index(spec.keys, **spec.options())
+                summary["created"].append(label)
+                logger.info(f"[INDEXES] Created {label}")
+            except Exception as e:
+                # e.g. duplicate values blocking a unique index
+                summary["failed"].append(label)
+                logger.warning(f"[INDEXES] Could not create {label}: {e}")
+
+        if drop_extra:
+            wanted = {spec.name for spec in specs} | {"_id_"}
+            for name in existing:
+                if name not in wanted:
+                    await db[collection].drop_index(name)
+                    summary["dropped"].append(f"{collection}.{name}")
+                    logger.info(f"[INDEXES] Dropped {collection}.{name}")
+
+    return summary
+
+
+def _plan_stages(plan: Any) -> List[str]:
+    """Every `stage` name in an explain() plan tree."""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+async def verify(db) -> List[Tuple[str, List[str]]]:
+    """
+    Run explain() on every hot query.
+    Returns (query name, winning plan stages) for queries that do a COLLSCAN.
+    """
+    failures = []
+    for query in HOT_QUERIES:
+        cursor = db[query.collection].find(query.filter)
+        if query.sort:
+            cursor = cursor.sort(query.sort)
+        explanation = await cursor.explain()
+        stages = _plan_stages(explanation.get('queryPlanner', {}).get('winningPlan', {}))
+        if 'COLLSCAN' in stages:
+            failures.append((query.name, stages))
+    return failures
+
+
+async def _main(argv: List[str]) -> int:
+    import os
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        command = argv[0] if argv else "reconcile"
+        if command == "reconcile":
+            summary = await reconcile(db, drop_extra="--drop-extra" in argv)
+            for key, labels in summary.items():
+                print(f"{key}: {len(labels)}")
+                for label in labels:
+                    print(f"  {label}")
+            return 1 if summary["conflicts"] or summary["failed"] else 0
+        if command == "verify":
+            failures = await verify(db)
+            for name, stages in failures:
+                print(f"COLLSCAN: {name} ({' -> '.join(stages)})")
+            print(f"{len(HOT_QUERIES) - len(failures)}/{len(HOT_QUERIES)} hot queries use an index")
+            return 1 if failures else 0
+        print(__doc__)
+        return 2
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -0,0 +1,147 @@
+"""
+Non-blocking email delivery.
+
+Provider SDKs (Resend) make blocking HTTP calls. Handlers hand messages to
+the EmailDispatcher instead: messages wait in a bounded queue, a fixed set
+of workers sends them on a bounded thread pool (the event loop never waits
+on the provider) and failed sends are retried with exponential backoff.
+
+- `await dispatcher.send(message)` -> DeliveryResult once delivered or given up
+- `dispatcher.submit(message)` -> fire and forget (result is only logged)
+
+When several messages are queued and the provider supports it
+(`send_batch`), a worker sends up to `batch_size` of them in one call.
+
+Providers live in email_service.py (Resend, console fallback, fake for tests).
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF_SECONDS = 0.5
+DEFAULT_BATCH_SIZE = 50
+
+
+class DeliveryResult(NamedTuple):
+    # 'sent', 'fallback' (console provider), 'quota_exceeded', 'failed', 'dropped' (queue full)
+    status: str
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+class PermanentEmailError(Exception):
+    """Provider error that retrying cannot fix (e.g. daily quota reached)."""
+
+    def __init__(self, status: str, message: str = ""):
+        super().__init__(message or status)
+        self.status = status
+
+
+class EmailDispatcher:
+    """Bounded queue + worker pool in front of a blocking email provider."""
+
+    def __init__(self, provider, workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        self.provider = provider
+        self._workers = workers
+        self._queue_size = queue_size
+        self._max_attempts = max_attempts
+        self._backoff_seconds = backoff_seconds
+        self._batch_size = batch_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="email")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self._workers)]
+
+    async def stop(self):
+        """Finish queued messages, then stop the workers."""
+        if not self.running:
+            return
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=False)
+
+    def submit(self, message) -> "asyncio.Future[DeliveryResult]":
+        """Queue a message without waiting. The future resolves with its DeliveryResult."""
+        future = asyncio.get_running_loop().create_future()
+        if not self.running:
+            future.set_result(DeliveryResult("failed", error="dispatcher not running"))
+            return future
+        try:
+            self._queue.put_nowait((message, future))
+        except asyncio.QueueFull:
+            logger.warning(f"[EMAIL] Queue full, dropping {message.kind} email to {message.to}")
+            future.set_result(DeliveryResult("dropped"))
+        return future
+
+    async def send(self, message) -> DeliveryResult:
+        """Queue a message and wait for its delivery status (without blocking the loop)."""
+        return await asyncio.shield(self.submit(message))
+
+    async def _worker(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self._batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                for (message, future), result in zip(batch, await self._deliver(batch)):
+                    if result.status not in ('sent', 'fallback'):
+                        logger.warning(f"[EMAIL] {message.kind} email to {message.to}: {result.status} "
+                                       f"after {result.attempts} attempts ({result.error})")
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                logger.error(f"[EMAIL] Worker error: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(DeliveryResult("failed", error=str(e)))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _deliver(self, batch: List[Tuple]) -> List[DeliveryResult]:
+        loop = asyncio.get_running_loop()
+        send_batch = getattr(self.provider, "send_batch", None)
+        if len(batch) > 1 and send_batch is not None:
+            messages = [message for message, _ in batch]
+            try:
+                statuses = await loop.run_in_executor(self._executor, send_batch, messages)
+                return [DeliveryResult(status, attempts=1) for status in statuses]
+            except Exception as e:
+                logger.warning(f"[EMAIL] Batch of {len(batch)} failed, sending one by one: {e}")
+        return list(await asyncio.gather(*(self._deliver_one(message) for message, _ in batch)))
+
+    async def _deliver_one(self, message) -> DeliveryResult:
+        loop = asyncio.get_running_loop()
+        error = None
+        for attempt in range(1, self._max_attempts + 1):
+            try:
+                status = await loop.run_in_executor(self._executor, self.provider.send, message)
+                return DeliveryResult(status, attempts=attempt)
+            except PermanentEmailError as e:
+                return DeliveryResult(e.status, attempts=attempt, error=str(e))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if attempt < self._max_attempts:
+                    await asyncio.sleep(self._backoff_seconds * 2 ** (attempt - 1))
+        return DeliveryResult("failed", attempts=self._max_attempts, error=error)
@@ -1,9 +1,18 @@
-"""Email service using Resend with fallback to console logging."""
+"""
+Email service using Resend with fallback to console logging.
+
+Emails are built here as EmailMessage values and delivered through the
+EmailDispatcher (email_dispatcher.py), which calls one of the providers
+below from its worker pool so Resend's blocking HTTP calls never run on
+the event loop.
+"""
 import os
 import logging
 import random
 import hashlib
-from typing import Optional
+from typing import Dict, List, NamedTuple, Optional
+
+from email_dispatcher import EmailDispatcher, PermanentEmailError
 
 logger = logging.getLogger(__name__)
 
@@ -63,7 +72,175 @@ def verify_otp_hash(otp: str, hashed: str) -> bool:
     """Verify OTP against stored hash."""
     return hash_otp(otp) == hashed
 
-def send_otp_email(email: str, otp: str) -> tuple[bool, str]:
+class EmailMessage(NamedTuple):
+    kind: str  # Log tag: 'OTP', 'INVITE', 'TERMS'
+    to: str
+    subject: str
+    html: str
+    # Logged when the email cannot be delivered, so codes stay usable in dev/testing
+    fallback_log: Dict[str, str] = {}
+
+
+def _resend_params(message: EmailMessage) -> dict:
+    return {
+        "from": get_sender_address(),
+        "to": [message.to],
+        "subject": message.subject,
+        "html": message.html
+    }
+
+
+def _raise_provider_error(message: EmailMessage, e: Exception):
+    error_msg = str(e)
+    logger.error(f"[{message.kind}] Resend API error: {type(e).__name__}: {e}")
+    if hasattr(e, 'status_code'):
+        logger.error(f"[{message.kind}] Status code: {getattr(e, 'status_code', 'N/A')}")
+    # Quota exceeded: retrying today will not help
+    if 'quota' in error_msg.lower() or 'limit' in error_msg.lower():
+        logger.error(f"[{message.kind}] QUOTA EXCEEDED - Daily sending limit reached")
+        raise PermanentEmailError('quota_exceeded', error_msg) from e
+    raise e
+
+
+class ResendProvider:
+    """Sends through the Resend API (blocking - only called from the dispatcher's pool)."""
+
+    def send(self, message: EmailMessage) -> str:
+        resend.api_key = os.environ.get('RESEND_API_KEY', '').strip()
+        logger.info(f"[{message.kind}] Calling Resend API: to={message.to}, from={get_sender_address()}")
+        try:
+            response = Emails().send(_resend_params(message))
+        except Exception as e:
+            _raise_provider_error(message, e)
+        logger.info(f"[{message.kind}] Email successfully sent to {message.to}: {response}")
+        return 'sent'
+
+    def send_batch(self, messages: List[EmailMessage]) -> List[str]:
+        batch = getattr(resend, 'Batch', None)
+        if batch is None:
+            return [self.send(message) for message in messages]
+        resend.api_key = os.environ.get('RESEND_API_KEY', '').strip()
+        response = batch.send([_resend_params(message) for message in messages])
+        logger.info(f"[EMAIL] Batch of {len(messages)} sent via Resend: {response}")
+        return ['sent'] * len(messages)
+
+
+class ConsoleProvider:
+    """Used when Resend is not configured: nothing is sent, callers log the fallback."""
+
+    def send(self, message: EmailMessage) -> str:
+        logger.info(f"[{message.kind}] Resend not configured (API key missing or package unavailable)")
+        return 'fallback'
+
+
+class FakeEmailProvider:
+    """In-memory provider for tests: records messages, can fail a number of sends first."""
+
+    def __init__(self, fail_times: int = 0, quota_exceeded: bool = False):
+        self.sent: List[EmailMessage] = []
+        self.batches: List[List[EmailMessage]] = []
+        self.fail_times = fail_times
+        self.quota_exceeded = quota_exceeded
+        self.calls = 0
+
+    def send(self, message: EmailMessage) -> str:
+        self.calls += 1
+        if self.quota_exceeded:
+            raise PermanentEmailError('quota_exceeded')
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise ConnectionError("provider unavailable")
+        self.sent.append(message)
+        return 'sent'
+
+    def send_batch(self, messages: List[EmailMessage]) -> List[str]:
+        self.batches.append(list(messages))
+        return [self.send(message) for message in messages]
+
+
+def get_email_provider():
+    """Resend when configured, console fallback otherwise."""
+    return ResendProvider() if get_resend_configured() else ConsoleProvider()
+
+
+def _log_fallback(message: EmailMessage):
+    # Fallback: Log to console only (NEVER return to frontend)
+    logger.warning("="*50)
+    logger.warning(f"[{message.kind}] EMAIL FALLBACK (Resend not configured or failed)")
+    logger.warning(f"[{message.kind}] To: {message.to}")
+    for label, value in message.fallback_log.items():
+        logger.warning(f"[{message.kind}] {label}: {value}")
+    logger.warning("="*50)
+
+
+def build_otp_email(email: str, otp: str) -> EmailMessage:
+    return EmailMessage(
+        kind='OTP',
+        to=email,
+        subject="Tu código de verificación - MisFigus",
+        html=f"""
+                <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+                    <h1 style="color: #333;">Código de verificación</h1>
+                    <p>Tu código para iniciar sesión en MisFigus es:</p>
+                    <div style="background: #f5f5f5; padding: 20px; text-align: center; font-size: 32px; font-weight: bold; letter-spacing: 8px; margin: 20px 0;">
+                        {otp}
+                    </div>
+                    <p style="color: #666;">Este código expira en 10 minutos.</p>
+                    <p style="color: #999; font-size: 12px;">Si no solicitaste este código, puedes ignorar este mensaje.</p>
+                </div>
+                """,
+        fallback_log={"OTP": otp}
+    )
+
+
+def build_invite_email(email: str, invite_code: str, group_name: str, inviter_name: str) -> EmailMessage:
+    return EmailMessage(
+        kind='INVITE',
+        to=email,
+        subject=f"{inviter_name} te invitó a {group_name} - MisFigus",
+        html=f"""
+                <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+                    <h1 style="color: #333;">¡Te invitaron a un grupo!</h1>
+                    <p><strong>{inviter_name}</strong> te invitó a unirte al grupo <strong>{group_name}</strong> en MisFigus.</p>
+                    <p>Usa este código para unirte:</p>
+                    <div style="background: #f5f5f5; padding: 20px; text-align: center; font-size: 32px; font-weight: bold; letter-spacing: 8px; margin: 20px 0;">
+                        {invite_code}
+                    </div>
+                    <p style="color: #666;">Este código expira en 1 hora y solo puede usarse una vez.</p>
+                    <p style="color: #999; font-size: 12px;">Si no esperabas esta invitación, puedes ignorar este mensaje.</p>
+                </div>
+                """,
+        fallback_log={"Invite Code": invite_code, "Group": group_name, "Invited by": inviter_name}
+    )
+
+
+def build_terms_acceptance_email(email: str, version: str, acceptance_time) -> EmailMessage:
+    # Format acceptance time
+    if hasattr(acceptance_time, 'strftime'):
+        formatted_time = acceptance_time.strftime("%d/%m/%Y %H:%M UTC")
+    else:
+        formatted_time = str(acceptance_time)
+    
+    return EmailMessage(
+        kind='TERMS',
+        to=email,
+        subject="Aceptaste los Términos y Condiciones - MisFigus",
+        html=f"""
+                <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+                    <h1 style="color: #333;">Términos y Condiciones Aceptados</h1>
+                    <p>Has aceptado los Términos y Condiciones de MisFigus.</p>
+                    <div style="background: #f5f5f5; padding: 20px; margin: 20px 0; border-radius: 8px;">
+                        <p><strong>Versión:</strong> {version}</p>
+                        <p><strong>Fecha de aceptación:</strong> {formatted_time}</p>
+                    </div>
+                    <p>Podés ver los términos completos en cualquier momento desde tu perfil en la aplicación.</p>
+                    <p style="color: #999; font-size: 12px;">Este es un correo de confirmación automático.</p>
+                </div>
+                """
+    )
+
+
+async def send_otp_email(dispatcher: EmailDispatcher, email: str, otp: str) -> tuple[bool, str]:
     """
     Send OTP via email using Resend.
     Falls back to console logging if Resend is not configured.
@@ -74,9 +251,7 @@ def send_otp_email(email: str, otp: str) -> tuple[bool, str]:
     
     IMPORTANT: OTP is NEVER returned to the caller or shown in UI.
     """
-    sender = get_sender_address()
     logger.info(f"[OTP] Attempting to send OTP email to: {email}")
-    logger.info(f"[OTP] From: {sender}")
     
     # In DEV_MODE, always log OTP to console for testing
     dev_mode = os.environ.get('DEV_MODE', 'false').lower() == 'true'
@@ -89,65 +264,19 @@ def send_otp_email(email: str, otp: str) -> tuple[bool, str]:
         logger.warning(f"[OTP] OTP: {otp}")
         logger.warning("="*50)
     
-    if get_resend_configured():
-        logger.info(f"[OTP] Resend configured, attempting to send...")
-        try:
-            # Set API key
-            resend.api_key = os.environ.get('RESEND_API_KEY', '').strip()
-            
-            # Build email params using verified domain sender from env
-            params: resend.Emails.SendParams = {
-                "from": sender,
-                "to": [email],
-                "subject": "Tu código de verificación - MisFigus",
-                "html": f"""
-                <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                    <h1 style="color: #333;">Código de verificación</h1>
-                    <p>Tu código para iniciar sesión en MisFigus es:</p>
-                    <div style="background: #f5f5f5; padding: 20px; text-align: center; font-size: 32px; font-weight: bold; letter-spacing: 8px; margin: 20px 0;">
-                        {otp}
-                    </div>
-                    <p style="color: #666;">Este código expira en 10 minutos.</p>
-                    <p style="color: #999; font-size: 12px;">Si no solicitaste este código, puedes ignorar este mensaje.</p>
-                </div>
-                """
-            }
-            
-            logger.info(f"[OTP] Calling Resend API with params: to={email}, from={sender}")
-            emails = Emails()
-            response = emails.send(params)
-            logger.info(f"[OTP] Resend API response: {response}")
-            logger.info(f"[OTP] Email successfully sent to {email}")
-            return True, 'sent'
-            
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"[OTP] Resend API error: {type(e).__name__}: {e}")
-            
-            # Check for quota exceeded error
-            if 'quota' in error_msg.lower() or 'limit' in error_msg.lower():
-                logger.error(f"[OTP] QUOTA EXCEEDED - Daily sending limit reached")
-                # In dev mode, still allow login via console OTP
-                if dev_mode or dev_otp_mode:
-                    logger.warning(f"[OTP] DEV MODE active - OTP logged to console, login can proceed")
-                    return True, 'dev_mode'
-                return False, 'quota_exceeded'
-            
-            # Log more details if available
-            if hasattr(e, 'message'):
-                logger.error(f"[OTP] Error message: {getattr(e, 'message', 'N/A')}")
-            if hasattr(e, 'status_code'):
-                logger.error(f"[OTP] Status code: {getattr(e, 'status_code', 'N/A')}")
-            logger.warning(f"[OTP] Falling back to console logging due to error")
-    else:
-        logger.info(f"[OTP] Resend not configured (API key missing or package unavailable)")
+    message = build_otp_email(email, otp)
+    result = await dispatcher.send(message)
+    if result.status == 'sent':
+        return True, 'sent'
     
-    # Fallback: Log to console only (NEVER return to frontend)
-    logger.warning("="*50)
-    logger.warning(f"[OTP] EMAIL FALLBACK (Resend not configured or failed)")
-    logger.warning(f"[OTP] To: {email}")
-    logger.warning(f"[OTP] OTP: {otp}")
-    logger.warning("="*50)
+    if result.status == 'quota_exceeded':
+        # In dev mode, still allow login via console OTP
+        if dev_mode or dev_otp_mode:
+            logger.warning(f"[OTP] DEV MODE active - OTP logged to console, login can proceed")
+            return True, 'dev_mode'
+        return False, 'quota_exceeded'
+    
+    _log_fallback(message)
     
     # In dev mode, fallback is OK
     if dev_mode or dev_otp_mode:
@@ -155,113 +284,30 @@ def send_otp_email(email: str, otp: str) -> tuple[bool, str]:
     
     return True, 'fallback'
 
-def send_invite_email(email: str, invite_code: str, group_name: str, inviter_name: str) -> bool:
+
+async def send_invite_email(dispatcher: EmailDispatcher, email: str, invite_code: str,
+                            group_name: str, inviter_name: str) -> bool:
     """
     Send invite code via email using Resend.
     Falls back to console logging if Resend is not configured.
+    Returns True if the email was delivered.
     
     IMPORTANT: Invite code is NEVER returned to the caller or shown in UI.
     """
-    sender = get_sender_address()
     logger.info(f"[INVITE] Attempting to send invite email to: {email}")
-    logger.info(f"[INVITE] From: {sender}")
-    
-    if get_resend_configured():
-        logger.info(f"[INVITE] Resend configured, attempting to send...")
-        try:
-            # Set API key
-            resend.api_key = os.environ.get('RESEND_API_KEY', '').strip()
-            
-            # Build email params using verified domain sender from env
-            params: resend.Emails.SendParams = {
-                "from": sender,
-                "to": [email],
-                "subject": f"{inviter_name} te invitó a {group_name} - MisFigus",
-                "html": f"""
-                <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                    <h1 style="color: #333;">¡Te invitaron a un grupo!</h1>
-                    <p><strong>{inviter_name}</strong> te invitó a unirte al grupo <strong>{group_name}</strong> en MisFigus.</p>
-                    <p>Usa este código para unirte:</p>
-                    <div style="background: #f5f5f5; padding: 20px; text-align: center; font-size: 32px; font-weight: bold; letter-spacing: 8px; margin: 20px 0;">
-                        {invite_code}
-                    </div>
-                    <p style="color: #666;">Este código expira en 1 hora y solo puede usarse una vez.</p>
-                    <p style="color: #999; font-size: 12px;">Si no esperabas esta invitación, puedes ignorar este mensaje.</p>
-                </div>
-                """
-            }
-            
-            logger.info(f"[INVITE] Calling Resend API with params: to={email}, from={sender}")
-            emails = Emails()
-            response = emails.send(params)
-            logger.info(f"[INVITE] Resend API response: {response}")
-            logger.info(f"[INVITE] Email successfully sent to {email} for group {group_name}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"[INVITE] Resend API error: {type(e).__name__}: {e}")
-            if hasattr(e, 'message'):
-                logger.error(f"[INVITE] Error message: {getattr(e, 'message', 'N/A')}")
-            if hasattr(e, 'status_code'):
-                logger.error(f"[INVITE] Status code: {getattr(e, 'status_code', 'N/A')}")
-            logger.warning(f"[INVITE] Falling back to console logging due to error")
-    else:
-        logger.info(f"[INVITE] Resend not configured (API key missing or package unavailable)")
-    
-    # Fallback: Log to console only (NEVER return to frontend)
-    logger.warning("="*50)
-    logger.warning(f"[INVITE] EMAIL FALLBACK (Resend not configured or failed)")
-    logger.warning(f"[INVITE] To: {email}")
-    logger.warning(f"[INVITE] Invite Code: {invite_code}")
-    logger.warning(f"[INVITE] Group: {group_name}")
-    logger.warning(f"[INVITE] Invited by: {inviter_name}")
-    logger.warning("="*50)
-    return True
+    message = build_invite_email(email, invite_code, group_name, inviter_name)
+    result = await dispatcher.send(message)
+    if result.status == 'sent':
+        logger.info(f"[INVITE] Email sent to {email} for group {group_name}")
+        return True
+    _log_fallback(message)
+    return False
+
 
-def send_terms_acceptance_email(email: str, version: str, acceptance_time) -> bool:
+def send_terms_acceptance_email(dispatcher: EmailDispatcher, email: str, version: str, acceptance_time):
     """
-    Send a confirmation email after user accepts terms and conditions.
-    Non-blocking - failure doesn't affect the terms acceptance.
+    Queue a confirmation email after user accepts terms and conditions.
+    Non-blocking - returns immediately, failure doesn't affect the terms acceptance.
     """
-    sender = get_sender_address()
-    logger.info(f"[TERMS] Attempting to send terms acceptance email to: {email}")
-    
-    # Format acceptance time
-    if hasattr(acceptance_time, 'strftime'):
-        formatted_time = acceptance_time.strftime("%d/%m/%Y %H:%M UTC")
-    else:
-        formatted_time = str(acceptance_time)
-    
-    if get_resend_configured():
-        try:
-            resend.api_key = os.environ.get('RESEND_API_KEY', '').strip()
-            
-            params: resend.Emails.SendParams = {
-                "from": sender,
-                "to": [email],
-                "subject": "Aceptaste los Términos y Condiciones - MisFigus",
-                "html": f"""
-                <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                    <h1 style="color: #333;">Términos y Condiciones Aceptados</h1>
-                    <p>Has aceptado los Términos y Condiciones de MisFigus.</p>
-                    <div style="background: #f5f5f5; padding: 20px; margin: 20px 0; border-radius: 8px;">
-                        <p><strong>Versión:</strong> {version}</p>
-                        <p><strong>Fecha de aceptación:</strong> {formatted_time}</p>
-                    </div>
-                    <p>Podés ver los términos completos en cualquier momento desde tu perfil en la aplicación.</p>
-                    <p style="color: #999; font-size: 12px;">Este es un correo de confirmación automático.</p>
-                </div>
-                """
-            }
-            
-            emails = Emails()
-            response = emails.send(params)
-            logger.info(f"[TERMS] Email sent successfully: {response}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"[TERMS] Failed to send email: {e}")
-            return False
-    else:
-        logger.info(f"[TERMS] Resend not configured, skipping email")
-        return False
+    logger.info(f"[TERMS] Queueing terms acceptance email to: {email}")
+    return dispatcher.submit(build_terms_acceptance_email(email, version, acceptance_time))
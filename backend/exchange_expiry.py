@@ -0,0 +1,131 @@
+"""
+Background expiry of overdue pending exchanges.
+
+Exchanges get `expires_at` = created_at + EXCHANGE_EXPIRY_DAYS. The sweeper
+periodically moves pending exchanges past that date to status "expired",
+closes their chats and adds a SYSTEM_EXCHANGE_EXPIRED message.
+
+Multi-worker safety: every sweep claims a batch with one update_many that
+only matches exchanges still pending and stamps them with a unique claim
+token. Each exchange can flip from pending only once, so a worker only
+post-processes the exchanges carrying its own token.
+
+The (status, expires_at) and expiry_claim indexes are declared in
+db_indexes.INDEX_SPECS.
+
+CLI (one sweep, e.g. from cron):
+    python exchange_expiry.py
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional
+from uuid import uuid4
+
+logger = logging.getLogger(__name__)
+
+SWEEP_INTERVAL_SECONDS = 300
+SWEEP_BATCH_SIZE = 500
+
+EXPIRED_SYSTEM_MESSAGE = "SYSTEM_EXCHANGE_EXPIRED"
+
+OnExpired = Callable[[List[dict]], Awaitable[None]]
+
+
+async def expire_batch(db, now: Optional[datetime] = None, batch_size: int = SWEEP_BATCH_SIZE) -> List[dict]:
+    """Expire up to batch_size overdue exchanges. Returns the exchanges this call claimed."""
+    now = now or datetime.now(timezone.utc)
+    now_iso = now.isoformat()
+
+    # Indexed by (status, expires_at)
+    candidates = await db.exchanges.find(
+        {"status": "pending", "expires_at": {"$lte": now_iso}},
+        {"_id": 0, "id": 1}
+    ).sort("expires_at", 1).to_list(batch_size)
+    if not candidates:
+        return []
+
+    claim_token = str(uuid4())
+    await db.exchanges.update_many(
+        {"id": {"$in": [c['id'] for c in candidates]}, "status": "pending"},
+        {"$set": {"status": "expired", "completed_at": now_iso, "expiry_claim": claim_token}}
+    )
+    expired = await db.exchanges.find({"expiry_claim": claim_token}, {"_id": 0}).to_list(None)
+    if not expired:
+        return []  # Another worker claimed this batch
+
+    by_id = {e['id']: e for e in expired}
+    chats = await db.chats.find(
+        {"exchange_id": {"$in": list(by_id)}},
+        {"_id": 0, "id": 1, "exchange_id": 1}
+    ).to_list(None)
+    if chats:
+        await db.chat_messages.insert_many([
+            {
+                "id": str(uuid4()),
+                "chat_id": chat['id'],
+                "sender_id": "system",
+                "content": EXPIRED_SYSTEM_MESSAGE,  # i18n key, frontend will translate
+                "is_system": True,
+                "created_at": now_iso
+            }
+            for chat in chats
+        ])
+        # Chat is closed; the expiry notice is unread for both participants
+        await db.chats.update_many(
+            {"id": {"$in": [chat['id'] for chat in chats]}},
+            {"$set": {"closed_at": now_iso}, "$inc": {"user_a_unread": 1, "user_b_unread": 1}}
+        )
+
+    logger.info(f"[EXPIRY] Expired {len(expired)} exchanges")
+    return expired
+
+
+async def sweep(db, on_expired: Optional[OnExpired] = None, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """Expire every overdue exchange, batch by batch. Returns how many this worker expired."""
+    total = 0
+    while True:
+        expired = await expire_batch(db, batch_size=batch_size)
+        if not expired:
+            return total
+        total += len(expired)
+        if on_expired is not None:
+            try:
+                await on_expired(expired)
+            except Exception as e:
+                logger.warning(f"[EXPIRY] on_expired callback failed: {e}")
+        if len(expired) < batch_size:
+            return total
+
+
+async def run_forever(db, on_expired: Optional[OnExpired] = None, interval: int = SWEEP_INTERVAL_SECONDS):
+    """Background loop started with the server; errors never stop it."""
+    while True:
+        try:
+            await sweep(db, on_expired)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[EXPIRY] Sweep failed: {e}")
+        await asyncio.sleep(interval)
+
+
+async def _main():
+    import os
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        expired = await sweep(db)
+        print(f"✅ Expired {expired} exchanges")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
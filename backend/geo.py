@@ -0,0 +1,154 @@
+"""
+Geo helpers for proximity-based matching.
+
+Users keep their approximate locality center in `latitude`/`longitude`
+(legacy: `location_lat`/`location_lng`). For database-side radius filtering
+the same coordinates are mirrored into `location_point`, a GeoJSON Point
+backed by a 2dsphere index.
+
+When candidates have to be filtered in-process, filter_within_radius()
+computes every great-circle distance in one vectorized NumPy call.
+"""
+import logging
+from math import radians, cos, sin, asin, sqrt
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    logger.warning("NumPy not installed. Distance filtering will use the scalar path.")
+
+# Earth's radius in kilometers
+EARTH_RADIUS_KM = 6371
+
+# Below this many candidates the scalar loop is as fast as building arrays
+VECTORIZE_MIN_CANDIDATES = 32
+
+# Field holding the GeoJSON point on user documents
+LOCATION_POINT_FIELD = "location_point"
+
+
+def haversine_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """
+    Calculate the great-circle distance between two points in kilometers.
+    Used for proximity-based exchange matching.
+    """
+    # Convert to radians
+    lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
+    
+    # Haversine formula
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlng/2)**2
+    c = 2 * asin(sqrt(a))
+    
+    return c * EARTH_RADIUS_KM
+
+
+def haversine_distances(lat: float, lng: float, lats, lngs):
+    """
+    Vectorized haversine: distances in km from one point to arrays of points.
+    Same formula as haversine_distance, evaluated in a single NumPy call.
+    """
+    lat1 = np.radians(lat)
+    lng1 = np.radians(lng)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lng2 = np.radians(np.asarray(lngs, dtype=np.float64))
+    
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    # Clip guards against rounding pushing `a` a hair above 1 for antipodal points
+    return 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))) * EARTH_RADIUS_KM
+
+
+def get_user_coordinates(user: dict) -> Optional[Tuple[float, float]]:
+    """
+    Return (lat, lng) for a user, preferring the structured fields and
+    falling back to legacy location_lat/location_lng. None if not set.
+    """
+    lat = user.get('latitude') or user.get('location_lat')
+    lng = user.get('longitude') or user.get('location_lng')
+    if lat is None or lng is None:
+        return None
+    return lat, lng
+
+
+def build_location_point(lat: float, lng: float) -> Optional[dict]:
+    """
+    Build a GeoJSON Point (note: GeoJSON order is [lng, lat]).
+    Returns None for coordinates a 2dsphere index would reject.
+    """
+    try:
+        lat = float(lat)
+        lng = float(lng)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+def within_radius_query(user: dict, radius_km: float) -> Optional[dict]:
+    """
+    MongoDB filter matching users within radius_km of `user`.
+    Users without a location point still match (backward compatibility,
+    same rule as is_within_radius). Returns None if `user` has no location,
+    in which case everyone matches and no filter is needed.
+    """
+    coords = get_user_coordinates(user)
+    if coords is None:
+        return None
+    point = build_location_point(*coords)
+    if point is None:
+        return None
+    return {"$or": [
+        {LOCATION_POINT_FIELD: {"$geoWithin": {
+            "$centerSphere": [point["coordinates"], radius_km / EARTH_RADIUS_KM]
+        }}},
+        {LOCATION_POINT_FIELD: None},  # null or missing
+    ]}
+
+
+def candidate_distances(user: dict, candidates: List[dict]) -> List[Optional[float]]:
+    """
+    Distance in km from `user` to each candidate, in order.
+    None when either side has no location (legacy coordinate fallback applies).
+    """
+    distances: List[Optional[float]] = [None] * len(candidates)
+    origin = get_user_coordinates(user)
+    if origin is None:
+        return distances
+    
+    located_idx = []
+    lats = []
+    lngs = []
+    for i, candidate in enumerate(candidates):
+        coords = get_user_coordinates(candidate)
+        if coords is None:
+            continue
+        located_idx.append(i)
+        lats.append(coords[0])
+        lngs.append(coords[1])
+    
+    if not located_idx:
+        return distances
+    if NUMPY_AVAILABLE and len(located_idx) >= VECTORIZE_MIN_CANDIDATES:
+        computed = haversine_distances(origin[0], origin[1], lats, lngs).tolist()
+    else:
+        computed = [haversine_distance(origin[0], origin[1], lat, lng) for lat, lng in zip(lats, lngs)]
+    for i, distance in zip(located_idx, computed):
+        distances[i] = distance
+    return distances
+
+
+def filter_within_radius(user: dict, candidates: List[dict], radius_km: float) -> List[dict]:
+    """
+    Keep the candidates within radius_km of `user`, preserving order.
+    Same semantics as is_within_radius in server.py: legacy coordinate
+    fallback, and users without a location always match.
+    """
+    distances = candidate_distances(user, candidates)
+    return [c for c, d in zip(candidates, distances) if d is None or d <= radius_km]
@@ -6,6 +6,8 @@ from pathlib import Path
 import json
 import uuid
 
+from catalog_cache import bump_catalog_version
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -147,6 +149,9 @@ async def init_albums():
         
         print(f"Created 200 placeholder stickers for {album_name}")
     
+    # Running servers cache catalogs in memory - make them reload every album
+    await bump_catalog_version(db)
+    
     client.close()
     print("\n✅ Album initialization complete!")
     print("Note: No test users are created. Real users will register via OTP.")
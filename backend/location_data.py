@@ -2,6 +2,7 @@
 Global Location Data for MisFigus
 Covers 120+ countries where Panini operates with structured location hierarchy.
 """
+from place_index import PlaceIndex
 
 # ISO-3166 Countries with localized names
 COUNTRIES = {
@@ -538,19 +539,9 @@ def get_cities_for_country(country_code: str) -> list:
     """Get list of cities for a country"""
     return CITIES.get(country_code.upper(), [])
 
-def search_places(query: str, country_code: str = None, limit: int = 10) -> list:
-    """
-    Search for places matching query.
-    Returns list of PlaceSearchResult-compatible dicts.
-    """
-    query_lower = query.lower().strip()
-    results = []
-    
-    # Determine which countries to search
-    countries_to_search = [country_code.upper()] if country_code else list(CITIES.keys())
-    
-    for cc in countries_to_search:
-        cities = CITIES.get(cc, [])
+def _iter_places():
+    """Every city as a PlaceSearchResult-compatible dict."""
+    for cc, cities in CITIES.items():
         regions = {r['code']: r['name'] for r in REGIONS.get(cc, [])}
         country_name = get_country_name(cc, 'es')
         
@@ -559,22 +550,24 @@ def search_places(query: str, country_code: str = None, limit: int = 10) -> list
             region_code = city_data['region']
             region_name = regions.get(region_code, region_code)
             
-            # Match against city name, region name
-            if (query_lower in city_name.lower() or 
-                query_lower in region_name.lower()):
-                
-                label = f"{city_name}, {region_name}, {country_name}"
-                results.append({
-                    "place_id": city_data['place_id'],
-                    "label": label,
-                    "city_name": city_name,
-                    "region_name": region_name,
-                    "country_code": cc,
-                    "latitude": city_data['lat'],
-                    "longitude": city_data['lng']
-                })
-                
-                if len(results) >= limit:
-                    return results
-    
-    return results
+            yield {
+                "place_id": city_data['place_id'],
+                "label": f"{city_name}, {region_name}, {country_name}",
+                "city_name": city_name,
+                "region_name": region_name,
+                "country_code": cc,
+                "latitude": city_data['lat'],
+                "longitude": city_data['lng']
+            }
+
+# Built once at import (see place_index.py)
+PLACE_INDEX = PlaceIndex(_iter_places())
+
+def search_places(query: str, country_code: str = None, limit: int = 10) -> list:
+    """
+    Search for places matching query (accent-insensitive, typo-tolerant).
+    Best matches first: city name prefix, then word prefix, then substring,
+    then fuzzy matches.
+    Returns list of PlaceSearchResult-compatible dicts.
+    """
+    return PLACE_INDEX.search(query, country_code, limit)
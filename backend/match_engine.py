@@ -0,0 +1,110 @@
+"""
+Bitset-backed mutual-match engine for album exchanges.
+
+Each album's sticker ids are mapped to dense integer positions, so a user's
+duplicates and missing stickers become plain Python ints used as bitmaps.
+"Can I give / can I get" is then a single AND plus a popcount instead of
+list scans over the whole catalog.
+"""
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+
+class InventoryBits(NamedTuple):
+    """A user's inventory for one album, encoded as bitmaps."""
+    duplicates: int  # owned_qty >= 2 (can give)
+    missing: int     # owned_qty == 0 (needs)
+
+
+class MatchResult(NamedTuple):
+    """Outcome of comparing two users' inventories."""
+    give_bits: int  # stickers I can give them (my duplicates & their missing)
+    get_bits: int   # stickers they can give me (their duplicates & my missing)
+    give_count: int
+    get_count: int
+
+    @property
+    def is_mutual(self) -> bool:
+        """True only when the exchange works in BOTH directions."""
+        return self.give_count > 0 and self.get_count > 0
+
+
+class AlbumStickerIndex:
+    """
+    Dense position map for one album's sticker catalog.
+    Positions follow the order of the given sticker ids, so decoded lists
+    keep the same order the catalog was loaded in.
+    """
+
+    def __init__(self, sticker_ids: Iterable[str]):
+        self.sticker_ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        for sid in sticker_ids:
+            if sid in self.positions:
+                continue
+            self.positions[sid] = len(self.sticker_ids)
+            self.sticker_ids.append(sid)
+        self.full_mask = (1 << len(self.sticker_ids)) - 1
+
+    def __len__(self) -> int:
+        return len(self.sticker_ids)
+
+    def bit(self, sticker_id: str) -> int:
+        """Single-bit mask for a sticker (0 if not in this album)."""
+        pos = self.positions.get(sticker_id)
+        return 0 if pos is None else 1 << pos
+
+    def encode(self, inv_map: Dict[str, int]) -> InventoryBits:
+        """
+        Build duplicate/missing bitmaps from a {sticker_id: owned_qty} map.
+        Sticker ids that are not part of this album are ignored.
+        """
+        owned = 0
+        duplicates = 0
+        positions = self.positions
+        for sid, qty in inv_map.items():
+            pos = positions.get(sid)
+            if pos is None or not qty or qty < 1:
+                continue
+            owned |= 1 << pos
+            if qty >= 2:
+                duplicates |= 1 << pos
+        return InventoryBits(duplicates=duplicates, missing=self.full_mask & ~owned)
+
+    def encode_items(self, inventory: Iterable[dict]) -> InventoryBits:
+        """Same as encode(), from raw user_inventory documents."""
+        return self.encode({item['sticker_id']: item.get('owned_qty', 0) for item in inventory})
+
+    def decode(self, bits: int) -> List[str]:
+        """Return the sticker ids set in a bitmap, in catalog order."""
+        result = []
+        sticker_ids = self.sticker_ids
+        while bits:
+            low = bits & -bits
+            result.append(sticker_ids[low.bit_length() - 1])
+            bits ^= low
+        return result
+
+
+def compare(mine: InventoryBits, theirs: InventoryBits) -> MatchResult:
+    """Compare two encoded inventories from the point of view of `mine`."""
+    give_bits = mine.duplicates & theirs.missing
+    get_bits = theirs.duplicates & mine.missing
+    return MatchResult(
+        give_bits=give_bits,
+        get_bits=get_bits,
+        give_count=give_bits.bit_count(),
+        get_count=get_bits.bit_count(),
+    )
+
+
+def can_match_anyone(mine: InventoryBits) -> bool:
+    """A user with no duplicates or nothing missing can never have a mutual match."""
+    return bool(mine.duplicates) and bool(mine.missing)
+
+
+def mutual_counts(mine: InventoryBits, theirs: InventoryBits) -> Tuple[int, int]:
+    """Return (give_count, get_count) without keeping the intermediate bitmaps."""
+    return (
+        (mine.duplicates & theirs.missing).bit_count(),
+        (theirs.duplicates & mine.missing).bit_count(),
+    )
@@ -0,0 +1,582 @@
+"""
+Persisted, incrementally maintained match-candidate index.
+
+Collections:
+- match_index_members: one doc per (album, member) with the member's
+  duplicate and missing sticker ids.
+- match_index_pairs: one doc per DIRECTED (album, user, partner) pair with
+  give_count (user's duplicates the partner misses), get_count (partner's
+  duplicates the user misses) and swap_count = min(give, get), the number
+  of one-for-one swaps the pair can make (used for ranking).
+- match_index_albums: marker docs for albums whose index has been built,
+  with the INDEX_VERSION and sticker catalog version it was built from.
+  The marker also holds the build claim (building_token/building_until):
+  only the worker holding an unexpired claim rebuilds the album.
+
+Builds run at startup (build_stale_albums) and from the CLI. A read that
+finds the index stale schedules a background build and never builds
+inline: it keeps serving the previous build when one with the current
+INDEX_VERSION exists, and raises IndexBuilding (-> 503) otherwise. A build
+upserts member/pair docs stamped with its token and only then removes the
+docs of older builds, so readers never see an emptied index.
+
+Writes keep maintaining any index with the current INDEX_VERSION (also one
+built for an older catalog that is still being served). While a build
+holds the claim, every write also adds its user to the marker's
+dirty_users; before the build marks the album current it re-indexes those
+users from album_members/user_inventory (repeating until none are left),
+so changes that raced the build's snapshot are neither lost nor undone.
+
+Write paths only touch the pairs a change can affect: a sticker that stops
+or starts being a duplicate only changes pairs with members missing it, and
+a sticker that stops or starts being missing only changes pairs with members
+holding it as a duplicate. Matches are then an indexed read of the pairs
+where both counts are positive.
+
+Location and radius are NOT part of the index - they are applied when the
+partner user docs are read, so location/radius edits never invalidate it.
+
+CLI:
+    python match_index.py rebuild [album_id ...]
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import DeleteMany, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+import catalog_cache
+from match_engine import AlbumStickerIndex
+
+logger = logging.getLogger(__name__)
+
+# Bump when the pair document shape changes; older albums are rebuilt on read
+INDEX_VERSION = 2
+
+# Albums known to have a built index -> catalog version it was built from
+# (process-local, markers are never removed)
+_built_albums: Dict[str, int] = {}
+
+# A build claim older than this is treated as abandoned (crashed worker)
+BUILD_LEASE_SECONDS = 600
+
+# Background builds started by this process, by album id
+_build_tasks: Dict[str, asyncio.Task] = {}
+
+
+class IndexBuilding(Exception):
+    """The album has no usable index yet; a build is in progress."""
+
+    def __init__(self, album_id: str):
+        super().__init__(f"match index for album {album_id} is being built")
+        self.album_id = album_id
+
+
+def _sticker_state(qty: int) -> tuple:
+    """Return (is_duplicate, is_missing) for an owned quantity."""
+    qty = qty or 0
+    return qty >= 2, qty <= 0
+
+
+def _set_pair(album_id: str, user_id: str, partner_id: str, give_count: int, get_count: int,
+              build: Optional[str] = None) -> UpdateOne:
+    fields = {"give_count": give_count, "get_count": get_count, "swap_count": min(give_count, get_count)}
+    if build is not None:
+        fields["build"] = build
+    return UpdateOne(
+        {"album_id": album_id, "user_id": user_id, "partner_id": partner_id},
+        {"$set": fields},
+        upsert=True
+    )
+
+
+def _inc_pair(album_id: str, user_id: str, partner_id: str, give_delta: int = 0, get_delta: int = 0) -> UpdateOne:
+    # Pipeline update so swap_count is recomputed atomically with the counters
+    return UpdateOne(
+        {"album_id": album_id, "user_id": user_id, "partner_id": partner_id},
+        [
+            {"$set": {
+                "give_count": {"$add": [{"$ifNull": ["$give_count", 0]}, give_delta]},
+                "get_count": {"$add": [{"$ifNull": ["$get_count", 0]}, get_delta]}
+            }},
+            {"$set": {"swap_count": {"$min": ["$give_count", "$get_count"]}}}
+        ],
+        upsert=True
+    )
+
+
+async def _album_sticker_index(db, album_id: str) -> AlbumStickerIndex:
+    catalog = await catalog_cache.get_catalog(db, album_id)
+    return catalog.sticker_index
+
+
+async def _member_doc(db, sticker_index: AlbumStickerIndex, album_id: str, user_id: str,
+                      inventory: Optional[list] = None) -> dict:
+    """Build the match_index_members doc for one user from their album inventory."""
+    if inventory is None:
+        inventory = await db.user_inventory.find(
+            {"user_id": user_id, "album_id": album_id},
+            {"_id": 0, "sticker_id": 1, "owned_qty": 1}
+        ).to_list(None)
+    bits = sticker_index.encode_items(inventory)
+    return {
+        "album_id": album_id,
+        "user_id": user_id,
+        "duplicates": sticker_index.decode(bits.duplicates),
+        "missing": sticker_index.decode(bits.missing),
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+
+async def _compute_row(db, member: dict) -> List[dict]:
+    """
+    Compute give/get counts between one member and every other indexed member.
+    The set intersections run inside MongoDB; only counts come back.
+    """
+    duplicates = member['duplicates']
+    missing = member['missing']
+    if not duplicates and not missing:
+        return []
+    return await db.match_index_members.aggregate([
+        {"$match": {
+            "album_id": member['album_id'],
+            "user_id": {"$ne": member['user_id']},
+            "$or": [{"missing": {"$in": duplicates}}, {"duplicates": {"$in": missing}}]
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": 1,
+            "give_count": {"$size": {"$setIntersection": ["$missing", duplicates]}},
+            "get_count": {"$size": {"$setIntersection": ["$duplicates", missing]}}
+        }}
+    ]).to_list(None)
+
+
+async def _claim_build(db, album_id: str) -> Optional[str]:
+    """
+    Take the album's build claim. Returns the claim token, or None when
+    another worker holds an unexpired claim (the filter misses and the
+    upsert collides with the marker on its unique album_id).
+    """
+    now = datetime.now(timezone.utc)
+    token = uuid.uuid4().hex
+    try:
+        await db.match_index_albums.update_one(
+            {"album_id": album_id, "$or": [{"building_until": None}, {"building_until": {"$lt": now}}]},
+            {"$set": {
+                "building_token": token,
+                "building_until": now + timedelta(seconds=BUILD_LEASE_SECONDS),
+                "dirty_users": []
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return None
+    return token
+
+
+async def _release_build(db, album_id: str, token: str):
+    await db.match_index_albums.update_one(
+        {"album_id": album_id, "building_token": token},
+        {"$unset": {"building_token": "", "building_until": "", "dirty_users": ""}}
+    )
+
+
+async def _finish_build(db, album_id: str, sticker_index: AlbumStickerIndex, token: str, fields: dict) -> bool:
+    """
+    Re-index the users written while the build ran, then mark the album
+    built - only once no new dirty user arrived in between. Returns False
+    when the claim was lost (lease expired and taken over).
+    """
+    while True:
+        marker = await db.match_index_albums.find_one_and_update(
+            {"album_id": album_id, "building_token": token},
+            {"$set": {"dirty_users": []}},
+            projection={"_id": 0, "dirty_users": 1}
+        )
+        if marker is None:
+            return False
+        for user_id in marker.get('dirty_users', []):
+            await _reindex_member(db, sticker_index, album_id, user_id, build=token)
+        finished = await db.match_index_albums.update_one(
+            {"album_id": album_id, "building_token": token, "dirty_users": []},
+            {
+                "$set": fields,
+                "$unset": {"building_token": "", "building_until": "", "dirty_users": ""}
+            }
+        )
+        if finished.matched_count:
+            return True
+
+
+async def rebuild_album_index(db, album_id: str) -> Optional[int]:
+    """
+    Rebuild the whole index for an album from album_members and user_inventory.
+    Returns the number of indexed members, or None when another worker is
+    already building it.
+    """
+    token = await _claim_build(db, album_id)
+    if token is None:
+        logger.info(f"[MATCH_INDEX] Album {album_id} is already being built elsewhere")
+        return None
+    try:
+        catalog = await catalog_cache.get_catalog(db, album_id)
+        member_count = await _build(db, album_id, catalog.sticker_index, token)
+        finished = await _finish_build(db, album_id, catalog.sticker_index, token, {
+            "built_at": datetime.now(timezone.utc).isoformat(),
+            "member_count": member_count,
+            "version": INDEX_VERSION,
+            "catalog_version": catalog.version
+        })
+    except BaseException:
+        await _release_build(db, album_id, token)
+        raise
+    if not finished:
+        logger.warning(f"[MATCH_INDEX] Lost the build claim for album {album_id}")
+        return None
+
+    _built_albums[album_id] = catalog.version
+    logger.info(f"[MATCH_INDEX] Rebuilt index for album {album_id}: {member_count} members")
+    return member_count
+
+
+async def _build(db, album_id: str, sticker_index: AlbumStickerIndex, token: str) -> int:
+    members = await db.album_members.find({"album_id": album_id}, {"_id": 0, "user_id": 1}).to_list(None)
+    member_ids = list(dict.fromkeys(m['user_id'] for m in members))
+
+    inventory_items = await db.user_inventory.find(
+        {"album_id": album_id, "user_id": {"$in": member_ids}},
+        {"_id": 0, "user_id": 1, "sticker_id": 1, "owned_qty": 1}
+    ).to_list(None)
+    inventory_by_user: Dict[str, list] = {}
+    for item in inventory_items:
+        inventory_by_user.setdefault(item['user_id'], []).append(item)
+
+    member_docs = [
+        await _member_doc(db, sticker_index, album_id, uid, inventory_by_user.get(uid, []))
+        for uid in member_ids
+    ]
+
+    # Upsert over the previous build instead of delete + insert: concurrent
+    # readers keep a complete (if older) index, and no insert can collide
+    if member_docs:
+        await db.match_index_members.bulk_write([
+            UpdateOne({"album_id": album_id, "user_id": doc['user_id']},
+                      {"$set": dict(doc, build=token)}, upsert=True)
+            for doc in member_docs
+        ], ordered=False)
+
+    for doc in member_docs:
+        row = await _compute_row(db, doc)
+        ops = [_set_pair(album_id, doc['user_id'], r['user_id'], r['give_count'], r['get_count'], build=token)
+               for r in row]
+        if ops:
+            await db.match_index_pairs.bulk_write(ops, ordered=False)
+
+    # Whatever this build did not write is left over from an older one
+    stale = {"album_id": album_id, "build": {"$ne": token}}
+    await db.match_index_pairs.delete_many(stale)
+    await db.match_index_members.delete_many(stale)
+    return len(member_docs)
+
+
+async def is_album_indexed(db, album_id: str) -> bool:
+    """True if the album index is current for both INDEX_VERSION and the sticker catalog."""
+    catalog_version = (await catalog_cache.get_catalog(db, album_id)).version
+    if _built_albums.get(album_id) == catalog_version:
+        return True
+    marker = await db.match_index_albums.find_one(
+        {"album_id": album_id, "version": INDEX_VERSION},
+        {"_id": 0, "catalog_version": 1}
+    )
+    if marker and marker.get('catalog_version', 0) == catalog_version:
+        _built_albums[album_id] = catalog_version
+        return True
+    return False
+
+
+async def has_index(db, album_id: str) -> bool:
+    """
+    True when a build with the current INDEX_VERSION exists, even one for an
+    older catalog that is still served while the rebuild runs. Writes keep
+    such an index up to date.
+    """
+    if album_id in _built_albums:
+        return True
+    marker = await db.match_index_albums.find_one(
+        {"album_id": album_id, "version": INDEX_VERSION},
+        {"_id": 0, "catalog_version": 1}
+    )
+    if marker is None:
+        return False
+    _built_albums[album_id] = marker.get('catalog_version', 0)
+    return True
+
+
+async def _mark_dirty(db, album_id: str, user_id: str):
+    """Have a running build re-index this user before it finishes (no-op otherwise)."""
+    await db.match_index_albums.update_one(
+        {"album_id": album_id, "building_token": {"$exists": True}},
+        {"$addToSet": {"dirty_users": user_id}}
+    )
+
+
+async def _reindex_member(db, sticker_index: AlbumStickerIndex, album_id: str, user_id: str,
+                          build: Optional[str] = None):
+    """
+    Recompute one user's member doc and every pair involving them from
+    album_members/user_inventory (drops them if they are no longer a member).
+    """
+    if await db.album_members.find_one({"album_id": album_id, "user_id": user_id}, {"_id": 1}) is None:
+        await _drop_member(db, album_id, user_id)
+        return
+    doc = await _member_doc(db, sticker_index, album_id, user_id)
+    fields = dict(doc, build=build) if build is not None else doc
+    await db.match_index_members.update_one(
+        {"album_id": album_id, "user_id": user_id}, {"$set": fields}, upsert=True
+    )
+    row = await _compute_row(db, doc)
+    partner_ids = [r['user_id'] for r in row]
+    ops = []
+    for r in row:
+        ops.append(_set_pair(album_id, user_id, r['user_id'], r['give_count'], r['get_count'], build=build))
+        ops.append(_set_pair(album_id, r['user_id'], user_id, r['get_count'], r['give_count'], build=build))
+    # Pairs that no longer share anything
+    ops.append(DeleteMany({"album_id": album_id, "user_id": user_id, "partner_id": {"$nin": partner_ids}}))
+    ops.append(DeleteMany({"album_id": album_id, "partner_id": user_id, "user_id": {"$nin": partner_ids}}))
+    await db.match_index_pairs.bulk_write(ops, ordered=False)
+
+
+async def _drop_member(db, album_id: str, user_id: str):
+    await db.match_index_members.delete_one({"album_id": album_id, "user_id": user_id})
+    await db.match_index_pairs.bulk_write([
+        DeleteMany({"album_id": album_id, "user_id": user_id}),
+        DeleteMany({"album_id": album_id, "partner_id": user_id}),
+    ], ordered=False)
+
+
+def schedule_build(db, album_id: str):
+    """Rebuild the album index in the background (at most one task per album in this process)."""
+    task = _build_tasks.get(album_id)
+    if task is not None and not task.done():
+        return
+
+    async def run():
+        try:
+            await rebuild_album_index(db, album_id)
+        except Exception as e:
+            logger.error(f"[MATCH_INDEX] Background build of album {album_id} failed: {e}")
+        finally:
+            _build_tasks.pop(album_id, None)
+
+    _build_tasks[album_id] = asyncio.create_task(run())
+
+
+async def ensure_album_index(db, album_id: str):
+    """
+    Make sure reads can be served for the album. A stale index is rebuilt in
+    the background; meanwhile the previous build is served if it has the
+    current INDEX_VERSION (only the catalog changed), else IndexBuilding is raised.
+    """
+    if await is_album_indexed(db, album_id):
+        return
+    schedule_build(db, album_id)
+    previous = await db.match_index_albums.find_one(
+        {"album_id": album_id, "version": INDEX_VERSION}, {"_id": 0, "built_at": 1}
+    )
+    if previous is None:
+        raise IndexBuilding(album_id)
+
+
+async def build_stale_albums(db) -> int:
+    """Build every album whose index is missing or stale. Returns the number built."""
+    albums = await db.albums.find({}, {"_id": 0, "id": 1}).to_list(None)
+    built = 0
+    for album in albums:
+        try:
+            if await is_album_indexed(db, album['id']):
+                continue
+            if await rebuild_album_index(db, album['id']) is not None:
+                built += 1
+        except Exception as e:
+            logger.error(f"[MATCH_INDEX] Could not build album {album['id']}: {e}")
+    logger.info(f"[MATCH_INDEX] Startup build finished: {built} albums built")
+    return built
+
+
+async def member_added(db, album_id: str, user_id: str):
+    """Index a member who just activated the album (computes their full row)."""
+    if await has_index(db, album_id):
+        sticker_index = await _album_sticker_index(db, album_id)
+        await _reindex_member(db, sticker_index, album_id, user_id)
+    await _mark_dirty(db, album_id, user_id)
+
+
+async def member_changed(db, album_id: str, user_id: str):
+    """
+    Re-index a member whose inventory was written without (old, new)
+    quantities. Recomputes their full row, so callers that write to an
+    album with an index (has_index) should report stickers_changed deltas
+    instead; this is for the rare race where the index appeared meanwhile.
+    """
+    await member_added(db, album_id, user_id)
+
+
+async def member_removed(db, album_id: str, user_id: str):
+    """Drop a member who deactivated the album, with every pair involving them."""
+    await _drop_member(db, album_id, user_id)
+    await _mark_dirty(db, album_id, user_id)
+
+
+async def sticker_changed(db, album_id: str, user_id: str, sticker_id: str, old_qty: int, new_qty: int):
+    """
+    Apply one inventory change. Only pairs with members that miss the sticker
+    (duplicate status changed) or hold it as a duplicate (missing status
+    changed) are touched.
+    """
+    await stickers_changed(db, album_id, user_id, [(sticker_id, old_qty, new_qty)])
+
+
+async def stickers_changed(db, album_id: str, user_id: str, changes: List[Tuple[str, int, int]]):
+    """
+    Apply several (sticker_id, old_qty, new_qty) changes of one user at once.
+    Deltas are summed per partner, so each affected pair gets a single update.
+    """
+    dup_deltas: Dict[str, int] = {}
+    missing_deltas: Dict[str, int] = {}
+    member_ops = []
+    member_filter = {"album_id": album_id, "user_id": user_id}
+    for sticker_id, old_qty, new_qty in changes:
+        was_dup, was_missing = _sticker_state(old_qty)
+        is_dup, is_missing = _sticker_state(new_qty)
+        member_update = {}
+        if is_dup != was_dup:
+            dup_deltas[sticker_id] = 1 if is_dup else -1
+            member_update.setdefault("$addToSet" if is_dup else "$pull", {})["duplicates"] = sticker_id
+        if is_missing != was_missing:
+            missing_deltas[sticker_id] = 1 if is_missing else -1
+            member_update.setdefault("$addToSet" if is_missing else "$pull", {})["missing"] = sticker_id
+        if member_update:
+            member_ops.append(UpdateOne(member_filter, member_update))
+    if not member_ops:
+        return
+    if await has_index(db, album_id):
+        await _apply_deltas(db, album_id, user_id, member_ops, dup_deltas, missing_deltas)
+    await _mark_dirty(db, album_id, user_id)
+
+
+async def _apply_deltas(db, album_id: str, user_id: str, member_ops: List[UpdateOne],
+                        dup_deltas: Dict[str, int], missing_deltas: Dict[str, int]):
+    result = await db.match_index_members.bulk_write(member_ops, ordered=True)
+    if result.matched_count == 0:
+        return  # Not an album member - nothing to match against
+
+    # partner_id -> [give_delta, get_delta] from this user's point of view
+    pair_deltas: Dict[str, List[int]] = {}
+    if dup_deltas:
+        partners = await db.match_index_members.find(
+            {"album_id": album_id, "missing": {"$in": list(dup_deltas)}, "user_id": {"$ne": user_id}},
+            {"_id": 0, "user_id": 1, "missing": 1}
+        ).to_list(None)
+        for p in partners:
+            delta = sum(dup_deltas.get(sid, 0) for sid in p['missing'])
+            pair_deltas.setdefault(p['user_id'], [0, 0])[0] += delta
+    if missing_deltas:
+        partners = await db.match_index_members.find(
+            {"album_id": album_id, "duplicates": {"$in": list(missing_deltas)}, "user_id": {"$ne": user_id}},
+            {"_id": 0, "user_id": 1, "duplicates": 1}
+        ).to_list(None)
+        for p in partners:
+            delta = sum(missing_deltas.get(sid, 0) for sid in p['duplicates'])
+            pair_deltas.setdefault(p['user_id'], [0, 0])[1] += delta
+
+    ops = []
+    for partner_id, (give_delta, get_delta) in pair_deltas.items():
+        if give_delta == 0 and get_delta == 0:
+            continue
+        ops.append(_inc_pair(album_id, user_id, partner_id, give_delta=give_delta, get_delta=get_delta))
+        ops.append(_inc_pair(album_id, partner_id, user_id, give_delta=get_delta, get_delta=give_delta))
+    if ops:
+        await db.match_index_pairs.bulk_write(ops, ordered=False)
+
+
+async def get_mutual_pairs(db, album_id: str, user_id: str) -> List[dict]:
+    """Indexed read: pairs where the exchange works in both directions."""
+    await ensure_album_index(db, album_id)
+    return await db.match_index_pairs.find(
+        {"album_id": album_id, "user_id": user_id, "give_count": {"$gt": 0}, "get_count": {"$gt": 0}},
+        {"_id": 0, "partner_id": 1, "give_count": 1, "get_count": 1}
+    ).to_list(None)
+
+
+async def iter_mutual_pairs(db, album_id: str, user_id: str, max_swap_count: Optional[int] = None,
+                            chunk_size: int = 100):
+    """
+    Stream mutual pairs in descending swap_count order, one chunk at a time,
+    so callers can stop reading as soon as their top-K is settled.
+    """
+    await ensure_album_index(db, album_id)
+    query = {"album_id": album_id, "user_id": user_id, "give_count": {"$gt": 0}, "get_count": {"$gt": 0}}
+    if max_swap_count is not None:
+        query["swap_count"] = {"$lte": max_swap_count}
+    cursor = db.match_index_pairs.find(
+        query,
+        {"_id": 0, "partner_id": 1, "give_count": 1, "get_count": 1, "swap_count": 1}
+    ).sort("swap_count", -1).batch_size(chunk_size)
+    try:
+        while True:
+            chunk = await cursor.to_list(length=chunk_size)
+            if not chunk:
+                break
+            yield chunk
+            if len(chunk) < chunk_size:
+                break
+    finally:
+        await cursor.close()
+
+
+async def ensure_indexes(db):
+    """Create the MongoDB indexes the match index relies on."""
+    await db.match_index_members.create_index([("album_id", 1), ("user_id", 1)], unique=True)
+    await db.match_index_members.create_index([("album_id", 1), ("duplicates", 1)])
+    await db.match_index_members.create_index([("album_id", 1), ("missing", 1)])
+    await db.match_index_pairs.create_index([("album_id", 1), ("user_id", 1), ("partner_id", 1)], unique=True)
+    await db.match_index_pairs.create_index([("album_id", 1), ("partner_id", 1)])
+    await db.match_index_pairs.create_index([("album_id", 1), ("user_id", 1), ("swap_count", -1)])
+    await db.match_index_albums.create_index("album_id", unique=True)
+
+
+async def _main(album_ids: List[str]):
+    import os
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    await ensure_indexes(db)
+    if not album_ids:
+        albums = await db.albums.find({}, {"_id": 0, "id": 1}).to_list(None)
+        album_ids = [a['id'] for a in albums]
+    for album_id in album_ids:
+        count = await rebuild_album_index(db, album_id)
+        if count is None:
+            print(f"  ⏳ Album {album_id}: already being built, skipped")
+        else:
+            print(f"  ✅ Album {album_id}: indexed {count} members")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print("Usage: python match_index.py rebuild [album_id ...]")
+        sys.exit(1)
+    asyncio.run(_main(sys.argv[2:]))
@@ -0,0 +1,63 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+BATCH_SIZE = 500
+
+async def count_unread(db, chat: dict, reader_id: str, last_read) -> int:
+    """Messages in the chat not sent by the reader and newer than their last read."""
+    query = {"chat_id": chat['id'], "sender_id": {"$ne": reader_id}}
+    if last_read:
+        query["created_at"] = {"$gt": last_read}
+    return await db.chat_messages.count_documents(query)
+
+async def backfill_unread_counters(db) -> int:
+    """Add unread counters to every chat missing them. Returns the number of chats updated."""
+    query = {"$or": [{"user_a_unread": {"$exists": False}}, {"user_b_unread": {"$exists": False}}]}
+
+    migrated = 0
+    ops = []
+    async for chat in db.chats.find(query, {"_id": 0}):
+        user_a_unread = await count_unread(db, chat, chat['user_a_id'], chat.get('user_a_last_read'))
+        user_b_unread = await count_unread(db, chat, chat['user_b_id'], chat.get('user_b_last_read'))
+        ops.append(UpdateOne(
+            {"id": chat['id']},
+            {"$set": {"user_a_unread": user_a_unread, "user_b_unread": user_b_unread}}
+        ))
+        if len(ops) >= BATCH_SIZE:
+            result = await db.chats.bulk_write(ops, ordered=False)
+            migrated += result.modified_count
+            ops = []
+    if ops:
+        result = await db.chats.bulk_write(ops, ordered=False)
+        migrated += result.modified_count
+    return migrated
+
+async def migrate_chat_unread_counters():
+    """
+    One-time migration: backfill user_a_unread/user_b_unread on chats from
+    user_a_last_read/user_b_last_read. New messages maintain the counters.
+    Safe to re-run - chats that already have counters are skipped.
+    """
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ['DB_NAME']]
+
+    print("=" * 60)
+    print("CHAT UNREAD COUNTER MIGRATION")
+    print("=" * 60)
+
+    migrated = await backfill_unread_counters(db)
+    print(f"\n  ✅ Added unread counters to {migrated} chats")
+
+    client.close()
+    print("\n✅ Migration complete!")
+
+if __name__ == "__main__":
+    asyncio.run(migrate_chat_unread_counters())
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+from models import exchange_pair_key
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+BATCH_SIZE = 500
+
+async def migrate_exchange_pair_keys():
+    """
+    One-time migration: set pair_key (album + sorted user pair) on exchanges and
+    create the partial unique index on pending exchanges.
+    Duplicate pending exchanges for the same pair (created by concurrent taps
+    before the index existed) would block the index: the oldest one is kept and
+    the others are expired.
+    Safe to re-run - exchanges that already have a pair_key are skipped.
+    """
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ['DB_NAME']]
+
+    print("=" * 60)
+    print("EXCHANGE PAIR KEY MIGRATION")
+    print("=" * 60)
+
+    projection = {"_id": 0, "id": 1, "album_id": 1, "user_a_id": 1, "user_b_id": 1}
+
+    migrated = 0
+    ops = []
+    async for exchange in db.exchanges.find({"pair_key": {"$exists": False}}, projection):
+        pair_key = exchange_pair_key(exchange['album_id'], exchange['user_a_id'], exchange['user_b_id'])
+        ops.append(UpdateOne({"id": exchange['id']}, {"$set": {"pair_key": pair_key}}))
+        if len(ops) >= BATCH_SIZE:
+            result = await db.exchanges.bulk_write(ops, ordered=False)
+            migrated += result.modified_count
+            ops = []
+    if ops:
+        result = await db.exchanges.bulk_write(ops, ordered=False)
+        migrated += result.modified_count
+
+    print(f"\n  ✅ Added pair_key to {migrated} exchanges")
+
+    # Keep the oldest pending exchange per pair, expire the rest
+    duplicates = await db.exchanges.aggregate([
+        {"$match": {"status": "pending"}},
+        {"$sort": {"created_at": 1}},
+        {"$group": {"_id": "$pair_key", "ids": {"$push": "$id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]).to_list(None)
+    extra_ids = [exchange_id for group in duplicates for exchange_id in group['ids'][1:]]
+    if extra_ids:
+        result = await db.exchanges.update_many(
+            {"id": {"$in": extra_ids}, "status": "pending"},
+            {"$set": {"status": "expired", "completed_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        print(f"  ⚠️  Expired {result.modified_count} duplicate pending exchanges")
+
+    await db.exchanges.create_index(
+        "pair_key", name="pair_key_1", unique=True,
+        partialFilterExpression={"status": "pending"}
+    )
+    print("  ✅ Partial unique index on exchanges.pair_key ensured")
+
+    client.close()
+    print("\n✅ Migration complete!")
+
+if __name__ == "__main__":
+    asyncio.run(migrate_exchange_pair_keys())
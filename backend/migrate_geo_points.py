@@ -0,0 +1,68 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+from geo import build_location_point, get_user_coordinates, LOCATION_POINT_FIELD
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+BATCH_SIZE = 500
+
+async def migrate_geo_points():
+    """
+    One-time migration: mirror latitude/longitude (or legacy location_lat/location_lng)
+    into a GeoJSON location_point and ensure the 2dsphere index exists.
+    Safe to re-run - users that already have a point are skipped.
+    """
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ['DB_NAME']]
+    
+    print("=" * 60)
+    print("GEOJSON LOCATION POINT MIGRATION")
+    print("=" * 60)
+    
+    query = {
+        LOCATION_POINT_FIELD: None,
+        "$or": [
+            {"latitude": {"$ne": None}, "longitude": {"$ne": None}},
+            {"location_lat": {"$ne": None}, "location_lng": {"$ne": None}}
+        ]
+    }
+    projection = {"_id": 0, "id": 1, "latitude": 1, "longitude": 1, "location_lat": 1, "location_lng": 1}
+    
+    migrated = 0
+    skipped = 0
+    ops = []
+    async for user in db.users.find(query, projection):
+        coords = get_user_coordinates(user)
+        point = build_location_point(*coords) if coords else None
+        if point is None:
+            skipped += 1
+            print(f"  ⚠️  Skipping user {user.get('id')}: invalid coordinates {coords}")
+            continue
+        ops.append(UpdateOne({"id": user['id']}, {"$set": {LOCATION_POINT_FIELD: point}}))
+        if len(ops) >= BATCH_SIZE:
+            result = await db.users.bulk_write(ops, ordered=False)
+            migrated += result.modified_count
+            ops = []
+    if ops:
+        result = await db.users.bulk_write(ops, ordered=False)
+        migrated += result.modified_count
+    
+    print(f"\n  ✅ Added {LOCATION_POINT_FIELD} to {migrated} users")
+    if skipped:
+        print(f"  ⚠️  Skipped {skipped} users with invalid coordinates")
+    
+    await db.users.create_index([(LOCATION_POINT_FIELD, "2dsphere")])
+    print(f"  ✅ 2dsphere index on users.{LOCATION_POINT_FIELD} ensured")
+    
+    client.close()
+    print("\n✅ Migration complete!")
+
+if __name__ == "__main__":
+    asyncio.run(migrate_geo_points())
@@ -5,6 +5,8 @@ from dotenv import load_dotenv
 from pathlib import Path
 import json
 
+from catalog_cache import bump_catalog_version
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -92,6 +94,10 @@ async def update_albums_and_stickers():
     
     print(f"  ✅ Updated {updated_count} stickers in football album")
     
+    # Running servers cache catalogs in memory - make them reload this one
+    if updated_count > 0:
+        await bump_catalog_version(db, [qatar_album_id])
+    
     # Summary of changes
     print("\n" + "=" * 60)
     print("MIGRATION SUMMARY")
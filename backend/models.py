@@ -20,8 +20,8 @@ class User(BaseModel):
     
     # Freemium plan fields
     plan: str = 'free'  # 'free' or 'premium'
-    matches_used_today: int = 0  # Daily match counter for free users
-    matches_used_date: Optional[str] = None  # YYYY-MM-DD format for daily reset
+    matches_used_today: int = 0  # Legacy - daily chat usage lives in chat_quotas (chat_quota.py)
+    matches_used_date: Optional[str] = None  # Legacy, see chat_quota.py
     premium_until: Optional[datetime] = None  # Future: subscription expiry
     
     # Structured Location Fields (globally scalable)
@@ -231,6 +231,19 @@ class InventoryUpdate(BaseModel):
     sticker_id: str
     owned_qty: int
 
+class InventoryBatchItem(BaseModel):
+    """One batch entry: set owned_qty OR apply delta (exactly one of them)."""
+    sticker_id: str
+    owned_qty: Optional[int] = None
+    delta: Optional[int] = None
+
+class InventoryBatchUpdate(BaseModel):
+    album_id: str
+    items: List[InventoryBatchItem]
+
+class GroupInventoryBatchUpdate(BaseModel):
+    items: List[InventoryBatchItem]
+
 # ============================================
 # OFFER MODELS
 # ============================================
@@ -293,6 +306,8 @@ class Exchange(BaseModel):
     album_id: str
     user_a_id: str
     user_b_id: str
+    # Canonical album + sorted user pair, unique among pending exchanges
+    pair_key: Optional[str] = None
     # Stickers offered by each user (list of sticker IDs)
     user_a_offers: List[str] = []  # Stickers A gives to B
     user_b_offers: List[str] = []  # Stickers B gives to A
@@ -315,6 +330,11 @@ class ExchangeCreate(BaseModel):
     album_id: str
     partner_user_id: str
 
+def exchange_pair_key(album_id: str, user_id: str, partner_id: str) -> str:
+    """Same key whichever side starts the exchange."""
+    low, high = sorted((user_id, partner_id))
+    return f"{album_id}:{low}:{high}"
+
 class ExchangeConfirm(BaseModel):
     confirmed: bool  # True=👍, False=👎
     failure_reason: Optional[str] = None  # Required if confirmed=False
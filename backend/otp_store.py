@@ -0,0 +1,110 @@
+"""
+Storage for pending login OTPs (hashed, never plain).
+
+send-otp and verify-otp may hit different workers, so the default backend
+keeps codes in MongoDB:
+- MongoOTPStore: `otp_codes` collection, one doc per email, removed by a TTL
+  index once expired. Attempts are counted with an atomic $inc, so the
+  attempt limit holds across workers.
+- MemoryOTPStore: in-process dict for a single worker and tests. Expired
+  entries are evicted on write and the size is capped, so unverified codes
+  cannot grow memory without bound.
+
+Configured with OTP_STORE_BACKEND=mongo|memory (default mongo).
+"""
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+OTP_COLLECTION = "otp_codes"
+
+
+def _aware(value: datetime) -> datetime:
+    # Mongo returns naive UTC datetimes unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class MemoryOTPStore:
+    """Single-process store with expiry eviction and a size cap."""
+
+    def __init__(self, max_entries: int = 10000):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, now: datetime):
+        for email in [e for e, entry in self._entries.items() if entry['expires'] <= now]:
+            del self._entries[email]
+        while len(self._entries) >= self._max_entries:
+            self._entries.popitem(last=False)  # Oldest code first
+
+    async def put(self, email: str, otp_hash: str, expires: datetime):
+        self._entries.pop(email, None)
+        self._evict(datetime.now(timezone.utc))
+        self._entries[email] = {"hash": otp_hash, "expires": expires, "attempts": 0}
+
+    async def attempt(self, email: str) -> Optional[dict]:
+        entry = self._entries.get(email)
+        if entry is None:
+            return None
+        entry['attempts'] += 1
+        return dict(entry)
+
+    async def consume(self, email: str, otp_hash: str) -> bool:
+        entry = self._entries.get(email)
+        if entry is None or entry['hash'] != otp_hash:
+            return False
+        del self._entries[email]
+        return True
+
+    async def delete(self, email: str):
+        self._entries.pop(email, None)
+
+
+class MongoOTPStore:
+    """Store shared by every worker, expired codes removed by a TTL index."""
+
+    def __init__(self, db, collection: str = OTP_COLLECTION):
+        self._collection = db[collection]
+
+    async def put(self, email: str, otp_hash: str, expires: datetime):
+        await self._collection.update_one(
+            {"email": email},
+            {"$set": {"hash": otp_hash, "expires": expires, "attempts": 0}},
+            upsert=True
+        )
+
+    async def attempt(self, email: str) -> Optional[dict]:
+        doc = await self._collection.find_one_and_update(
+            {"email": email},
+            {"$inc": {"attempts": 1}},
+            projection={"_id": 0, "hash": 1, "expires": 1, "attempts": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is None:
+            return None
+        doc['expires'] = _aware(doc['expires'])
+        return doc
+
+    async def consume(self, email: str, otp_hash: str) -> bool:
+        return await self._collection.find_one_and_delete({"email": email, "hash": otp_hash}) is not None
+
+    async def delete(self, email: str):
+        await self._collection.delete_one({"email": email})
+
+    async def ensure_indexes(self):
+        await self._collection.create_index("email", unique=True)
+        await self._collection.create_index("expires", expireAfterSeconds=0)
+
+
+def create_otp_store(kind: str, db):
+    if kind == "memory":
+        return MemoryOTPStore()
+    return MongoOTPStore(db)
@@ -0,0 +1,194 @@
+"""
+In-memory search index for the location autocomplete.
+
+Built once from the static place list (location_data.CITIES). Names are
+accent-folded ("Bogotá" -> "bogota") and looked up through:
+- a prefix trie over full city names and over every city/region word
+- a trigram index for substring matches and typo candidates (queries
+  shorter than a trigram fall back to a linear substring scan)
+
+Results are ranked by tier, then edit distance, then source order:
+  0. city name starts with the query        ("mar d" -> Mar del Plata)
+  1. a city or region word starts with it   ("plata" -> La Plata)
+  2. query appears inside a city/region name ("gota" -> Bogotá)
+  3. fuzzy: a word starts with the query within a small edit distance
+     ("bogtoa" -> Bogotá)
+"""
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set
+
+# Shortest query for trigram lookups (substring and fuzzy tiers)
+MIN_TRIGRAM_QUERY = 3
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def fold(text: str) -> str:
+    """Lowercase, strip accents and collapse punctuation/whitespace."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(" ", stripped.lower()).strip()
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def max_edit_distance(query: str) -> int:
+    """Typos tolerated for a query of this length."""
+    if len(query) < 4:
+        return 0
+    return 1 if len(query) < 8 else 2
+
+
+def prefix_edit_distance(query: str, word: str, max_dist: int) -> Optional[int]:
+    """
+    Smallest edit distance (insert, delete, substitute, swap adjacent) between
+    `query` and any prefix of `word`, or None when it exceeds max_dist. Rows are
+    abandoned as soon as that is certain.
+    """
+    before: Optional[List[int]] = None
+    previous = list(range(len(word) + 1))
+    for i, q_char in enumerate(query, 1):
+        current = [i]
+        for j, w_char in enumerate(word, 1):
+            cost = 0 if q_char == w_char else 1
+            best = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if before is not None and j > 1 and q_char == word[j - 2] and query[i - 2] == w_char:
+                best = min(best, before[j - 2] + 1)
+            current.append(best)
+        if min(current) > max_dist:
+            return None
+        before, previous = previous, current
+    best = min(previous)
+    return best if best <= max_dist else None
+
+
+class _TrieNode:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.ids: Set[int] = set()
+
+
+class _PrefixTrie:
+    """Maps every prefix of the inserted keys to the ids stored under them."""
+
+    def __init__(self):
+        self._root = _TrieNode()
+
+    def insert(self, key: str, entry_id: int):
+        node = self._root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            node.ids.add(entry_id)
+
+    def lookup(self, prefix: str) -> Set[int]:
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.ids
+
+
+class PlaceIndex:
+    """
+    Index over place dicts (PlaceSearchResult shape: place_id, label,
+    city_name, region_name, country_code, latitude, longitude).
+    """
+
+    def __init__(self, places: Iterable[dict]):
+        self._places: List[dict] = list(places)
+        self._names: List[str] = []  # Folded city names
+        self._regions: List[str] = []  # Folded region names
+        self._words: List[List[str]] = []  # Folded city + region words
+        self._by_country: Dict[str, Set[int]] = {}
+        self._name_trie = _PrefixTrie()
+        self._word_trie = _PrefixTrie()
+        self._trigrams: Dict[str, Set[int]] = {}
+
+        for entry_id, place in enumerate(self._places):
+            name = fold(place['city_name'])
+            region = fold(place['region_name'])
+            words = list(dict.fromkeys(name.split() + region.split()))
+            self._names.append(name)
+            self._regions.append(region)
+            self._words.append(words)
+            self._by_country.setdefault(place['country_code'], set()).add(entry_id)
+            self._name_trie.insert(name, entry_id)
+            for word in words:
+                self._word_trie.insert(word, entry_id)
+            for gram in trigrams(name) | trigrams(region):
+                self._trigrams.setdefault(gram, set()).add(entry_id)
+
+    def __len__(self) -> int:
+        return len(self._places)
+
+    def search(self, query: str, country_code: Optional[str] = None, limit: int = 10) -> List[dict]:
+        folded = fold(query)
+        if not folded or limit <= 0:
+            return []
+
+        allowed = self._by_country.get(country_code.upper(), set()) if country_code else None
+        ranked: Dict[int, tuple] = {}
+
+        def add(ids: Iterable[int], tier: int, distance: int = 0):
+            for entry_id in ids:
+                if allowed is not None and entry_id not in allowed:
+                    continue
+                key = (tier, distance, entry_id)
+                if entry_id not in ranked or key < ranked[entry_id]:
+                    ranked[entry_id] = key
+
+        add(self._name_trie.lookup(folded), 0)
+        if " " not in folded:
+            add(self._word_trie.lookup(folded), 1)
+
+        if len(folded) < MIN_TRIGRAM_QUERY and len(ranked) < limit:
+            # No trigram to look up: scan the folded names (the list is small)
+            candidates = allowed if allowed is not None else range(len(self._places))
+            add((entry_id for entry_id in candidates
+                 if folded in self._names[entry_id] or folded in self._regions[entry_id]), 2)
+
+        if len(folded) >= MIN_TRIGRAM_QUERY and len(ranked) < limit:
+            grams = trigrams(folded)
+            candidates = self._trigram_candidates(grams)
+            add((entry_id for entry_id in candidates
+                 if folded in self._names[entry_id] or folded in self._regions[entry_id]), 2)
+
+            max_dist = max_edit_distance(folded)
+            if max_dist and len(ranked) < limit:
+                self._add_fuzzy(folded, grams, max_dist, add)
+
+        best = sorted(ranked.values())[:limit]
+        return [dict(self._places[entry_id]) for _, _, entry_id in best]
+
+    def _trigram_candidates(self, grams: Set[str]) -> Set[int]:
+        postings = sorted((self._trigrams.get(gram, set()) for gram in grams), key=len)
+        if not postings or not postings[0]:
+            return set()
+        result = set(postings[0])
+        for ids in postings[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
+
+    def _add_fuzzy(self, folded: str, grams: Set[str], max_dist: int, add):
+        # Each edit breaks at most 3 trigrams, so a real match shares at least this many
+        needed = max(1, len(grams) - 3 * max_dist)
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for entry_id in self._trigrams.get(gram, ()):
+                shared[entry_id] = shared.get(entry_id, 0) + 1
+        for entry_id, count in shared.items():
+            if count < needed:
+                continue
+            distances = [d for d in (prefix_edit_distance(folded, word, max_dist)
+                                     for word in self._words[entry_id] + [self._names[entry_id]])
+                         if d is not None]
+            if distances:
+                add([entry_id], 3, min(distances))
@@ -0,0 +1,187 @@
+"""
+Token-bucket rate limiting for abuse-prone endpoints.
+
+Every limited action is checked against two buckets: one per client IP and
+one per identity (email for send-otp, user id for authenticated actions).
+A request the identity bucket rejects gets its IP token back, so one
+throttled identity cannot drain the budget of everyone behind that IP.
+A bucket holds up to `capacity` tokens and refills continuously, a full
+bucket every `per_seconds`; each request takes one token. An empty bucket
+rejects the request with the number of seconds until a token is back
+(sent as Retry-After on a 429).
+
+Backends:
+- MemoryRateLimiter: in-process buckets (single worker, tests), LRU-capped.
+- MongoRateLimiter: `rate_limits` collection shared by every worker; the
+  refill-and-take step is one atomic pipeline update. Idle buckets are
+  removed by a TTL index.
+
+Backends fail open: a storage error lets the request through rather than
+taking the endpoint down.
+
+The client IP is taken from X-Forwarded-For counting TRUSTED_PROXY_COUNT
+hops from the right (the hops our own proxies appended); anything further
+left is client-supplied and could be spoofed to dodge the IP bucket.
+
+Configured with RATE_LIMIT_BACKEND=memory|mongo (default memory).
+"""
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_COLLECTION = "rate_limits"
+
+
+class RateLimit(NamedTuple):
+    capacity: int  # Burst size
+    per_seconds: float  # Time to refill an empty bucket
+
+    @property
+    def rate(self) -> float:
+        """Tokens added per second."""
+        return self.capacity / self.per_seconds
+
+
+def _refill(tokens: float, elapsed: float, limit: RateLimit) -> float:
+    return min(float(limit.capacity), tokens + max(0.0, elapsed) * limit.rate)
+
+
+def _retry_after(tokens: float, limit: RateLimit) -> float:
+    return (1 - tokens) / limit.rate
+
+
+class MemoryRateLimiter:
+    """Buckets kept in this process; least recently used keys are dropped first."""
+
+    def __init__(self, max_keys: int = 100000, clock=time.monotonic):
+        self._max_keys = max_keys
+        self._clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, limit: RateLimit) -> float:
+        """Take one token. Returns 0 when allowed, else seconds until one is available."""
+        now = self._clock()
+        tokens, updated_at = self._buckets.pop(key, (float(limit.capacity), now))
+        tokens = _refill(tokens, now - updated_at, limit)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = _retry_after(tokens, limit)
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self._max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    async def give_back(self, key: str, limit: RateLimit):
+        """Return a token taken by take() for a request that was rejected elsewhere."""
+        if key in self._buckets:
+            tokens, updated_at = self._buckets[key]
+            self._buckets[key] = (min(float(limit.capacity), tokens + 1), updated_at)
+
+
+class MongoRateLimiter:
+    """Buckets shared by every worker through one atomic update per request."""
+
+    def __init__(self, db, collection: str = RATE_LIMIT_COLLECTION):
+        self._collection = db[collection]
+
+    async def take(self, key: str, limit: RateLimit) -> float:
+        now = time.time()
+        refilled = {"$min": [
+            float(limit.capacity),
+            {"$add": [
+                {"$ifNull": ["$tokens", float(limit.capacity)]},
+                {"$multiply": [
+                    {"$max": [0, {"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}]},
+                    limit.rate
+                ]}
+            ]}
+        ]}
+        pipeline = [
+            {"$set": {"tokens": refilled}},
+            {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+            {"$set": {
+                "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                "updated_at": now,
+                # An idle bucket is full again after per_seconds; drop it then
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=limit.per_seconds)
+            }}
+        ]
+        for _ in range(2):
+            try:
+                bucket = await self._collection.find_one_and_update(
+                    {"key": key}, pipeline,
+                    upsert=True,
+                    projection={"_id": 0, "tokens": 1, "allowed": 1},
+                    return_document=ReturnDocument.AFTER
+                )
+                break
+            except DuplicateKeyError:
+                continue  # Concurrent first request created the bucket; retry as an update
+        else:
+            return 0.0
+        return 0.0 if bucket['allowed'] else _retry_after(bucket['tokens'], limit)
+
+    async def give_back(self, key: str, limit: RateLimit):
+        await self._collection.update_one(
+            {"key": key},
+            [{"$set": {"tokens": {"$min": [float(limit.capacity), {"$add": ["$tokens", 1]}]}}}]
+        )
+
+    async def ensure_indexes(self):
+        await self._collection.create_index("key", unique=True)
+        await self._collection.create_index("expires_at", expireAfterSeconds=0)
+
+
+async def check(limiter, scope: str, limits: Tuple[RateLimit, RateLimit],
+                client_ip: Optional[str], identity: Optional[str] = None) -> float:
+    """
+    Take a token from the per-IP and the per-identity bucket of `scope`.
+    Returns 0 when allowed, else the Retry-After seconds. When the identity
+    bucket rejects the request, the IP token is given back.
+    """
+    ip_limit, identity_limit = limits
+    ip_key = f"{scope}:ip:{client_ip}"
+    retry_after = 0.0
+    try:
+        if client_ip:
+            retry_after = await limiter.take(ip_key, ip_limit)
+        if identity and not retry_after:
+            retry_after = await limiter.take(f"{scope}:id:{identity}", identity_limit)
+            if retry_after and client_ip:
+                await limiter.give_back(ip_key, ip_limit)
+    except Exception as e:
+        logger.warning(f"[RATE_LIMIT] {scope} check failed, allowing request: {e}")
+        return 0.0
+    if retry_after:
+        logger.info(f"[RATE_LIMIT] {scope} limited (ip={client_ip}, identity={identity})")
+    return retry_after
+
+
+def forwarded_client_ip(forwarded_for: Optional[str], peer: Optional[str], trusted_proxies: int) -> Optional[str]:
+    """
+    Client address behind `trusted_proxies` reverse proxies. Each proxy
+    appends the address it received the request from to X-Forwarded-For, so
+    the client is the trusted_proxies-th hop from the right; hops further
+    left were sent by the client. Without proxies (or header) the peer is used.
+    """
+    if trusted_proxies <= 0 or not forwarded_for:
+        return peer
+    hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+    if not hops:
+        return peer
+    return hops[-min(trusted_proxies, len(hops))]
+
+
+def create_rate_limiter(kind: str, db):
+    if kind == "mongo":
+        return MongoRateLimiter(db)
+    return MemoryRateLimiter()
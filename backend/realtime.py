@@ -0,0 +1,185 @@
+"""
+Real-time push for exchange chat and status changes.
+
+Every user has one channel ("user:<id>"). Mutation paths publish small
+events (new message, confirmation, new exchange) to the participants'
+channels; the SSE endpoint streams a user's channel to each open client.
+
+RealtimeHub keeps the local subscriber queues. Delivery goes through a
+pluggable broker so several workers can fan out:
+- LocalBroker: in-process only (single worker, tests).
+- MongoBroker: a capped collection tailed by every worker; an event
+  published on one worker reaches subscribers connected to any worker.
+
+Configured with REALTIME_BROKER=local|mongo (default local).
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from pymongo import CursorType
+
+logger = logging.getLogger(__name__)
+
+# Events kept per subscriber before the oldest are dropped (slow clients)
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Seconds between SSE keep-alive comments
+HEARTBEAT_SECONDS = 15
+
+Deliver = Callable[[str, dict], Awaitable[None]]
+
+
+def user_channel(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+class LocalBroker:
+    """Delivers published events straight back to this process."""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def stop(self):
+        self._deliver = None
+
+    async def publish(self, channel: str, event: dict):
+        if self._deliver is not None:
+            await self._deliver(channel, event)
+
+
+class MongoBroker:
+    """
+    Fan-out through a capped collection. Every worker tails it and delivers
+    each event to its own local subscribers (including the publisher's).
+    """
+
+    def __init__(self, db, collection: str = "realtime_events", size_bytes: int = 16 * 1024 * 1024):
+        self._db = db
+        self._name = collection
+        self._size_bytes = size_bytes
+        self._task: Optional[asyncio.Task] = None
+
+    async def _ensure_collection(self):
+        if self._name not in await self._db.list_collection_names():
+            try:
+                await self._db.create_collection(self._name, capped=True, size=self._size_bytes)
+            except Exception as e:
+                # Another worker created it first
+                logger.debug(f"[REALTIME] create_collection: {e}")
+
+    async def start(self, deliver: Deliver):
+        await self._ensure_collection()
+        self._task = asyncio.create_task(self._tail(deliver))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def publish(self, channel: str, event: dict):
+        await self._db[self._name].insert_one({
+            "channel": channel,
+            "event": event,
+            "published_at": datetime.now(timezone.utc)
+        })
+
+    async def _tail(self, deliver: Deliver):
+        collection = self._db[self._name]
+        # Only events published after this worker started
+        last = await collection.find_one({}, sort=[("$natural", -1)], projection={"_id": 1})
+        last_id = last["_id"] if last else None
+        while True:
+            try:
+                query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+                cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for doc in cursor:
+                        last_id = doc["_id"]
+                        await deliver(doc["channel"], doc["event"])
+                    await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[REALTIME] Tailing {self._name} failed, retrying: {e}")
+            await asyncio.sleep(1)
+
+
+class RealtimeHub:
+    """Local subscriber registry plus publishing through the broker."""
+
+    def __init__(self, broker=None):
+        self.broker = broker or LocalBroker()
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    async def start(self):
+        await self.broker.start(self._deliver)
+
+    async def stop(self):
+        await self.broker.stop()
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(user_channel(user_id), set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        channel = user_channel(user_id)
+        queues = self._subscribers.get(channel)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[channel]
+
+    def subscriber_count(self, user_id: str) -> int:
+        return len(self._subscribers.get(user_channel(user_id), ()))
+
+    async def publish(self, user_ids: Iterable[str], event_type: str, data: dict):
+        """
+        Send an event to every given user. Never raises: push is best effort
+        and clients still catch up through the regular endpoints.
+        """
+        event = {"type": event_type, "data": data}
+        for user_id in dict.fromkeys(user_ids):
+            try:
+                await self.broker.publish(user_channel(user_id), event)
+            except Exception as e:
+                logger.warning(f"[REALTIME] Could not publish {event_type} to {user_id}: {e}")
+
+    async def _deliver(self, channel: str, event: dict):
+        for queue in list(self._subscribers.get(channel, ())):
+            if queue.full():
+                queue.get_nowait()  # Drop the oldest event for slow clients
+            queue.put_nowait(event)
+
+
+def format_sse(event: dict) -> str:
+    """Serialize an event as a Server-Sent Events frame."""
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+async def stream_events(hub: RealtimeHub, user_id: str):
+    """Async generator of SSE frames for one client until it disconnects."""
+    queue = hub.subscribe(user_id)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield format_sse(event)
+    finally:
+        hub.unsubscribe(user_id, queue)
+
+
+def create_broker(kind: str, db):
+    if kind == "mongo":
+        return MongoBroker(db)
+    return LocalBroker()
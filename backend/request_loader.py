@@ -0,0 +1,149 @@
+"""
+Request-scoped, DataLoader-style document loaders.
+
+A single request often needs the same user, reputation, album or activation
+several times (helpers call helpers that each do their own find_one). Each
+request gets one RequestLoaders instance (set by RequestScopeMiddleware):
+- loads issued in the same event-loop tick are batched into one $in query,
+- repeated loads are served from memory for the rest of the request.
+
+Loaded documents are shared within the request. Code that writes a document
+must update the returned dict in place or call clear() so later loads in the
+same request do not see stale data.
+"""
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+BatchFn = Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]]
+
+
+class BatchLoader:
+    """Coalesces load(key) calls into one batch_fn(keys) call per loop tick."""
+
+    def __init__(self, batch_fn: BatchFn):
+        self._batch_fn = batch_fn
+        self._cache: Dict[Hashable, asyncio.Future] = {}
+        # (key, future) queued for the next batch; the future is captured here
+        # because prime()/clear() may replace or drop the cache entry meanwhile
+        self._pending: List[Tuple[Hashable, asyncio.Future]] = []
+
+    async def load(self, key: Hashable) -> Any:
+        """Value for key (None if not found)."""
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._cache[key] = future
+            self._pending.append((key, future))
+            if len(self._pending) == 1:
+                # Runs after every task already scheduled in this tick has queued its keys
+                loop.call_soon(self._dispatch)
+        # Shielded: one cancelled caller must not cancel the shared result
+        return await asyncio.shield(future)
+
+    async def load_many(self, keys: Iterable[Hashable]) -> List[Any]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key: Hashable, value: Any):
+        """Store a value obtained elsewhere (e.g. a document just inserted)."""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+        self._cache[key] = future
+
+    def clear(self, key: Hashable):
+        """Forget a key so the next load reads the database again."""
+        self._cache.pop(key, None)
+
+    def _dispatch(self):
+        futures, self._pending = self._pending, []
+        asyncio.ensure_future(self._run(futures))
+
+    async def _run(self, futures: List[Tuple[Hashable, asyncio.Future]]):
+        try:
+            results = await self._batch_fn([key for key, _ in futures])
+        except Exception as e:
+            for key, future in futures:
+                if not future.done():
+                    future.set_exception(e)
+                    # Failed loads are retried by the next caller
+                    if self._cache.get(key) is future:
+                        del self._cache[key]
+            return
+        for key, future in futures:
+            if not future.done():
+                future.set_result(results.get(key))
+
+
+class RequestLoaders:
+    """The loaders available to one request."""
+
+    def __init__(self, db):
+        self._db = db
+        self.users = BatchLoader(self._load_users)
+        self.reputations = BatchLoader(self._load_reputations)
+        self.albums = BatchLoader(self._load_albums)
+        self.activations = BatchLoader(self._load_activations)  # key: (user_id, album_id)
+        self.activation_counts = BatchLoader(self._load_activation_counts)
+
+    async def _by_field(self, collection: str, field: str, keys: List[str]) -> Dict[str, dict]:
+        docs = await self._db[collection].find({field: {"$in": keys}}, {"_id": 0}).to_list(None)
+        return {doc[field]: doc for doc in docs}
+
+    async def _load_users(self, user_ids: List[str]) -> Dict[str, dict]:
+        return await self._by_field("users", "id", user_ids)
+
+    async def _load_reputations(self, user_ids: List[str]) -> Dict[str, dict]:
+        return await self._by_field("user_reputation", "user_id", user_ids)
+
+    async def _load_albums(self, album_ids: List[str]) -> Dict[str, dict]:
+        return await self._by_field("albums", "id", album_ids)
+
+    async def _load_activations(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], dict]:
+        wanted = set(keys)
+        docs = await self._db.user_album_activations.find({
+            "user_id": {"$in": list({k[0] for k in keys})},
+            "album_id": {"$in": list({k[1] for k in keys})}
+        }, {"_id": 0}).to_list(None)
+        return {
+            (doc['user_id'], doc['album_id']): doc
+            for doc in docs if (doc['user_id'], doc['album_id']) in wanted
+        }
+
+    async def _load_activation_counts(self, user_ids: List[str]) -> Dict[str, int]:
+        rows = await self._db.user_album_activations.aggregate([
+            {"$match": {"user_id": {"$in": user_ids}}},
+            {"$group": {"_id": "$user_id", "count": {"$sum": 1}}}
+        ]).to_list(None)
+        counts = {uid: 0 for uid in user_ids}
+        counts.update({row['_id']: row['count'] for row in rows})
+        return counts
+
+
+_current: ContextVar[Optional[RequestLoaders]] = ContextVar("request_loaders", default=None)
+
+
+def get_loaders(db) -> RequestLoaders:
+    """Loaders of the current request, or fresh (uncached) ones outside a request."""
+    loaders = _current.get()
+    if loaders is None:
+        loaders = RequestLoaders(db)
+    return loaders
+
+
+class RequestScopeMiddleware:
+    """ASGI middleware giving every HTTP request its own RequestLoaders."""
+
+    def __init__(self, app, db):
+        self.app = app
+        self.db = db
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _current.set(RequestLoaders(self.db))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
@@ -1,7 +1,10 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Body
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Body, Response, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
 import logging
 from pathlib import Path
@@ -9,6 +12,10 @@ from typing import List, Optional
 from datetime import datetime, timedelta, timezone
 import json
 import re
+import asyncio
+import base64
+import heapq
+import math
 from uuid import uuid4
 
 from models import (
@@ -17,9 +24,10 @@ from models import (
     Album, Group, GroupMember, GroupCreate,
     EmailInvite, EmailInviteCreate, EmailInviteAccept,
     Sticker, UserInventory, InventoryUpdate,
+    InventoryBatchItem, InventoryBatchUpdate, GroupInventoryBatchUpdate,
     Offer, OfferCreate, OfferUpdate, OfferItem,
     Chat, ChatMessage,
-    Exchange, ExchangeCreate, ExchangeConfirm, 
+    Exchange, ExchangeCreate, ExchangeConfirm, exchange_pair_key,
     UserReputation, EXCHANGE_FAILURE_REASONS, EXCHANGE_FAILURE_REASONS_MINOR, EXCHANGE_FAILURE_REASONS_SERIOUS,
     REPUTATION_CONSECUTIVE_FAIL_THRESHOLD, REPUTATION_TOTAL_FAIL_THRESHOLD,
     ALLOWED_RADIUS_VALUES, LOCATION_CHANGE_COOLDOWN_DAYS, RADIUS_CHANGE_COOLDOWN_DAYS, CURRENT_TERMS_VERSION,
@@ -30,13 +38,31 @@ from location_data import (
     COUNTRIES, REGIONS, get_country_name, get_regions_for_country,
     get_cities_for_country, search_places
 )
-from math import radians, cos, sin, asin, sqrt
 from datetime import timedelta
 from email_service import (
     generate_otp_code, generate_invite_code, hash_otp, verify_otp_hash,
-    send_otp_email, send_invite_email, check_resend_config, send_terms_acceptance_email
+    send_otp_email, send_invite_email, check_resend_config, send_terms_acceptance_email,
+    get_email_provider
+)
+from auth import create_token, create_stream_token, decode_stream_token, get_current_user, CurrentUser, STREAM_TOKEN_TTL_SECONDS
+from match_engine import compare
+import match_index
+import catalog_cache
+import db_indexes
+import album_counters
+from realtime import RealtimeHub, create_broker, stream_events
+from otp_store import MongoOTPStore, create_otp_store
+from email_dispatcher import EmailDispatcher
+import rate_limit
+from rate_limit import MongoRateLimiter, RateLimit, create_rate_limiter, forwarded_client_ip
+import change_feed
+import chat_quota
+import exchange_expiry
+from request_loader import RequestScopeMiddleware, get_loaders
+from geo import (
+    haversine_distance, get_user_coordinates, build_location_point,
+    within_radius_query, filter_within_radius, candidate_distances, LOCATION_POINT_FIELD
 )
-from auth import create_token, get_current_user
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -50,6 +76,27 @@ db = client[os.environ['DB_NAME']]
 # ============================================
 DEV_MODE = os.environ.get('DEV_MODE', 'false').lower() == 'true'
 # DEV_OTP_MODE is REMOVED - OTP should NEVER be shown in UI
+# Push fan-out: 'local' (single worker) or 'mongo' (shared broker for several workers)
+REALTIME_BROKER = os.environ.get('REALTIME_BROKER', 'local').lower()
+# OTP storage: 'mongo' (shared by all workers) or 'memory' (single worker)
+OTP_STORE_BACKEND = os.environ.get('OTP_STORE_BACKEND', 'mongo').lower()
+# Wrong codes allowed per OTP before a new one must be requested
+MAX_OTP_ATTEMPTS = 5
+# Rate limit buckets: 'memory' (single worker) or 'mongo' (shared by all workers)
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory').lower()
+# Off by default in DEV_MODE (e2e suites create many users from one IP)
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', str(not DEV_MODE)).lower() == 'true'
+# Reverse proxies in front of the API that append to X-Forwarded-For (the ingress)
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', '1'))
+
+# (per client IP, per identity) token buckets for abuse-prone endpoints
+RATE_LIMITS = {
+    "send_otp": (RateLimit(capacity=10, per_seconds=600), RateLimit(capacity=3, per_seconds=600)),
+    "group_invite": (RateLimit(capacity=30, per_seconds=3600), RateLimit(capacity=20, per_seconds=3600)),
+    "chat_message": (RateLimit(capacity=120, per_seconds=60), RateLimit(capacity=30, per_seconds=60)),
+}
+# Seconds between exchange expiry sweeps (0 disables the in-process sweeper)
+EXCHANGE_SWEEP_INTERVAL = int(os.environ.get('EXCHANGE_SWEEP_INTERVAL', str(exchange_expiry.SWEEP_INTERVAL_SECONDS)))
 
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
@@ -60,24 +107,194 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# OTP storage (in production, use Redis with TTL)
-OTP_STORE = {}  # {email: {hash: str, expires: datetime}}
+# Real-time push hub (see realtime.py)
+realtime_hub = RealtimeHub(create_broker(REALTIME_BROKER, db))
+
+async def emit_user_event(user_ids: list, event_type: str, data: dict):
+    """
+    Record an event in each user's change feed (GET /me/changes) and push it
+    to their open real-time streams. Best effort - never fails the request.
+    """
+    await change_feed.record(db, user_ids, event_type, data)
+    await realtime_hub.publish(user_ids, event_type, data)
+
+exchange_sweeper_task: Optional[asyncio.Task] = None
+match_index_build_task: Optional[asyncio.Task] = None
+
+@app.exception_handler(match_index.IndexBuilding)
+async def match_index_building_handler(request: Request, exc: match_index.IndexBuilding):
+    # First build of an album's match index is still running; ask the client to retry
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Matches are being prepared, please retry shortly"},
+        headers={"Retry-After": "5"}
+    )
+
+async def notify_expired_exchanges(exchanges: list):
+    """Tell both participants of each swept exchange that it expired."""
+    for exchange in exchanges:
+        await emit_user_event(
+            [exchange['user_a_id'], exchange['user_b_id']],
+            "exchange_updated",
+            {"exchange_id": exchange['id'], "album_id": exchange.get('album_id'), "status": "expired"}
+        )
+
+# Pending OTPs, shared by every worker by default (see otp_store.py)
+otp_store = create_otp_store(OTP_STORE_BACKEND, db)
+
+# Outgoing email: queued and sent from a worker pool (see email_dispatcher.py)
+email_dispatcher = EmailDispatcher(get_email_provider())
+
+# Token buckets (see rate_limit.py)
+rate_limiter = create_rate_limiter(RATE_LIMIT_BACKEND, db)
+
+def get_client_ip(request: Request) -> Optional[str]:
+    """Client address as seen by the outermost trusted proxy (see rate_limit.forwarded_client_ip)."""
+    return forwarded_client_ip(
+        request.headers.get('x-forwarded-for'),
+        request.client.host if request.client else None,
+        TRUSTED_PROXY_COUNT
+    )
+
+async def enforce_rate_limit(scope: str, request: Request, identity: Optional[str] = None):
+    """Raise 429 with Retry-After when the IP or identity bucket for `scope` is empty."""
+    if not RATE_LIMIT_ENABLED:
+        return
+    retry_after = await rate_limit.check(rate_limiter, scope, RATE_LIMITS[scope], get_client_ip(request), identity)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="RATE_LIMITED",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+def rate_limited(scope: str):
+    """Dependency for authenticated endpoints: per-IP and per-user buckets."""
+    async def dependency(request: Request, user_id: str = Depends(get_current_user)):
+        await enforce_rate_limit(scope, request, user_id)
+    return dependency
+
+async def backfill_pending_pair_keys() -> int:
+    """
+    Set pair_key on pending exchanges that lack it (see migrate_exchange_pair_keys.py,
+    which also resolves duplicate pending exchanges). Returns the number updated.
+    """
+    ops = []
+    async for exchange in db.exchanges.find(
+        {"status": "pending", "pair_key": {"$exists": False}},
+        {"_id": 0, "id": 1, "album_id": 1, "user_a_id": 1, "user_b_id": 1}
+    ):
+        pair_key = exchange_pair_key(exchange['album_id'], exchange['user_a_id'], exchange['user_b_id'])
+        ops.append(UpdateOne({"id": exchange['id'], "pair_key": {"$exists": False}}, {"$set": {"pair_key": pair_key}}))
+    if not ops:
+        return 0
+    try:
+        result = await db.exchanges.bulk_write(ops, ordered=False)
+        return result.modified_count
+    except BulkWriteError as e:
+        # Two legacy pending exchanges for one pair: the unique index keeps the
+        # second without a key until the migration expires the duplicate
+        logger.warning(f"{len(e.details.get('writeErrors', []))} duplicate pending exchanges "
+                       f"need migrate_exchange_pair_keys.py")
+        return e.details.get('nModified', 0)
 
 # Check email service configuration on startup
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting MisFigus API server...")
     check_resend_config()
+    await email_dispatcher.start()
+    
+    # Pending exchanges created before pair_key existed must have one, or the
+    # pair_key lookup (and its partial unique index) misses them
+    try:
+        backfilled = await backfill_pending_pair_keys()
+        if backfilled:
+            logger.info(f"Added pair_key to {backfilled} pending exchanges")
+    except Exception as e:
+        logger.warning(f"Could not backfill exchange pair keys: {e}")
+    
+    # Declared indexes for every hot query (unique users.email, 2dsphere, ...)
+    try:
+        summary = await db_indexes.reconcile(db)
+        logger.info(
+            f"Indexes reconciled: {len(summary['created'])} created, "
+            f"{len(summary['conflicts'])} conflicts, {len(summary['failed'])} failed"
+        )
+    except Exception as e:
+        logger.warning(f"Could not reconcile indexes: {e}")
+    
+    # Indexes backing the persisted match-candidate index
+    try:
+        await match_index.ensure_indexes(db)
+    except Exception as e:
+        logger.warning(f"Could not create match index indexes: {e}")
+    
+    # Per-album member counters (albums that predate them are counted once)
+    try:
+        await album_counters.ensure_indexes(db)
+        await album_counters.backfill(db)
+    except Exception as e:
+        logger.warning(f"Could not backfill album counters: {e}")
+    
+    # Sticker catalogs are served from memory; load them once up front
+    try:
+        await catalog_cache.ensure_indexes(db)
+        album_count = await catalog_cache.warm(db)
+        logger.info(f"Sticker catalog cache warmed for {album_count} albums")
+    except Exception as e:
+        logger.warning(f"Could not warm sticker catalog cache: {e}")
+    
+    # Shared OTP store (TTL removes expired codes)
+    if isinstance(otp_store, MongoOTPStore):
+        try:
+            await otp_store.ensure_indexes()
+        except Exception as e:
+            logger.warning(f"Could not create OTP store indexes: {e}")
+    
+    # Shared rate limit buckets (TTL removes idle ones)
+    if isinstance(rate_limiter, MongoRateLimiter):
+        try:
+            await rate_limiter.ensure_indexes()
+        except Exception as e:
+            logger.warning(f"Could not create rate limit indexes: {e}")
+    
+    # Daily chat quotas
+    try:
+        await chat_quota.ensure_indexes(db)
+    except Exception as e:
+        logger.warning(f"Could not create chat quota indexes: {e}")
+    
+    # Per-user change feed
+    try:
+        await change_feed.ensure_indexes(db)
+    except Exception as e:
+        logger.warning(f"Could not create change feed indexes: {e}")
     
-    # Ensure unique index on email to prevent duplicate users
+    # Real-time push channel
     try:
-        await db.users.create_index("email", unique=True, sparse=True)
-        logger.info("Unique index on users.email ensured")
+        await realtime_hub.start()
+        logger.info(f"Realtime hub started ({REALTIME_BROKER} broker)")
     except Exception as e:
-        logger.warning(f"Could not create unique index on email: {e}")
+        logger.warning(f"Could not start realtime hub: {e}")
+    
+    # Build missing/stale match indexes off the request path (claimed per album)
+    global match_index_build_task
+    match_index_build_task = asyncio.create_task(match_index.build_stale_albums(db))
+    
+    # Background expiry of overdue pending exchanges
+    global exchange_sweeper_task
+    if EXCHANGE_SWEEP_INTERVAL > 0:
+        exchange_sweeper_task = asyncio.create_task(
+            exchange_expiry.run_forever(db, notify_expired_exchanges, EXCHANGE_SWEEP_INTERVAL)
+        )
     
     logger.info("Server startup complete")
 
+async def get_current_user_context(user_id: str = Depends(get_current_user)) -> CurrentUser:
+    """Auth plus the user document, loaded lazily through the request's user loader."""
+    return CurrentUser(user_id, get_loaders(db).users.load)
+
 # ============================================
 # HELPER: Validate group membership
 # ============================================
@@ -158,26 +375,8 @@ def is_test_user(user: dict) -> bool:
     return False
 
 # ============================================
-# HELPER: Haversine distance calculation
+# HELPER: Distance / radius checks (haversine lives in geo.py)
 # ============================================
-def haversine_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
-    """
-    Calculate the great-circle distance between two points in kilometers.
-    Used for proximity-based exchange matching.
-    """
-    # Convert to radians
-    lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
-    
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlng = lng2 - lng1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlng/2)**2
-    c = 2 * asin(sqrt(a))
-    
-    # Earth's radius in kilometers
-    r = 6371
-    return c * r
-
 def is_within_radius(user1: dict, user2: dict, radius_km: int) -> bool:
     """
     Check if two users are within the specified radius of each other.
@@ -186,16 +385,14 @@ def is_within_radius(user1: dict, user2: dict, radius_km: int) -> bool:
     Returns True if either user has no location set (backward compatibility).
     """
     # Try new structured fields first, fall back to legacy
-    lat1 = user1.get('latitude') or user1.get('location_lat')
-    lng1 = user1.get('longitude') or user1.get('location_lng')
-    lat2 = user2.get('latitude') or user2.get('location_lat')
-    lng2 = user2.get('longitude') or user2.get('location_lng')
+    coords1 = get_user_coordinates(user1)
+    coords2 = get_user_coordinates(user2)
     
     # If either user has no location, allow matching (backward compatibility)
-    if lat1 is None or lng1 is None or lat2 is None or lng2 is None:
+    if coords1 is None or coords2 is None:
         return True
     
-    distance = haversine_distance(lat1, lng1, lat2, lng2)
+    distance = haversine_distance(*coords1, *coords2)
     return distance <= radius_km
 
 def user_has_valid_location(user: dict) -> bool:
@@ -349,29 +546,29 @@ def get_terms_content(language: str = 'es') -> str:
 # AUTH ENDPOINTS (OTP never shown in UI)
 # ============================================
 @api_router.post("/auth/send-otp")
-async def send_otp(user_input: UserCreate):
+async def send_otp(user_input: UserCreate, request: Request):
     """
     Send OTP via email. OTP is NEVER returned in response.
     Email is normalized (trim + lowercase) to prevent duplicate users.
+    Rate limited per client IP and per email.
     """
     # Normalize email: trim whitespace and convert to lowercase
     normalized_email = user_input.email.strip().lower()
     
+    await enforce_rate_limit("send_otp", request, normalized_email)
+    
     otp = generate_otp_code()
     otp_hash = hash_otp(otp)
     
-    # Store hashed OTP with expiry (using normalized email)
-    OTP_STORE[normalized_email] = {
-        "hash": otp_hash,
-        "expires": datetime.now(timezone.utc) + timedelta(minutes=10)
-    }
+    # Store hashed OTP with expiry (using normalized email); replaces any previous code
+    await otp_store.put(normalized_email, otp_hash, datetime.now(timezone.utc) + timedelta(minutes=10))
     
     # Check if user exists (using normalized email)
     # Do NOT create user here - only create on successful OTP verification
     user = await db.users.find_one({"email": normalized_email}, {"_id": 0})
     
     # Send OTP via email (logged to console if Resend not configured)
-    success, status = send_otp_email(normalized_email, otp)
+    success, status = await send_otp_email(email_dispatcher, normalized_email, otp)
     
     # Check DEV mode
     dev_mode = os.environ.get('DEV_MODE', 'false').lower() == 'true'
@@ -411,20 +608,23 @@ async def verify_otp_endpoint(otp_data: OTPVerify):
     # Normalize email: trim whitespace and convert to lowercase
     normalized_email = otp_data.email.strip().lower()
     
-    stored = OTP_STORE.get(normalized_email)
+    # Counts this attempt atomically (the limit holds across workers)
+    stored = await otp_store.attempt(normalized_email)
     
     if not stored:
         raise HTTPException(status_code=400, detail="No OTP requested for this email")
     
-    if datetime.now(timezone.utc) > stored['expires']:
-        del OTP_STORE[normalized_email]
+    # Too many wrong codes: the OTP is burned, a new one must be requested
+    if datetime.now(timezone.utc) > stored['expires'] or stored['attempts'] > MAX_OTP_ATTEMPTS:
+        await otp_store.delete(normalized_email)
         raise HTTPException(status_code=400, detail="OTP expired")
     
     if not verify_otp_hash(otp_data.otp, stored['hash']):
         raise HTTPException(status_code=400, detail="Invalid OTP")
     
-    # Clear used OTP
-    del OTP_STORE[normalized_email]
+    # Clear used OTP (single use: only one concurrent verification wins)
+    if not await otp_store.consume(normalized_email, stored['hash']):
+        raise HTTPException(status_code=400, detail="OTP expired")
     
     # Find or create user (using normalized email)
     user = await db.users.find_one({"email": normalized_email}, {"_id": 0})
@@ -464,8 +664,8 @@ async def verify_otp_endpoint(otp_data: OTPVerify):
     return {"token": token, "user": user}
 
 @api_router.get("/auth/me")
-async def get_me(user_id: str = Depends(get_current_user)):
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+async def get_me(current_user: CurrentUser = Depends(get_current_user_context)):
+    user = await current_user.load()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -520,6 +720,7 @@ async def complete_onboarding(onboarding_data: OnboardingComplete, user_id: str
         "place_id": onboarding_data.place_id,
         "latitude": onboarding_data.latitude,
         "longitude": onboarding_data.longitude,
+        LOCATION_POINT_FIELD: build_location_point(onboarding_data.latitude, onboarding_data.longitude),
         "neighborhood_text": onboarding_data.neighborhood_text,
         # Radius
         "radius_km": onboarding_data.radius_km,
@@ -533,15 +734,8 @@ async def complete_onboarding(onboarding_data: OnboardingComplete, user_id: str
     
     await db.users.update_one({"id": user_id}, {"$set": update_fields})
     
-    # Send terms acceptance email (non-blocking)
-    try:
-        send_terms_acceptance_email(
-            user.get('email'),
-            onboarding_data.terms_version,
-            now
-        )
-    except Exception as e:
-        logger.warning(f"Failed to send terms acceptance email: {e}")
+    # Send terms acceptance email (queued, non-blocking)
+    send_terms_acceptance_email(email_dispatcher, user.get('email'), onboarding_data.terms_version, now)
     
     updated_user = await db.users.find_one({"id": user_id}, {"_id": 0})
     return {"message": "Onboarding completed", "user": updated_user}
@@ -550,73 +744,47 @@ async def complete_onboarding(onboarding_data: OnboardingComplete, user_id: str
 # FREEMIUM PLAN ENDPOINTS
 # ============================================
 
-def get_today_date_str():
-    """Get today's date as YYYY-MM-DD string."""
-    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
-
-async def check_and_reset_daily_matches(user_id: str):
-    """
-    Check if the user's daily match counter needs reset.
-    Returns the updated user data.
-    """
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
-    if not user:
-        return None
-    
-    today = get_today_date_str()
-    user_date = user.get('matches_used_date')
-    
-    # Reset if date has changed or never set
-    if user_date != today:
-        await db.users.update_one(
-            {"id": user_id},
-            {"$set": {"matches_used_today": 0, "matches_used_date": today}}
-        )
-        user['matches_used_today'] = 0
-        user['matches_used_date'] = today
-    
-    return user
-
-async def can_user_create_match(user_id: str):
+def daily_chat_limit(plan: str) -> Optional[int]:
     """
-    Check if user can create a new match based on their plan.
-    Returns (can_create: bool, reason: str, user: dict)
+    New chats per day allowed by a plan (None = no limit).
     
     Plans:
     - free: 1 new chat per day
     - plus: 5 new chats per day
     - unlimited: no limits
     """
-    user = await check_and_reset_daily_matches(user_id)
-    if not user:
-        return False, "USER_NOT_FOUND", None
-    
-    plan = user.get('plan', 'free')
-    matches_used = user.get('matches_used_today', 0)
-    
-    # Unlimited plan has no limits
     if plan == 'unlimited':
-        return True, None, user
-    
-    # Plus plan: 5 chats per day
+        return None
     if plan == 'plus':
-        if matches_used >= PLUS_PLAN_MAX_CHATS_PER_DAY:
-            return False, "DAILY_MATCH_LIMIT", user
-        return True, None, user
+        return PLUS_PLAN_MAX_CHATS_PER_DAY
+    return FREE_PLAN_MAX_CHATS_PER_DAY
+
+async def consume_daily_chat(user_id: str) -> bool:
+    """
+    Take one new chat from the user's daily quota in a single atomic write
+    (see chat_quota.py). Raises 403 DAILY_MATCH_LIMIT when the quota is used up.
+    Returns True if a chat was taken (False for plans without a limit).
+    """
+    user = await get_loaders(db).users.load(user_id)
+    if not user:
+        raise HTTPException(status_code=400, detail="USER_NOT_FOUND")
     
-    # Free plan: 1 chat per day
-    if matches_used >= FREE_PLAN_MAX_CHATS_PER_DAY:
-        return False, "DAILY_MATCH_LIMIT", user
+    limit = daily_chat_limit(user.get('plan', 'free'))
+    if limit is None:
+        return False
     
-    return True, None, user
-
-async def increment_user_match_count(user_id: str):
-    """Increment the user's daily match counter."""
-    today = get_today_date_str()
-    await db.users.update_one(
-        {"id": user_id},
-        {"$inc": {"matches_used_today": 1}, "$set": {"matches_used_date": today}}
-    )
+    allowed, used = await chat_quota.consume(db, user_id, limit)
+    if not allowed:
+        raise HTTPException(
+            status_code=403,
+            detail={
+                "code": "DAILY_MATCH_LIMIT",
+                "message": "You have reached your daily chat limit. Upgrade your plan for more chats.",
+                "matches_used": used,
+                "limit": limit
+            }
+        )
+    return True
 
 async def can_user_activate_album(user_id: str):
     """
@@ -628,15 +796,16 @@ async def can_user_activate_album(user_id: str):
     - plus: 2 albums max
     - unlimited: no limits
     """
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    loaders = get_loaders(db)
+    user, active_count = await asyncio.gather(
+        loaders.users.load(user_id),
+        loaders.activation_counts.load(user_id)  # Count currently active albums
+    )
     if not user:
         return False, "USER_NOT_FOUND", 0
     
     plan = user.get('plan', 'free')
     
-    # Count currently active albums
-    active_count = await db.user_album_activations.count_documents({"user_id": user_id})
-    
     # Unlimited plan has no limits
     if plan == 'unlimited':
         return True, None, active_count
@@ -657,35 +826,33 @@ async def can_user_activate_album(user_id: str):
 async def get_plan_status(user_id: str = Depends(get_current_user)):
     """
     Get user's current plan status and usage.
-    Includes daily match reset check.
+    Daily chat usage comes from today's quota doc (resets by date).
     
     Plans: free, plus, unlimited
     """
-    user = await check_and_reset_daily_matches(user_id)
+    # User, today's chat usage and active album count are fetched concurrently
+    user, matches_used, active_albums = await asyncio.gather(
+        get_loaders(db).users.load(user_id),
+        chat_quota.get_used(db, user_id),
+        get_loaders(db).activation_counts.load(user_id)
+    )
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     plan = user.get('plan', 'free')
     plan_type = user.get('plan_type', 'monthly')  # 'monthly' or 'annual'
     
-    # Count active albums
-    active_albums = await db.user_album_activations.count_documents({"user_id": user_id})
-    
     # Determine limits based on plan
+    chats_limit = daily_chat_limit(plan)
+    can_match = chats_limit is None or matches_used < chats_limit
     if plan == 'unlimited':
-        chats_limit = None
         albums_limit = None
-        can_match = True
         can_activate = True
     elif plan == 'plus':
-        chats_limit = PLUS_PLAN_MAX_CHATS_PER_DAY
         albums_limit = PLUS_PLAN_MAX_ALBUMS
-        can_match = user.get('matches_used_today', 0) < PLUS_PLAN_MAX_CHATS_PER_DAY
         can_activate = active_albums < PLUS_PLAN_MAX_ALBUMS
     else:  # free
-        chats_limit = FREE_PLAN_MAX_CHATS_PER_DAY
         albums_limit = FREE_PLAN_MAX_ALBUMS
-        can_match = user.get('matches_used_today', 0) < FREE_PLAN_MAX_CHATS_PER_DAY
         can_activate = active_albums < FREE_PLAN_MAX_ALBUMS
     
     # Check if user can downgrade (only if 1 or fewer active albums for free)
@@ -698,7 +865,7 @@ async def get_plan_status(user_id: str = Depends(get_current_user)):
         "is_premium": plan in ['plus', 'unlimited'],
         "is_plus": plan == 'plus',
         "is_unlimited": plan == 'unlimited',
-        "matches_used_today": user.get('matches_used_today', 0),
+        "matches_used_today": matches_used,
         "matches_limit": chats_limit,
         "can_match": can_match,
         "active_albums": active_albums,
@@ -726,7 +893,7 @@ async def set_plan(plan: str = "free", plan_type: str = "monthly", user_id: str
     
     # Check if user can downgrade based on active albums
     if plan == 'free':
-        active_albums = await db.user_album_activations.count_documents({"user_id": user_id})
+        active_albums = await get_loaders(db).activation_counts.load(user_id)
         if active_albums > FREE_PLAN_MAX_ALBUMS:
             raise HTTPException(
                 status_code=400,
@@ -738,7 +905,7 @@ async def set_plan(plan: str = "free", plan_type: str = "monthly", user_id: str
                 }
             )
     elif plan == 'plus':
-        active_albums = await db.user_album_activations.count_documents({"user_id": user_id})
+        active_albums = await get_loaders(db).activation_counts.load(user_id)
         if active_albums > PLUS_PLAN_MAX_ALBUMS:
             raise HTTPException(
                 status_code=400,
@@ -770,6 +937,8 @@ async def set_plan(plan: str = "free", plan_type: str = "monthly", user_id: str
             "upgraded_at": now.isoformat() if plan != 'free' else None
         }}
     )
+    get_loaders(db).users.clear(user_id)
+    await emit_user_event([user_id], "plan_changed", {"plan": plan})
     
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
     return {"message": f"Plan changed to {plan}", "user": user}
@@ -879,6 +1048,7 @@ async def update_structured_location(location_data: StructuredLocationUpdate, us
         "place_id": location_data.place_id,
         "latitude": location_data.latitude,
         "longitude": location_data.longitude,
+        LOCATION_POINT_FIELD: build_location_point(location_data.latitude, location_data.longitude),
         "neighborhood_text": location_data.neighborhood_text,
         "location_change_allowed_at": location_next_change,
     }
@@ -931,14 +1101,14 @@ async def update_radius_only(radius_data: RadiusUpdate, user_id: str = Depends(g
     return {"message": "RADIUS_UPDATED", "user": updated_user}
 
 @api_router.get("/me/location-status")
-async def get_structured_location_status(user_id: str = Depends(get_current_user)):
+async def get_structured_location_status(current_user: CurrentUser = Depends(get_current_user_context)):
     """
     Get user's complete location status including:
     - Structured location data
     - Cooldown status (7 days for both location and radius)
     - Whether location is properly configured
     """
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user = await current_user.load()
     if not user:
         raise HTTPException(status_code=404, detail="USER_NOT_FOUND")
     
@@ -1035,25 +1205,18 @@ async def accept_terms(acceptance: TermsAcceptance, user_id: str = Depends(get_c
         }}
     )
     
-    # Send confirmation email (non-blocking)
-    try:
-        send_terms_acceptance_email(
-            user.get('email'),
-            acceptance.version,
-            acceptance_time
-        )
-    except Exception as e:
-        logger.warning(f"Failed to send terms acceptance email: {e}")
+    # Send confirmation email (queued, non-blocking)
+    send_terms_acceptance_email(email_dispatcher, user.get('email'), acceptance.version, acceptance_time)
     
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
     return {"message": "Terms accepted", "user": user}
 
 @api_router.get("/user/terms-status")
-async def get_terms_status(user_id: str = Depends(get_current_user)):
+async def get_terms_status(current_user: CurrentUser = Depends(get_current_user_context)):
     """
     Get user's terms acceptance status.
     """
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user = await current_user.load()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -1083,25 +1246,49 @@ def get_category_key(category: str) -> str:
     """Map Spanish category name to i18n key for frontend translation."""
     return CATEGORY_KEY_MAP.get(category, category.lower().replace(" ", "_"))
 
+async def count_owned_stickers(user_id: str, album_ids: list) -> dict:
+    """Stickers the user owns (owned_qty >= 1) per album with one aggregation."""
+    if not album_ids:
+        return {}
+    rows = await db.user_inventory.aggregate([
+        {"$match": {"user_id": user_id, "album_id": {"$in": album_ids}, "owned_qty": {"$gte": 1}}},
+        {"$group": {"_id": "$album_id", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    return {row['_id']: row['count'] for row in rows}
+
 @api_router.get("/albums")
 async def get_albums(user_id: str = Depends(get_current_user)):
     """
     Get all album templates (catalog) with user-specific state.
+    Built from a fixed number of queries regardless of how many albums are
+    active; sticker totals come from the in-memory catalog cache.
     
     user_state logic:
     - 'coming_soon': album.status == 'coming_soon' (not activatable)
     - 'active': user has activated this album
     - 'inactive': available but user hasn't activated yet
     """
-    all_albums = await db.albums.find({}, {"_id": 0}).to_list(100)
-    
-    # Get user's activated albums
-    user_activations = await db.user_album_activations.find(
-        {"user_id": user_id}, 
-        {"_id": 0, "album_id": 1}
-    ).to_list(100)
+    # All albums and the user's activated albums, fetched concurrently
+    all_albums, user_activations = await asyncio.gather(
+        db.albums.find({}, {"_id": 0}).to_list(100),
+        db.user_album_activations.find(
+            {"user_id": user_id}, 
+            {"_id": 0, "album_id": 1}
+        ).to_list(100)
+    )
     activated_album_ids = {a['album_id'] for a in user_activations}
     
+    # Member counts, owned sticker counts and catalogs for ALL active albums at once
+    active_album_ids = [
+        album['id'] for album in all_albums
+        if album['id'] in activated_album_ids and album.get('status') != 'coming_soon'
+    ]
+    member_counts, owned_counts = await asyncio.gather(
+        album_counters.get_member_counts(db, active_album_ids),
+        count_owned_stickers(user_id, active_album_ids)
+    )
+    catalogs = {aid: await catalog_cache.get_catalog(db, aid) for aid in active_album_ids}
+    
     # Compute user_state for each album
     for album in all_albums:
         # Add category_key for i18n translation on frontend (only if not already set in DB)
@@ -1114,16 +1301,12 @@ async def get_albums(user_id: str = Depends(get_current_user)):
             album['user_state'] = 'active'
             album['is_member'] = True
             # Get member count for active albums (excluding current user)
-            member_count = await db.album_members.count_documents({"album_id": album['id']})
+            member_count = member_counts.get(album['id'], 0)
             album['member_count'] = max(0, member_count - 1)  # Exclude current user
             # Calculate progress (rounded to integer - no decimals)
-            sticker_count = await db.stickers.count_documents({"album_id": album['id']})
+            sticker_count = len(catalogs[album['id']])
             if sticker_count > 0:
-                inventory_count = await db.user_inventory.count_documents({
-                    "user_id": user_id,
-                    "album_id": album['id'],
-                    "owned_qty": {"$gte": 1}
-                })
+                inventory_count = owned_counts.get(album['id'], 0)
                 album['progress'] = round(inventory_count / sticker_count * 100)  # Integer
             else:
                 album['progress'] = 0
@@ -1141,7 +1324,7 @@ async def activate_album(album_id: str, user_id: str = Depends(get_current_user)
     Free users can only have 1 active album.
     """
     # Check album exists and is available
-    album = await db.albums.find_one({"id": album_id}, {"_id": 0})
+    album = await get_loaders(db).albums.load(album_id)
     if not album:
         raise HTTPException(status_code=404, detail="Album not found")
     
@@ -1178,6 +1361,7 @@ async def activate_album(album_id: str, user_id: str = Depends(get_current_user)
         "activated_at": datetime.now(timezone.utc).isoformat()
     }
     await db.user_album_activations.insert_one(activation)
+    get_loaders(db).activation_counts.clear(user_id)
     
     # Add user as album member
     member = {
@@ -1187,6 +1371,10 @@ async def activate_album(album_id: str, user_id: str = Depends(get_current_user)
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.album_members.insert_one(member)
+    await album_counters.member_joined(db, album_id)
+    
+    # Add the new member's row to the match index
+    await match_index.member_added(db, album_id, user_id)
     
     return {"message": "Album activated", "album_id": album_id}
 
@@ -1197,7 +1385,7 @@ async def deactivate_album(album_id: str, user_id: str = Depends(get_current_use
     Removes activation record but preserves inventory.
     """
     # Check album exists
-    album = await db.albums.find_one({"id": album_id}, {"_id": 0})
+    album = await get_loaders(db).albums.load(album_id)
     if not album:
         raise HTTPException(status_code=404, detail="Album not found")
     
@@ -1215,12 +1403,18 @@ async def deactivate_album(album_id: str, user_id: str = Depends(get_current_use
         "user_id": user_id,
         "album_id": album_id
     })
+    get_loaders(db).activation_counts.clear(user_id)
     
     # Remove user from album members
-    await db.album_members.delete_one({
+    removed = await db.album_members.delete_one({
         "user_id": user_id,
         "album_id": album_id
     })
+    if removed.deleted_count:
+        await album_counters.member_left(db, album_id)
+    
+    # Drop every match-index pair involving this user
+    await match_index.member_removed(db, album_id, user_id)
     
     return {"message": "Album deactivated", "album_id": album_id}
 
@@ -1242,6 +1436,7 @@ async def get_album(album_id: str, user_id: str = Depends(get_current_user)):
         album['is_member'] = False
         album['progress'] = 0
         album['exchange_count'] = 0
+        album['exchange_count_pending'] = False
         album['pending_exchanges'] = 0
         album['has_unread_exchanges'] = False
     elif activation:
@@ -1249,7 +1444,7 @@ async def get_album(album_id: str, user_id: str = Depends(get_current_user)):
         album['is_member'] = True
         
         # Calculate progress (rounded to integer)
-        sticker_count = await db.stickers.count_documents({"album_id": album_id})
+        sticker_count = len(await catalog_cache.get_catalog(db, album_id))
         if sticker_count > 0:
             inventory_count = await db.user_inventory.count_documents({
                 "user_id": user_id,
@@ -1260,8 +1455,15 @@ async def get_album(album_id: str, user_id: str = Depends(get_current_user)):
         else:
             album['progress'] = 0
         
-        # Calculate exchange count (users with mutual matches in this album)
-        album['exchange_count'] = await compute_album_exchange_count(album_id, user_id)
+        # Calculate exchange count (users with mutual matches in this album).
+        # While the album's first match index build runs the count is unknown:
+        # serve the rest of the page with a null count instead of a 503.
+        try:
+            album['exchange_count'] = await compute_album_exchange_count(album_id, user_id)
+            album['exchange_count_pending'] = False
+        except match_index.IndexBuilding:
+            album['exchange_count'] = None
+            album['exchange_count_pending'] = True
         
         # Count pending exchanges and check for unread messages
         pending_exchanges = await db.exchanges.find({
@@ -1275,27 +1477,16 @@ async def get_album(album_id: str, user_id: str = Depends(get_current_user)):
         
         album['pending_exchanges'] = len(pending_exchanges)
         
-        # Check for unread messages in any pending exchange
+        # Unread messages in any pending exchange: one indexed query on the chat counters
         has_unread = False
-        for exchange in pending_exchanges:
-            chat = await db.chats.find_one({"exchange_id": exchange['id']}, {"_id": 0})
-            if chat:
-                is_user_a = exchange['user_a_id'] == user_id
-                partner_id = exchange['user_b_id'] if is_user_a else exchange['user_a_id']
-                last_read_field = 'user_a_last_read' if is_user_a else 'user_b_last_read'
-                last_read = chat.get(last_read_field)
-                
-                query = {
-                    "chat_id": chat['id'],
-                    "sender_id": partner_id
-                }
-                if last_read:
-                    query["created_at"] = {"$gt": last_read}
-                
-                unread_count = await db.chat_messages.count_documents(query)
-                if unread_count > 0:
-                    has_unread = True
-                    break
+        if pending_exchanges:
+            has_unread = await db.chats.find_one({
+                "exchange_id": {"$in": [e['id'] for e in pending_exchanges]},
+                "$or": [
+                    {"user_a_id": user_id, "user_a_unread": {"$gt": 0}},
+                    {"user_b_id": user_id, "user_b_unread": {"$gt": 0}}
+                ]
+            }, {"_id": 1}) is not None
         
         album['has_unread_exchanges'] = has_unread
     else:
@@ -1303,11 +1494,44 @@ async def get_album(album_id: str, user_id: str = Depends(get_current_user)):
         album['is_member'] = False
         album['progress'] = 0
         album['exchange_count'] = 0
+        album['exchange_count_pending'] = False
         album['pending_exchanges'] = 0
         album['has_unread_exchanges'] = False
     
     return album
 
+# ============================================
+# HELPER: Indexed match candidates
+# ============================================
+async def load_indexed_matches(album_id: str, current_user: dict) -> list:
+    """
+    Read mutual-match partners from the persisted match index, then load their
+    user docs with a single $in query and apply the visibility filters
+    (test/seed users, search radius).
+    The radius is applied in MongoDB via $geoWithin on the 2dsphere index, so
+    distant users are never loaded; the in-process radius check stays as a
+    safety net for users whose location_point has not been migrated yet.
+    Returns a list of (pair, partner_user) tuples.
+    """
+    pairs = await match_index.get_mutual_pairs(db, album_id, current_user['id'])
+    if not pairs:
+        return []
+    
+    user_radius = get_user_radius(current_user)
+    partner_ids = [p['partner_id'] for p in pairs]
+    partner_query = {"id": {"$in": partner_ids}}
+    radius_query = within_radius_query(current_user, user_radius)
+    if radius_query:
+        partner_query.update(radius_query)
+    partners = await db.users.find(partner_query, {"_id": 0}).to_list(None)
+    
+    # Skip test/seed users - they should not appear in exchange suggestions
+    partners = [u for u in partners if not is_test_user(u)]
+    # Check radius in-process too (vectorized), enforced server-side
+    partners_by_id = {u['id']: u for u in filter_within_radius(current_user, partners, user_radius)}
+    
+    return [(pair, partners_by_id[pair['partner_id']]) for pair in pairs if pair['partner_id'] in partners_by_id]
+
 async def compute_album_exchange_count(album_id: str, user_id: str) -> int:
     """
     Compute count of potential exchange partners for this album.
@@ -1315,81 +1539,130 @@ async def compute_album_exchange_count(album_id: str, user_id: str) -> int:
     Filters by user's search radius (proximity-based matching).
     Returns count only, not user details (privacy-preserving).
     EXCLUDES test/seed users from the count.
+    Reads from the match index instead of recomputing every member's inventory.
     """
     # Get current user for radius and location
     current_user = await db.users.find_one({"id": user_id}, {"_id": 0})
     if not current_user:
         return 0
     
+    matches = await load_indexed_matches(album_id, current_user)
+    return len(matches)
+
+# ============================================
+# HELPER: Match ranking and pagination
+# ============================================
+MATCHES_DEFAULT_LIMIT = 20
+MATCHES_MAX_LIMIT = 100
+
+# Lower is better: trusted partners first, restricted last
+REPUTATION_RANK = {"trusted": 0, "new": 1, "under_review": 2, "restricted": 3}
+
+# Sort value for partners without a known distance (no location set)
+UNKNOWN_DISTANCE_KM = 1e9
+
+def encode_match_cursor(key: tuple) -> str:
+    """Opaque cursor for the last returned match (its full ranking key)."""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+def decode_match_cursor(cursor: str) -> tuple:
+    try:
+        swap, distance, rep_rank, partner_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (int(swap), float(distance), int(rep_rank), str(partner_id))
+    except Exception:
+        raise HTTPException(status_code=400, detail="INVALID_CURSOR")
+
+class _RankedMatch:
+    """Heap entry ordered so the WORST ranked match sits at the top (max-heap)."""
+    __slots__ = ("key", "pair", "user")
+    
+    def __init__(self, key: tuple, pair: dict, user: dict):
+        self.key = key
+        self.pair = pair
+        self.user = user
+    
+    def __lt__(self, other):
+        return self.key > other.key
+
+async def load_reputation_statuses(user_ids: list) -> dict:
+    """Reputation status for many users with one $in query ('new' if no record)."""
+    reps = await db.user_reputation.find({"user_id": {"$in": user_ids}}, {"_id": 0}).to_list(None)
+    statuses = {uid: "new" for uid in user_ids}
+    for rep in reps:
+        if rep.get('status') == 'restricted':
+            statuses[rep['user_id']] = 'restricted'
+            continue
+        statuses[rep['user_id']] = calculate_reputation_status(
+            rep.get('successful_exchanges', 0),
+            rep.get('failed_exchanges', 0),
+            rep.get('consecutive_failures', 0)
+        )
+    return statuses
+
+async def rank_album_matches(album_id: str, current_user: dict, limit: int, after_key: Optional[tuple] = None) -> tuple:
+    """
+    Top-K mutual matches ranked by (swap count desc, distance asc, reputation, id).
+    Pairs are streamed from the match index in descending swap_count order and
+    kept in a bounded heap of limit + 1 entries; reading stops as soon as no
+    remaining pair can outrank the worst entry in a full heap.
+    Returns (ranked [(key, pair, user)], has_more).
+    """
     user_radius = get_user_radius(current_user)
-    
-    # Get all stickers for this album
-    stickers = await db.stickers.find({"album_id": album_id}, {"_id": 0, "id": 1}).to_list(1000)
-    sticker_ids = [s['id'] for s in stickers]
-    
-    if not sticker_ids:
-        return 0
-    
-    # Get my inventory
-    my_inventory = await db.user_inventory.find({
-        "user_id": user_id,
-        "album_id": album_id
-    }, {"_id": 0}).to_list(1000)
-    
-    my_inv_map = {item['sticker_id']: item['owned_qty'] for item in my_inventory}
-    
-    # My duplicates (owned >= 2) and missing (owned == 0)
-    my_duplicates = set(sid for sid in sticker_ids if my_inv_map.get(sid, 0) >= 2)
-    my_missing = set(sid for sid in sticker_ids if my_inv_map.get(sid, 0) == 0)
-    
-    # If user has no duplicates or no missing, no exchanges possible
-    if not my_duplicates or not my_missing:
-        return 0
-    
-    # Get other album members
-    other_members = await db.album_members.find(
-        {"album_id": album_id, "user_id": {"$ne": user_id}},
-        {"_id": 0, "user_id": 1}
-    ).to_list(1000)
-    
-    exchange_count = 0
-    
-    for member in other_members:
-        other_user_id = member['user_id']
-        
-        # Get user info and skip test/seed users
-        other_user = await db.users.find_one({"id": other_user_id}, {"_id": 0})
-        if is_test_user(other_user):
-            continue  # Skip test/seed users
-        
-        # Check if within radius (enforced server-side)
-        if not is_within_radius(current_user, other_user, user_radius):
-            continue  # Skip users outside radius
-        
-        # Get their inventory
-        other_inventory = await db.user_inventory.find({
-            "user_id": other_user_id,
-            "album_id": album_id
-        }, {"_id": 0}).to_list(1000)
-        
-        other_inv_map = {item['sticker_id']: item['owned_qty'] for item in other_inventory}
+    radius_query = within_radius_query(current_user, user_radius)
+    heap_size = limit + 1
+    heap = []
+    
+    async for chunk in match_index.iter_mutual_pairs(
+        db, album_id, current_user['id'],
+        max_swap_count=after_key[0] if after_key else None,
+        chunk_size=max(heap_size * 2, 50)
+    ):
+        pairs_by_partner = {p['partner_id']: p for p in chunk}
+        partner_query = {"id": {"$in": list(pairs_by_partner)}}
+        if radius_query:
+            partner_query.update(radius_query)
+        partners = await db.users.find(partner_query, {"_id": 0}).to_list(None)
+        partners = [u for u in partners if not is_test_user(u)]
         
-        # Their duplicates and missing
-        other_duplicates = set(sid for sid in sticker_ids if other_inv_map.get(sid, 0) >= 2)
-        other_missing = set(sid for sid in sticker_ids if other_inv_map.get(sid, 0) == 0)
+        distances = candidate_distances(current_user, partners)
+        statuses = await load_reputation_statuses([u['id'] for u in partners]) if partners else {}
         
-        # Mutual match: I can give them something AND they can give me something
-        i_can_give = my_duplicates & other_missing
-        i_can_get = other_duplicates & my_missing
+        for partner, distance in zip(partners, distances):
+            if distance is not None and distance > user_radius:
+                continue  # Safety net for users without a migrated location_point
+            pair = pairs_by_partner[partner['id']]
+            key = (
+                pair['swap_count'],
+                round(distance, 3) if distance is not None else UNKNOWN_DISTANCE_KM,
+                REPUTATION_RANK.get(statuses.get(partner['id']), len(REPUTATION_RANK)),
+                partner['id']
+            )
+            key = (-key[0],) + key[1:]  # swap count sorts descending
+            if after_key and key <= (-after_key[0],) + after_key[1:]:
+                continue  # Already returned on a previous page
+            entry = _RankedMatch(key, pair, partner)
+            if len(heap) < heap_size:
+                heapq.heappush(heap, entry)
+            elif key < heap[0].key:
+                heapq.heapreplace(heap, entry)
         
-        # Only count if MUTUAL exchange is possible (both directions)
-        if i_can_give and i_can_get:
-            exchange_count += 1
+        # Early termination: every remaining pair has swap_count <= the last one read
+        last_swap = chunk[-1]['swap_count']
+        if len(heap) == heap_size and -heap[0].key[0] > last_swap:
+            break
     
-    return exchange_count
+    ranked = sorted(heap, key=lambda e: e.key)
+    has_more = len(ranked) > limit
+    return [(e.key, e.pair, e.user) for e in ranked[:limit]], has_more
 
 @api_router.get("/albums/{album_id}/matches")
-async def get_album_matches(album_id: str, user_id: str = Depends(get_current_user)):
+async def get_album_matches(
+    album_id: str,
+    response: Response,
+    limit: int = MATCHES_DEFAULT_LIMIT,
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
     """
     Get potential exchange matches within the album.
     Returns ONE entry per user with aggregated match info.
@@ -1397,6 +1670,10 @@ async def get_album_matches(album_id: str, user_id: str = Depends(get_current_us
     Does not expose user lists/directories - only real exchange opportunities.
     Filters by user's search radius (proximity-based matching).
     EXCLUDES test/seed users from results.
+    
+    Ranked best-first: most one-for-one swaps, then nearest, then best reputation.
+    Paginated: returns at most `limit` matches; when more exist, the
+    X-Next-Cursor response header holds the `cursor` for the next page.
     """
     # Verify user has activated this album
     activation = await db.user_album_activations.find_one({
@@ -1411,93 +1688,32 @@ async def get_album_matches(album_id: str, user_id: str = Depends(get_current_us
     if not current_user:
         return []
     
-    user_radius = get_user_radius(current_user)
-    
-    # Get all stickers for this album
-    stickers = await db.stickers.find({"album_id": album_id}, {"_id": 0}).to_list(1000)
-    sticker_ids = [s['id'] for s in stickers]
-    
-    if not sticker_ids:
-        return []
-    
-    # Get my inventory
-    my_inventory = await db.user_inventory.find({
-        "user_id": user_id,
-        "album_id": album_id
-    }, {"_id": 0}).to_list(1000)
-    
-    my_inv_map = {item['sticker_id']: item['owned_qty'] for item in my_inventory}
-    
-    my_duplicates = [sid for sid in sticker_ids if my_inv_map.get(sid, 0) >= 2]
-    my_missing = [sid for sid in sticker_ids if my_inv_map.get(sid, 0) == 0]
-    
-    # Get other album members (deduplicated by user_id)
-    other_members = await db.album_members.find(
-        {"album_id": album_id, "user_id": {"$ne": user_id}},
-        {"_id": 0, "user_id": 1}
-    ).to_list(1000)
-    
-    # Deduplicate member IDs in case of duplicate memberships
-    seen_user_ids = set()
-    unique_member_ids = []
-    for member in other_members:
-        uid = member['user_id']
-        if uid not in seen_user_ids:
-            seen_user_ids.add(uid)
-            unique_member_ids.append(uid)
-    
-    # Use dict to aggregate matches by user (prevents duplicates)
-    matches_by_user = {}
+    limit = max(1, min(limit, MATCHES_MAX_LIMIT))
+    after_key = decode_match_cursor(cursor) if cursor else None
+    
+    ranked, has_more = await rank_album_matches(album_id, current_user, limit, after_key)
+    
+    # Pairs are unique per (user, partner) in the index, so users never repeat
+    matches = []
+    for key, pair, other_user in ranked:
+        matches.append({
+            "user": {
+                "id": other_user['id'],
+                "email": other_user.get('email'),
+                "display_name": other_user.get('display_name')
+            },
+            "you_need_count": pair['get_count'],
+            "they_need_count": pair['give_count'],
+            "has_stickers_i_need": pair['get_count'] > 0,
+            "needs_stickers_i_have": pair['give_count'] > 0,
+            "can_exchange": True  # Only true matches are included
+        })
     
-    for other_user_id in unique_member_ids:
-        # Skip if already processed (extra safety)
-        if other_user_id in matches_by_user:
-            continue
-        
-        # Get user info
-        other_user = await db.users.find_one({"id": other_user_id}, {"_id": 0})
-        if not other_user:
-            continue
-        
-        # Skip test/seed users - they should not appear in exchange suggestions
-        if is_test_user(other_user):
-            continue
-        
-        # Check if within radius (enforced server-side)
-        if not is_within_radius(current_user, other_user, user_radius):
-            continue  # Skip users outside radius
-        
-        # Get their inventory
-        other_inventory = await db.user_inventory.find({
-            "user_id": other_user_id,
-            "album_id": album_id
-        }, {"_id": 0}).to_list(1000)
-        
-        other_inv_map = {item['sticker_id']: item['owned_qty'] for item in other_inventory}
-        
-        other_duplicates = [sid for sid in sticker_ids if other_inv_map.get(sid, 0) >= 2]
-        other_missing = [sid for sid in sticker_ids if other_inv_map.get(sid, 0) == 0]
-        
-        i_can_give = [sid for sid in my_duplicates if sid in other_missing]
-        i_can_get = [sid for sid in other_duplicates if sid in my_missing]
-        
-        # Only include MUTUAL matches (both directions)
-        if i_can_give and i_can_get:
-            matches_by_user[other_user_id] = {
-                "user": {
-                    "id": other_user['id'],
-                    "email": other_user.get('email'),
-                    "display_name": other_user.get('display_name')
-                },
-                "you_need_count": len(i_can_get),
-                "they_need_count": len(i_can_give),
-                "has_stickers_i_need": len(i_can_get) > 0,
-                "needs_stickers_i_have": len(i_can_give) > 0,
-                "can_exchange": True  # Only true matches are included
-            }
+    if has_more and ranked:
+        last_key = ranked[-1][0]
+        response.headers["X-Next-Cursor"] = encode_match_cursor((-last_key[0],) + last_key[1:])
     
-    # Return as list (guaranteed unique users)
-    return list(matches_by_user.values())
+    return matches
 
 @api_router.get("/inventory")
 async def get_inventory(album_id: str, user_id: str = Depends(get_current_user)):
@@ -1506,15 +1722,13 @@ async def get_inventory(album_id: str, user_id: str = Depends(get_current_user))
     Returns ALL stickers in the album, with owned_qty for user's inventory.
     """
     # Check album exists
-    album = await db.albums.find_one({"id": album_id}, {"_id": 0})
+    album = await get_loaders(db).albums.load(album_id)
     if not album:
         raise HTTPException(status_code=404, detail="Album not found")
     
     # Get all stickers for this album (full catalog from database)
-    stickers = await db.stickers.find(
-        {"album_id": album_id}, 
-        {"_id": 0}
-    ).sort("number", 1).to_list(1000)
+    catalog = await catalog_cache.get_catalog(db, album_id)
+    stickers = catalog.copy_stickers()
     
     # Get user's inventory for this album
     user_inventory = await db.user_inventory.find(
@@ -1541,21 +1755,167 @@ async def update_inventory(
 ):
     """Update user's inventory for a specific sticker."""
     # Get sticker to find album_id
-    sticker = await db.stickers.find_one({"id": sticker_id}, {"_id": 0})
+    sticker = await catalog_cache.find_sticker(db, sticker_id)
     if not sticker:
         raise HTTPException(status_code=404, detail="Sticker not found")
     
     album_id = sticker['album_id']
+    new_qty = max(0, owned_qty)
     
-    # Upsert inventory record
-    await db.user_inventory.update_one(
+    # Upsert inventory record (previous value is needed to update the match index)
+    previous = await db.user_inventory.find_one_and_update(
         {"user_id": user_id, "sticker_id": sticker_id, "album_id": album_id},
-        {"$set": {"owned_qty": max(0, owned_qty)}},
-        upsert=True
+        {"$set": {"owned_qty": new_qty}},
+        projection={"_id": 0, "owned_qty": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
     )
+    old_qty = previous.get('owned_qty', 0) if previous else 0
+    
+    # Only pairs affected by this sticker are touched
+    await match_index.sticker_changed(db, album_id, user_id, sticker_id, old_qty, new_qty)
     
     return {"message": "Inventory updated"}
 
+# Upper bound for one batch request (a full album page is well below this)
+INVENTORY_BATCH_MAX_ITEMS = 200
+
+def inventory_qty_update(sticker_items: List[InventoryBatchItem]) -> dict:
+    """
+    Fold one sticker's batch items (in order) into a single pipeline $set of
+    owned_qty. After an absolute item the result is a constant; deltas alone
+    compose to max(floor, owned_qty + delta), so concurrent +1 taps add up
+    instead of overwriting each other.
+    """
+    fixed = None  # owned_qty after the last absolute item
+    floor, delta = 0, 0
+    for item in sticker_items:
+        if item.owned_qty is not None:
+            fixed = max(0, item.owned_qty)
+        elif fixed is not None:
+            fixed = max(0, fixed + item.delta)
+        else:
+            floor, delta = max(0, floor + item.delta), delta + item.delta
+    if fixed is not None:
+        return {"$literal": fixed}
+    return {"$max": [floor, {"$add": [{"$ifNull": ["$owned_qty", 0]}, delta]}]}
+
+def inventory_batch_update(sticker_items: List[InventoryBatchItem], now: str) -> list:
+    """
+    Update pipeline for one sticker's batch items. updated_at only moves when
+    owned_qty does, so a read-back can tell which stickers a bulk write changed.
+    """
+    qty = inventory_qty_update(sticker_items)
+    return [
+        {"$set": {"updated_at": {"$cond": [
+            {"$eq": [qty, {"$ifNull": ["$owned_qty", 0]}]}, "$updated_at", now
+        ]}}},
+        {"$set": {"owned_qty": qty}}
+    ]
+
+async def apply_inventory_batch(scope: dict, catalog, items: List[InventoryBatchItem],
+                                with_old_qty: bool = True) -> tuple:
+    """
+    Validate batch items against the cached catalog and apply them, each
+    sticker's items folded into one atomic pipeline update.
+    `scope` is the inventory owner filter ({"user_id", "album_id"} or
+    {"user_id", "group_id"}). Repeated sticker ids are applied in order.
+    
+    The match index needs each sticker's exact old quantity, which only the
+    updated doc itself can provide: with `with_old_qty` every sticker is one
+    find_one_and_update returning the previous doc (sent concurrently).
+    Without it (no index to maintain) stickers with a single item are written
+    with ONE unordered bulk_write and read back with one query; repeated
+    sticker ids still go through find_one_and_update so every item's result
+    is exact.
+    Returns (per-item results, [(sticker_id, old_qty, new_qty)] for changed
+    stickers) - old_qty is None for stickers written by the bulk path.
+    """
+    if len(items) > INVENTORY_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail="BATCH_TOO_LARGE")
+    
+    results = [None] * len(items)
+    by_sticker = {}
+    for index, item in enumerate(items):
+        if (item.owned_qty is None) == (item.delta is None):
+            results[index] = {"sticker_id": item.sticker_id, "status": "error", "error": "INVALID_ITEM"}
+        elif item.sticker_id not in catalog:
+            results[index] = {"sticker_id": item.sticker_id, "status": "error", "error": "STICKER_NOT_FOUND"}
+        else:
+            by_sticker.setdefault(item.sticker_id, []).append(index)
+    
+    now = datetime.now(timezone.utc).isoformat()
+    bulk = {} if with_old_qty else {sid: idx[0] for sid, idx in by_sticker.items() if len(idx) == 1}
+    
+    async def apply(sticker_id: str, indexes: list) -> tuple:
+        previous = await db.user_inventory.find_one_and_update(
+            {**scope, "sticker_id": sticker_id},
+            inventory_batch_update([items[i] for i in indexes], now),
+            projection={"_id": 0, "owned_qty": 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        old_qty = previous.get('owned_qty', 0) if previous else 0
+        # Replay the items on the value the update saw (same result as the pipeline)
+        qty = old_qty
+        for i in indexes:
+            item = items[i]
+            qty = max(0, item.owned_qty if item.owned_qty is not None else qty + item.delta)
+            results[i] = {"sticker_id": sticker_id, "status": "ok", "owned_qty": qty}
+        return sticker_id, old_qty, qty
+    
+    async def apply_bulk() -> list:
+        if not bulk:
+            return []
+        await db.user_inventory.bulk_write([
+            UpdateOne({**scope, "sticker_id": sid}, inventory_batch_update([items[i]], now), upsert=True)
+            for sid, i in bulk.items()
+        ], ordered=False)
+        written = await db.user_inventory.find(
+            {**scope, "sticker_id": {"$in": list(bulk)}},
+            {"_id": 0, "sticker_id": 1, "owned_qty": 1, "updated_at": 1}
+        ).to_list(None)
+        applied = []
+        for inv in written:
+            results[bulk[inv['sticker_id']]] = {
+                "sticker_id": inv['sticker_id'], "status": "ok", "owned_qty": inv.get('owned_qty', 0)
+            }
+            if inv.get('updated_at') == now:
+                applied.append((inv['sticker_id'], None, inv.get('owned_qty', 0)))
+        return applied
+    
+    applied, bulk_changes = await asyncio.gather(
+        asyncio.gather(*(apply(sid, indexes) for sid, indexes in by_sticker.items() if sid not in bulk)),
+        apply_bulk()
+    )
+    changes = [(sid, old, new) for sid, old, new in applied if new != old]
+    return results, changes + bulk_changes
+
+@api_router.put("/inventory/batch")
+async def update_inventory_batch(batch: InventoryBatchUpdate, user_id: str = Depends(get_current_user)):
+    """
+    Update several stickers of one album in a single request.
+    Each item sets `owned_qty` or applies a `delta` (e.g. +1 per sticker from
+    a new pack). Invalid items are reported per item and do not fail the batch.
+    """
+    catalog = await catalog_cache.get_catalog(db, batch.album_id)
+    if not len(catalog):
+        raise HTTPException(status_code=404, detail="Album not found")
+    
+    # Exact old quantities are only needed to update an existing match index
+    with_old_qty = await match_index.has_index(db, batch.album_id)
+    results, changes = await apply_inventory_batch(
+        {"user_id": user_id, "album_id": batch.album_id}, catalog, batch.items, with_old_qty
+    )
+    
+    # One pass over the match index for the whole batch
+    if changes and with_old_qty:
+        await match_index.stickers_changed(db, batch.album_id, user_id, changes)
+    elif changes:
+        await match_index.member_changed(db, batch.album_id, user_id)
+    
+    return {"results": results, "updated": len(changes)}
+
 # ============================================
 # GROUP ENDPOINTS (private album instances)
 # ============================================
@@ -1572,14 +1932,15 @@ async def get_my_groups(user_id: str = Depends(get_current_user)):
     
     groups = await db.groups.find({"id": {"$in": group_ids}}, {"_id": 0}).to_list(100)
     
+    # Albums of all groups in one $in query
+    loaders = get_loaders(db)
+    albums = await loaders.albums.load_many(group.get('album_id') for group in groups if group.get('album_id'))
+    albums_by_id = {album['id']: album for album in albums if album}
+    
     # Enrich with album info and member count
     for group in groups:
         album_id = group.get('album_id')
-        if album_id:
-            album = await db.albums.find_one({"id": album_id}, {"_id": 0})
-            group['album'] = album
-        else:
-            group['album'] = None
+        group['album'] = albums_by_id.get(album_id) if album_id else None
         
         # Get member count excluding current user
         _, member_count = await get_group_members_excluding_user(group['id'], user_id)
@@ -1590,7 +1951,7 @@ async def get_my_groups(user_id: str = Depends(get_current_user)):
         
         # Calculate progress
         if album_id:
-            sticker_count = await db.stickers.count_documents({"album_id": album_id})
+            sticker_count = len(await catalog_cache.get_catalog(db, album_id))
             if sticker_count > 0:
                 inventory_count = await db.user_inventory.count_documents({
                     "user_id": user_id,
@@ -1678,7 +2039,7 @@ async def leave_group(group_id: str, user_id: str = Depends(get_current_user)):
 # ============================================
 # EMAIL INVITE ENDPOINTS
 # ============================================
-@api_router.post("/groups/{group_id}/invite")
+@api_router.post("/groups/{group_id}/invite", dependencies=[Depends(rate_limited("group_invite"))])
 async def create_email_invite(group_id: str, invite_input: EmailInviteCreate, user_id: str = Depends(get_current_user)):
     """
     Send email invite to join group. Any member can invite.
@@ -1725,7 +2086,7 @@ async def create_email_invite(group_id: str, invite_input: EmailInviteCreate, us
     await db.email_invites.insert_one(invite_doc)
     
     # Get inviter info
-    inviter = await db.users.find_one({"id": user_id}, {"_id": 0})
+    inviter = await get_loaders(db).users.load(user_id)
     inviter_name = inviter.get('display_name') or inviter.get('full_name') or inviter['email']
     
     # Get album info for group name
@@ -1733,13 +2094,21 @@ async def create_email_invite(group_id: str, invite_input: EmailInviteCreate, us
     group_display_name = f"{group['name']} ({album['name']})"
     
     # Send invite via email (logged to console if Resend not configured)
-    send_invite_email(invite_input.email, invite_code, group_display_name, inviter_name)
+    email_sent = await send_invite_email(email_dispatcher, invite_input.email, invite_code, group_display_name, inviter_name)
+    
+    # Registered users also see it in their change feed (never includes the code)
+    if existing_user:
+        await emit_user_event([existing_user['id']], "invite_received", {
+            "invite_id": invite_doc['id'],
+            "group_id": group_id
+        })
     
     # NEVER return invite code in response
     return {
         "message": "Invite sent",
         "invited_email": invite_input.email,
-        "expires_in_hours": 1
+        "expires_in_hours": 1,
+        "email_sent": email_sent
     }
 
 @api_router.post("/invites/accept")
@@ -1799,17 +2168,23 @@ async def accept_email_invite(invite_data: EmailInviteAccept, user_id: str = Dep
         {"$set": {"used_at": datetime.now(timezone.utc).isoformat()}}
     )
     
+    await emit_user_event([user_id, invite['created_by_user_id']], "invite_accepted", {
+        "invite_id": invite['id'],
+        "group_id": invite['group_id'],
+        "user_id": user_id
+    })
+    
     # Get group info
     group = await db.groups.find_one({"id": invite['group_id']}, {"_id": 0})
     
     return {"message": "Joined group successfully", "group_id": invite['group_id'], "group_name": group['name']}
 
 @api_router.get("/invites/pending")
-async def get_pending_invites(user_id: str = Depends(get_current_user)):
+async def get_pending_invites(current_user: CurrentUser = Depends(get_current_user_context)):
     """
     Get pending invites for the current user's email.
     """
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user = await current_user.load()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -1840,7 +2215,7 @@ async def get_stickers(group_id: str, user_id: str = Depends(get_current_user)):
     Get stickers for a group's album. User must be a member.
     """
     group = await validate_group_member(group_id, user_id)
-    stickers = await db.stickers.find({"album_id": group['album_id']}, {"_id": 0}).to_list(1000)
+    stickers = (await catalog_cache.get_catalog(db, group['album_id'])).copy_stickers()
     return stickers
 
 # ============================================
@@ -1853,7 +2228,7 @@ async def get_inventory(group_id: str, user_id: str = Depends(get_current_user))
     """
     group = await validate_group_member(group_id, user_id)
     
-    stickers = await db.stickers.find({"album_id": group['album_id']}, {"_id": 0}).to_list(1000)
+    stickers = (await catalog_cache.get_catalog(db, group['album_id'])).copy_stickers()
     
     inventory_items = await db.user_inventory.find({
         "user_id": user_id,
@@ -1900,6 +2275,24 @@ async def update_inventory(group_id: str, update: InventoryUpdate, user_id: str
     
     return {"message": "Inventory updated"}
 
+@api_router.put("/groups/{group_id}/inventory/batch")
+async def update_group_inventory_batch(
+    group_id: str,
+    batch: GroupInventoryBatchUpdate,
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Update several stickers of a group inventory in a single request.
+    Same item format and per-item results as PUT /inventory/batch.
+    """
+    group = await validate_group_member(group_id, user_id)
+    catalog = await catalog_cache.get_catalog(db, group['album_id'])
+    
+    results, changes = await apply_inventory_batch(
+        {"user_id": user_id, "group_id": group_id}, catalog, batch.items, with_old_qty=False
+    )
+    return {"results": results, "updated": len(changes)}
+
 # ============================================
 # MATCHES ENDPOINTS (scoped by group)
 # ============================================
@@ -1913,7 +2306,7 @@ async def get_matches(group_id: str, user_id: str = Depends(get_current_user)):
     """
     group = await validate_group_member(group_id, user_id)
     
-    stickers = await db.stickers.find({"album_id": group['album_id']}, {"_id": 0}).to_list(1000)
+    stickers = (await catalog_cache.get_catalog(db, group['album_id'])).copy_stickers()
     sticker_ids = [s['id'] for s in stickers]
     
     my_inventory = await db.user_inventory.find({
@@ -2021,10 +2414,10 @@ def calculate_reputation_status(successful_exchanges: int, failed_serious: int,
 
 async def get_user_reputation(user_id: str) -> dict:
     """Get or create user reputation record with dynamically calculated status."""
-    rep = await db.user_reputation.find_one({"user_id": user_id}, {"_id": 0})
+    reputations = get_loaders(db).reputations
+    rep = await reputations.load(user_id)
     if not rep:
-        rep = {
-            "user_id": user_id,
+        default = {
             "total_exchanges": 0,
             "successful_exchanges": 0,
             "failed_exchanges": 0,  # Serious failures only
@@ -2034,7 +2427,23 @@ async def get_user_reputation(user_id: str) -> dict:
             "suspended_at": None,
             "updated_at": datetime.now(timezone.utc).isoformat()
         }
-        await db.user_reputation.insert_one(rep)
+        # Upsert so concurrent first requests converge on one doc instead of
+        # racing on the unique user_id index
+        for _ in range(2):
+            try:
+                rep = await db.user_reputation.find_one_and_update(
+                    {"user_id": user_id},
+                    {"$setOnInsert": default},
+                    upsert=True,
+                    projection={"_id": 0},
+                    return_document=ReturnDocument.AFTER
+                )
+                break
+            except DuplicateKeyError:
+                continue  # Lost the insert race; the retry matches the winner's doc
+        else:
+            rep = await db.user_reputation.find_one({"user_id": user_id}, {"_id": 0})
+        reputations.prime(user_id, rep)
     else:
         # Recalculate status dynamically to ensure consistency
         calculated_status = calculate_reputation_status(
@@ -2142,96 +2551,73 @@ async def create_or_get_exchange(
     UPSERT: If exchange already exists, returns it instead of error.
     FREEMIUM: Free users limited to 1 new match per day.
     """
+    partner_id = exchange_input.partner_user_id
+    loaders = get_loaders(db)
+    pair_key = exchange_pair_key(album_id, user_id, partner_id)
+    
+    # Both activations (one query), both reputations and any pending exchange
+    # for this pair (pair_key index) are fetched concurrently
+    (activation, partner_activation), user_visible, partner_visible, existing = await asyncio.gather(
+        loaders.activations.load_many([(user_id, album_id), (partner_id, album_id)]),
+        is_user_visible(user_id),
+        is_user_visible(partner_id),
+        db.exchanges.find_one({"pair_key": pair_key, "status": "pending"}, {"_id": 0})
+    )
+    
     # Verify user has activated this album
-    activation = await db.user_album_activations.find_one({
-        "user_id": user_id,
-        "album_id": album_id
-    })
     if not activation:
         raise HTTPException(status_code=403, detail="ALBUM_NOT_ACTIVATED")
     
-    partner_id = exchange_input.partner_user_id
-    
     # Check partner exists and has activated the album
-    partner_activation = await db.user_album_activations.find_one({
-        "user_id": partner_id,
-        "album_id": album_id
-    })
     if not partner_activation:
         raise HTTPException(status_code=404, detail="PARTNER_NOT_FOUND")
     
     # Check both users are visible (reputation check)
-    if not await is_user_visible(user_id):
+    if not user_visible:
         raise HTTPException(status_code=403, detail="ACCOUNT_RESTRICTED")
-    if not await is_user_visible(partner_id):
+    if not partner_visible:
         raise HTTPException(status_code=404, detail="PARTNER_NOT_AVAILABLE")
     
-    # Check for existing pending exchange between these users (UPSERT LOGIC)
-    existing = await db.exchanges.find_one({
-        "album_id": album_id,
-        "status": "pending",
-        "$or": [
-            {"user_a_id": user_id, "user_b_id": partner_id},
-            {"user_a_id": partner_id, "user_b_id": user_id}
-        ]
-    }, {"_id": 0})
-    
     # If exchange already exists, return it (NO ERROR, no daily limit cost)
     if existing:
         return {"message": "EXCHANGE_EXISTS", "exchange": existing, "is_existing": True}
     
-    # FREEMIUM GATING: Check if user can create a new match
-    can_match, reason, user = await can_user_create_match(user_id)
-    if not can_match:
-        if reason == "DAILY_MATCH_LIMIT":
-            raise HTTPException(
-                status_code=403,
-                detail={
-                    "code": "DAILY_MATCH_LIMIT",
-                    "message": "You have reached your daily chat limit. Upgrade your plan for more chats.",
-                    "matches_used": user.get('matches_used_today', 0),
-                    "limit": FREE_PLAN_MAX_CHATS_PER_DAY if user.get('plan') == 'free' else PLUS_PLAN_MAX_CHATS_PER_DAY
-                }
-            )
-        raise HTTPException(status_code=400, detail=reason)
+    # FREEMIUM GATING: Take a new chat from the daily quota (one atomic write).
+    # It is given back below if no exchange ends up being created.
+    quota_taken = await consume_daily_chat(user_id)
     
     # Verify mutual match exists
-    stickers = await db.stickers.find({"album_id": album_id}, {"_id": 0, "id": 1}).to_list(1000)
-    sticker_ids = [s['id'] for s in stickers]
+    sticker_index = (await catalog_cache.get_catalog(db, album_id)).sticker_index
     
     my_inventory = await db.user_inventory.find({
         "user_id": user_id,
         "album_id": album_id
     }, {"_id": 0}).to_list(1000)
-    my_inv_map = {item['sticker_id']: item['owned_qty'] for item in my_inventory}
     
     partner_inventory = await db.user_inventory.find({
         "user_id": partner_id,
         "album_id": album_id
     }, {"_id": 0}).to_list(1000)
-    partner_inv_map = {item['sticker_id']: item['owned_qty'] for item in partner_inventory}
-    
-    my_duplicates = [sid for sid in sticker_ids if my_inv_map.get(sid, 0) >= 2]
-    my_missing = [sid for sid in sticker_ids if my_inv_map.get(sid, 0) == 0]
-    partner_duplicates = [sid for sid in sticker_ids if partner_inv_map.get(sid, 0) >= 2]
-    partner_missing = [sid for sid in sticker_ids if partner_inv_map.get(sid, 0) == 0]
     
-    i_can_give = [sid for sid in my_duplicates if sid in partner_missing]
-    i_can_get = [sid for sid in partner_duplicates if sid in my_missing]
+    match = compare(
+        sticker_index.encode_items(my_inventory),
+        sticker_index.encode_items(partner_inventory)
+    )
     
-    if not i_can_give or not i_can_get:
+    if not match.is_mutual:
+        if quota_taken:
+            await chat_quota.release(db, user_id)
         raise HTTPException(status_code=400, detail="NO_MUTUAL_MATCH")
     
-    # FREEMIUM: Increment daily match counter for free and plus users
-    user_plan = user.get('plan', 'free') if user else 'free'
-    if user_plan in ['free', 'plus']:
-        await increment_user_match_count(user_id)
+    i_can_give = sticker_index.decode(match.give_bits)
+    i_can_get = sticker_index.decode(match.get_bits)
     
     # Create exchange
     now = datetime.now(timezone.utc)
     exchange = {
         "id": str(uuid4()),
         "album_id": album_id,
+        "pair_key": pair_key,
         "user_a_id": user_id,
         "user_b_id": partner_id,
         "user_a_offers": i_can_give,
@@ -2248,19 +2634,39 @@ async def create_or_get_exchange(
         "expires_at": (now + timedelta(days=EXCHANGE_EXPIRY_DAYS)).isoformat(),
         "is_new": True  # Flag for frontend to know it's new
     }
-    await db.exchanges.insert_one(exchange)
     
-    # Create chat for this exchange
+    # Idempotent upsert: the partial unique index on pair_key allows one pending
+    # exchange per pair, so concurrent taps converge on the same exchange
+    try:
+        stored = await db.exchanges.find_one_and_update(
+            {"pair_key": pair_key, "status": "pending"},
+            {"$setOnInsert": exchange},
+            upsert=True,
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # A concurrent request inserted it first
+        stored = await db.exchanges.find_one({"pair_key": pair_key, "status": "pending"}, {"_id": 0})
+    if stored is None or stored['id'] != exchange['id']:
+        # Not created by this request: no daily limit cost
+        if quota_taken:
+            await chat_quota.release(db, user_id)
+        if stored is None:
+            raise HTTPException(status_code=409, detail="EXCHANGE_CONFLICT")
+        return {"message": "EXCHANGE_EXISTS", "exchange": stored, "is_existing": True}
+    
+    # Chat for this exchange plus its system message (message key, not hardcoded text)
     chat = {
         "id": str(uuid4()),
         "exchange_id": exchange['id'],
         "user_a_id": user_id,
         "user_b_id": partner_id,
+        # Unread counters; the partner has the "exchange started" message unread
+        "user_a_unread": 0,
+        "user_b_unread": 1,
         "created_at": now.isoformat()
     }
-    await db.chats.insert_one(chat)
-    
-    # Add system message (use message key, not hardcoded text)
     system_message = {
         "id": str(uuid4()),
         "chat_id": chat['id'],
@@ -2269,9 +2675,22 @@ async def create_or_get_exchange(
         "is_system": True,
         "created_at": now.isoformat()
     }
-    await db.chat_messages.insert_one(system_message)
+    # Only the request that created the exchange gets here, so both writes go out together
+    await asyncio.gather(
+        db.chats.insert_one(chat),
+        db.chat_messages.insert_one(system_message)
+    )
     
     exchange.pop('_id', None)
+    system_message.pop('_id', None)
+    
+    # Push to both participants (the partner sees the new exchange without polling)
+    await emit_user_event([user_id, partner_id], "exchange_created", {
+        "exchange_id": exchange['id'],
+        "album_id": album_id,
+        "message": system_message
+    })
+    
     return {"message": "EXCHANGE_CREATED", "exchange": exchange, "is_existing": False}
 
 @api_router.get("/albums/{album_id}/exchanges")
@@ -2285,44 +2704,59 @@ async def get_user_exchanges(album_id: str, user_id: str = Depends(get_current_u
         ]
     }, {"_id": 0}).sort("created_at", -1).to_list(100)
     
+    if not exchanges:
+        return exchanges
+    
+    partner_ids = list(dict.fromkeys(
+        e['user_b_id'] if e['user_a_id'] == user_id else e['user_a_id'] for e in exchanges
+    ))
+    
+    # Partners, reputations and chats: one $in query each, run concurrently
+    loaders = get_loaders(db)
+    partners, reputations, chats = await asyncio.gather(
+        loaders.users.load_many(partner_ids),
+        asyncio.gather(*(get_user_reputation(pid) for pid in partner_ids)),
+        db.chats.find(
+            {"exchange_id": {"$in": [e['id'] for e in exchanges]}}, {"_id": 0}
+        ).to_list(None)
+    )
+    partners_by_id = dict(zip(partner_ids, partners))
+    reputations_by_id = dict(zip(partner_ids, reputations))
+    chats_by_exchange = {chat['exchange_id']: chat for chat in chats}
+    
     # Enrich with partner info and reputation
     for exchange in exchanges:
         partner_id = exchange['user_b_id'] if exchange['user_a_id'] == user_id else exchange['user_a_id']
-        partner = await db.users.find_one({"id": partner_id}, {"_id": 0})
-        partner_rep = await get_user_reputation(partner_id)
+        partner = partners_by_id.get(partner_id)
         
         exchange['partner'] = {
             "id": partner_id,
             "display_name": partner.get('display_name') if partner else None,
-            "reputation_status": partner_rep['status']
+            "reputation_status": reputations_by_id[partner_id]['status']
         }
         
         # Mark which user is "me"
         exchange['is_user_a'] = exchange['user_a_id'] == user_id
         
-        # Check for unread messages (messages from partner after user's last read)
-        chat = await db.chats.find_one({"exchange_id": exchange['id']}, {"_id": 0})
-        if chat:
-            last_read_field = 'user_a_last_read' if exchange['is_user_a'] else 'user_b_last_read'
-            last_read = chat.get(last_read_field)
-            
-            # Count messages from partner that are newer than last_read
-            query = {
-                "chat_id": chat['id'],
-                "sender_id": partner_id  # Only messages from partner
-            }
-            if last_read:
-                query["created_at"] = {"$gt": last_read}
-            
-            unread_count = await db.chat_messages.count_documents(query)
-            exchange['has_unread'] = unread_count > 0
-            exchange['unread_count'] = unread_count
-        else:
-            exchange['has_unread'] = False
-            exchange['unread_count'] = 0
+        # Unread = per-participant counter maintained on the chat
+        chat = chats_by_exchange.get(exchange['id'])
+        unread_count = chat.get(chat_unread_field(exchange, user_id), 0) if chat else 0
+        exchange['has_unread'] = unread_count > 0
+        exchange['unread_count'] = unread_count
     
     return exchanges
 
+def chat_unread_field(exchange: dict, user_id: str) -> str:
+    """Chat field holding the unread message counter of `user_id`."""
+    return 'user_a_unread' if exchange['user_a_id'] == user_id else 'user_b_unread'
+
+async def mark_unread_for(chat_id: str, exchange: dict, reader_id: str):
+    """Count one new message as unread for `reader_id`."""
+    await db.chats.update_one(
+        {"id": chat_id},
+        {"$inc": {chat_unread_field(exchange, reader_id): 1}}
+    )
+
 @api_router.get("/exchanges/{exchange_id}")
 async def get_exchange(exchange_id: str, user_id: str = Depends(get_current_user)):
     """Get exchange details. Only participants can view."""
@@ -2346,10 +2780,10 @@ async def get_exchange(exchange_id: str, user_id: str = Depends(get_current_user
     exchange['is_user_a'] = exchange['user_a_id'] == user_id
     
     # Enrich sticker info
+    catalog = await catalog_cache.get_catalog(db, exchange['album_id'])
     for sticker_list_key in ['user_a_offers', 'user_b_offers']:
         sticker_ids = exchange.get(sticker_list_key, [])
-        stickers = await db.stickers.find({"id": {"$in": sticker_ids}}, {"_id": 0}).to_list(100)
-        exchange[f'{sticker_list_key}_details'] = stickers
+        exchange[f'{sticker_list_key}_details'] = catalog.stickers_by_ids(sticker_ids)
     
     return exchange
 
@@ -2451,6 +2885,21 @@ async def confirm_exchange(
                 "created_at": now.isoformat()
             }
             await db.chat_messages.insert_one(system_message)
+            # Unread for the participant who did not trigger the final status
+            other_id = exchange['user_b_id'] if exchange['user_a_id'] == user_id else exchange['user_a_id']
+            await mark_unread_for(chat['id'], exchange, other_id)
+            system_message.pop('_id', None)
+            await emit_user_event(
+                [exchange['user_a_id'], exchange['user_b_id']], "chat_message",
+                {"exchange_id": exchange_id, "message": system_message}
+            )
+    
+    await emit_user_event([exchange['user_a_id'], exchange['user_b_id']], "exchange_updated", {
+        "exchange_id": exchange_id,
+        "album_id": exchange['album_id'],
+        "status": final_status or exchange['status'],
+        "confirmed_by": user_id
+    })
     
     return {"message": "CONFIRMATION_RECORDED", "status": final_status or exchange['status']}
 
@@ -2472,9 +2921,40 @@ async def get_my_reputation(user_id: str = Depends(get_current_user)):
 # CHAT ENDPOINTS (Only for pending exchanges)
 # ============================================
 
+CHAT_PAGE_DEFAULT_LIMIT = 100
+CHAT_PAGE_MAX_LIMIT = 500
+
+async def get_chat_message_anchor(chat_id: str, message_id: str) -> dict:
+    """Message used as a keyset cursor (must belong to the chat)."""
+    anchor = await db.chat_messages.find_one(
+        {"chat_id": chat_id, "id": message_id},
+        {"_id": 0, "id": 1, "created_at": 1}
+    )
+    if not anchor:
+        raise HTTPException(status_code=400, detail="INVALID_CURSOR")
+    return anchor
+
 @api_router.get("/exchanges/{exchange_id}/chat")
-async def get_exchange_chat(exchange_id: str, user_id: str = Depends(get_current_user)):
-    """Get chat for an exchange. Only participants can view."""
+async def get_exchange_chat(
+    exchange_id: str,
+    before: Optional[str] = None,
+    since: Optional[str] = None,
+    limit: int = CHAT_PAGE_DEFAULT_LIMIT,
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Get chat for an exchange. Only participants can view.
+    
+    Messages are always returned oldest first, ordered by (created_at, id):
+    - no cursor: the latest `limit` messages
+    - before=<message id>: the `limit` messages preceding that message (older history)
+    - since=<message id>: messages after that message (incremental polling)
+    `has_more` tells whether older (default/before) or newer (since) messages remain.
+    """
+    if before and since:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'since'")
+    limit = max(1, min(limit, CHAT_PAGE_MAX_LIMIT))
+    
     exchange = await db.exchanges.find_one({"id": exchange_id}, {"_id": 0})
     if not exchange:
         raise HTTPException(status_code=404, detail="Exchange not found")
@@ -2486,27 +2966,59 @@ async def get_exchange_chat(exchange_id: str, user_id: str = Depends(get_current
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     
-    messages = await db.chat_messages.find(
-        {"chat_id": chat['id']},
-        {"_id": 0}
-    ).sort("created_at", 1).to_list(500)
-    
-    # Mark messages as read for this user
-    now = datetime.now(timezone.utc).isoformat()
-    is_user_a = exchange['user_a_id'] == user_id
-    last_read_field = 'user_a_last_read' if is_user_a else 'user_b_last_read'
-    await db.chats.update_one(
-        {"id": chat['id']},
-        {"$set": {last_read_field: now}}
-    )
+    query = {"chat_id": chat['id']}
+    if since:
+        anchor = await get_chat_message_anchor(chat['id'], since)
+        query["$or"] = [
+            {"created_at": {"$gt": anchor['created_at']}},
+            {"created_at": anchor['created_at'], "id": {"$gt": anchor['id']}}
+        ]
+        sort = [("created_at", 1), ("id", 1)]
+    else:
+        if before:
+            anchor = await get_chat_message_anchor(chat['id'], before)
+            query["$or"] = [
+                {"created_at": {"$lt": anchor['created_at']}},
+                {"created_at": anchor['created_at'], "id": {"$lt": anchor['id']}}
+            ]
+        sort = [("created_at", -1), ("id", -1)]
+    
+    messages = await db.chat_messages.find(query, {"_id": 0}).sort(sort).to_list(limit + 1)
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if not since:
+        messages.reverse()
+    
+    # Mark messages as read for this user - only when the newest message was
+    # returned and it is newer than the stored last_read (no write otherwise)
+    includes_newest = not before and (not since or not has_more)
+    if includes_newest and messages:
+        newest_at = messages[-1]['created_at']
+        is_user_a = exchange['user_a_id'] == user_id
+        last_read_field = 'user_a_last_read' if is_user_a else 'user_b_last_read'
+        unread_field = chat_unread_field(exchange, user_id)
+        last_read = chat.get(last_read_field)
+        if not last_read or newest_at > last_read or chat.get(unread_field):
+            read_through = {"$max": {last_read_field: newest_at}}
+            # Only clear the unread messages counted when the chat was loaded
+            # (all of them are older than the messages query). A message
+            # counted meanwhile may not be among the returned ones: then the
+            # counter is left as is and the next read clears it.
+            result = await db.chats.update_one(
+                {"id": chat['id'], unread_field: chat.get(unread_field)},
+                {**read_through, "$set": {unread_field: 0}}
+            )
+            if not result.matched_count:
+                await db.chats.update_one({"id": chat['id']}, read_through)
     
     return {
         "chat": chat,
         "messages": messages,
+        "has_more": has_more,
         "is_read_only": exchange['status'] != 'pending'
     }
 
-@api_router.post("/exchanges/{exchange_id}/chat/messages")
+@api_router.post("/exchanges/{exchange_id}/chat/messages", dependencies=[Depends(rate_limited("chat_message"))])
 async def send_chat_message(
     exchange_id: str,
     content: str = Body(..., embed=True),
@@ -2548,25 +3060,8 @@ async def send_chat_message(
     # we need to check and count their chat limit
     # (Exchange creator already had it counted at creation time)
     if is_first_message and user_id != exchange['user_a_id']:
-        # Check if user can create a new chat (respects daily limit)
-        can_chat, reason, user = await can_user_create_match(user_id)
-        if not can_chat:
-            if reason == "DAILY_MATCH_LIMIT":
-                raise HTTPException(
-                    status_code=403,
-                    detail={
-                        "code": "DAILY_MATCH_LIMIT",
-                        "message": "You have reached your daily chat limit. Upgrade your plan for more chats.",
-                        "matches_used": user.get('matches_used_today', 0),
-                        "limit": FREE_PLAN_MAX_CHATS_PER_DAY if user.get('plan') == 'free' else PLUS_PLAN_MAX_CHATS_PER_DAY
-                    }
-                )
-            raise HTTPException(status_code=400, detail=reason)
-        
-        # Increment their daily chat count
-        user_plan = user.get('plan', 'free') if user else 'free'
-        if user_plan in ['free', 'plus']:
-            await increment_user_match_count(user_id)
+        # Take a new chat from their daily quota (raises DAILY_MATCH_LIMIT when used up)
+        if await consume_daily_chat(user_id):
             logger.info(f"[CHAT] User {user_id} replied to chat for first time - daily count incremented")
     
     now = datetime.now(timezone.utc)
@@ -2580,9 +3075,69 @@ async def send_chat_message(
     }
     await db.chat_messages.insert_one(message)
     
+    # Unread for the other participant
+    other_id = exchange['user_b_id'] if exchange['user_a_id'] == user_id else exchange['user_a_id']
+    await mark_unread_for(chat['id'], exchange, other_id)
+    
     message.pop('_id', None)
+    await emit_user_event([user_id, other_id], "chat_message", {
+        "exchange_id": exchange_id,
+        "message": message
+    })
     return message
 
+# ============================================
+# CHANGE FEED
+# ============================================
+CHANGES_DEFAULT_LIMIT = 100
+CHANGES_MAX_LIMIT = 500
+
+@api_router.get("/me/changes")
+async def get_my_changes(
+    since: int = 0,
+    limit: int = CHANGES_DEFAULT_LIMIT,
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Events recorded for the current user after `since` (a seq number):
+    exchange_created, chat_message, exchange_updated, invite_received,
+    invite_accepted, plan_changed.
+    Returns 204 when nothing changed. Clients store `latest_seq` and pass it
+    back as `since`; on `reset` they should reload everything.
+    """
+    limit = max(1, min(limit, CHANGES_MAX_LIMIT))
+    changes = await change_feed.get_changes(db, user_id, since, limit)
+    if changes is None:
+        return Response(status_code=204)
+    return changes
+
+# ============================================
+# REAL-TIME PUSH (Server-Sent Events)
+# ============================================
+@api_router.post("/events/stream-token")
+async def issue_stream_token(user_id: str = Depends(get_current_user)):
+    """
+    Short-lived token for opening /events/stream. It only authorizes the
+    stream, so the session token never has to travel in a URL.
+    """
+    return {"stream_token": create_stream_token(user_id), "expires_in": STREAM_TOKEN_TTL_SECONDS}
+
+@api_router.get("/events/stream")
+async def stream_user_events(stream_token: str):
+    """
+    Server-Sent Events stream of the current user's exchange events:
+    chat_message, exchange_created, exchange_updated.
+    EventSource cannot set headers, so it authenticates with a stream token
+    from POST /events/stream-token in the query string (it only needs to be
+    valid when the stream opens). Clients should keep a slow poll as a fallback.
+    """
+    user_id = decode_stream_token(stream_token)['user_id']
+    return StreamingResponse(
+        stream_events(realtime_hub, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ============================================
 # DEV ENDPOINTS (only when DEV_MODE=true)
 # ============================================
@@ -2706,6 +3261,10 @@ async def merge_duplicate_users():
             "migrated_counts": migrated_counts
         })
     
+    # Merged users can leave duplicate album_members rows - recount
+    if merge_results:
+        await album_counters.repair(db)
+    
     return {
         "merged_email_count": len(merge_results),
         "details": merge_results
@@ -2737,14 +3296,24 @@ async def normalize_all_emails():
 
 app.include_router(api_router)
 
+# Per-request document loaders (see request_loader.py)
+app.add_middleware(RequestScopeMiddleware, db=db)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if exchange_sweeper_task:
+        exchange_sweeper_task.cancel()
+    if match_index_build_task:
+        match_index_build_task.cancel()
+    await realtime_hub.stop()
+    await email_dispatcher.stop()
     client.close()
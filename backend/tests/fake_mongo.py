@@ -0,0 +1,638 @@
+"""
+In-memory stand-in for the motor database used by unit tests.
+
+Implements the subset of MongoDB the backend relies on, with motor's async
+signatures: query operators ($in, $nin, $ne, $gt/$gte/$lt/$lte, $exists,
+$or/$and, array membership), update operators ($set, $unset, $inc,
+$max, $min, $setOnInsert, $addToSet, $pull, $push) and pipeline updates, upserts,
+unique (optionally partial) indexes raising DuplicateKeyError, bulk_write,
+sorted/paged cursors and simple aggregation pipelines ($match, $project,
+$group, $sort, $limit, $skip, $set/$addFields).
+
+Anything else raises NotImplementedError so a test never passes against
+behaviour the fake does not model.
+"""
+import copy
+import functools
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+_MISSING = object()
+
+
+def _get(doc, path):
+    value = doc
+    for part in path.split('.'):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return _MISSING
+    return value
+
+
+def _set(doc, path, value):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset(doc, path):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _is_operator_dict(value):
+    return isinstance(value, dict) and value and all(k.startswith('$') for k in value)
+
+
+# ---------------------------------------------------------------- queries
+
+def _eq(value, target):
+    if value is _MISSING:
+        return target is None
+    if isinstance(value, list) and not isinstance(target, list):
+        return target in value
+    return value == target
+
+
+def _compare(value, op, target):
+    values = value if isinstance(value, list) else [value]
+    for v in values:
+        if v is _MISSING or v is None or target is None:
+            continue
+        try:
+            if ((op == '$gt' and v > target) or (op == '$gte' and v >= target)
+                    or (op == '$lt' and v < target) or (op == '$lte' and v <= target)):
+                return True
+        except TypeError:
+            continue
+    return False
+
+
+def _match_field(value, cond):
+    if not _is_operator_dict(cond):
+        return _eq(value, cond)
+    for op, arg in cond.items():
+        if op == '$in':
+            ok = any(_eq(value, t) for t in arg)
+        elif op == '$nin':
+            ok = not any(_eq(value, t) for t in arg)
+        elif op == '$ne':
+            ok = not _eq(value, arg)
+        elif op == '$eq':
+            ok = _eq(value, arg)
+        elif op == '$exists':
+            ok = (value is not _MISSING) == bool(arg)
+        elif op in ('$gt', '$gte', '$lt', '$lte'):
+            ok = _compare(value, op, arg)
+        else:
+            raise NotImplementedError(f"query operator {op}")
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc, query):
+    for key, cond in (query or {}).items():
+        if key == '$or':
+            if not any(matches(doc, q) for q in cond):
+                return False
+        elif key == '$and':
+            if not all(matches(doc, q) for q in cond):
+                return False
+        elif key.startswith('$'):
+            raise NotImplementedError(f"query operator {key}")
+        elif not _match_field(_get(doc, key), cond):
+            return False
+    return True
+
+
+# ------------------------------------------------------------ expressions
+
+def evaluate(expr, doc):
+    if isinstance(expr, str) and expr.startswith('$'):
+        value = _get(doc, expr[1:])
+        return None if value is _MISSING else value
+    if isinstance(expr, list):
+        return [evaluate(e, doc) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if not _is_operator_dict(expr):
+        return {k: evaluate(v, doc) for k, v in expr.items()}
+    (op, arg), = expr.items()
+    if op == '$literal':
+        return arg
+    if op == '$cond':
+        cond, then, other = (arg['if'], arg['then'], arg['else']) if isinstance(arg, dict) else arg
+        return evaluate(then if evaluate(cond, doc) else other, doc)
+    if op == '$ifNull':
+        for candidate in arg:
+            value = evaluate(candidate, doc)
+            if value is not None:
+                return value
+        return None
+    args = evaluate(arg, doc)
+    if op == '$add':
+        return None if None in args else sum(args)
+    if op == '$subtract':
+        return None if None in args else args[0] - args[1]
+    if op == '$multiply':
+        result = 1
+        for a in args:
+            result *= a
+        return result
+    if op in ('$min', '$max'):
+        values = [a for a in (args if isinstance(args, list) else [args]) if a is not None]
+        return (min if op == '$min' else max)(values) if values else None
+    if op in ('$gt', '$gte', '$lt', '$lte'):
+        return _compare(args[0], op, args[1])
+    if op == '$eq':
+        return args[0] == args[1]
+    if op == '$ne':
+        return args[0] != args[1]
+    if op == '$size':
+        return len(args)
+    if op == '$setIntersection':
+        first, *rest = args
+        return [v for v in dict.fromkeys(first) if all(v in r for r in rest)]
+    raise NotImplementedError(f"expression operator {op}")
+
+
+# ---------------------------------------------------------------- updates
+
+def apply_update(doc, update, is_insert=False):
+    if isinstance(update, list):
+        for stage in update:
+            (op, spec), = stage.items()
+            if op in ('$set', '$addFields'):
+                values = {field: evaluate(expr, doc) for field, expr in spec.items()}
+                for field, value in values.items():
+                    _set(doc, field, value)
+            elif op == '$unset':
+                for field in [spec] if isinstance(spec, str) else spec:
+                    _unset(doc, field)
+            else:
+                raise NotImplementedError(f"pipeline update stage {op}")
+        return
+    for op, spec in update.items():
+        if op == '$set':
+            for field, value in spec.items():
+                _set(doc, field, copy.deepcopy(value))
+        elif op == '$setOnInsert':
+            if is_insert:
+                for field, value in spec.items():
+                    _set(doc, field, copy.deepcopy(value))
+        elif op == '$unset':
+            for field in spec:
+                _unset(doc, field)
+        elif op == '$inc':
+            for field, delta in spec.items():
+                current = _get(doc, field)
+                _set(doc, field, (0 if current is _MISSING else current) + delta)
+        elif op in ('$max', '$min'):
+            pick = max if op == '$max' else min
+            for field, value in spec.items():
+                current = _get(doc, field)
+                _set(doc, field, value if current is _MISSING or current is None else pick(current, value))
+        elif op == '$addToSet':
+            for field, value in spec.items():
+                current = _get(doc, field)
+                current = [] if current is _MISSING else current
+                if value not in current:
+                    current = current + [value]
+                _set(doc, field, current)
+        elif op == '$push':
+            for field, value in spec.items():
+                current = _get(doc, field)
+                _set(doc, field, ([] if current is _MISSING else current) + [value])
+        elif op == '$pull':
+            for field, value in spec.items():
+                current = _get(doc, field)
+                if current is not _MISSING:
+                    _set(doc, field, [v for v in current if v != value])
+        else:
+            raise NotImplementedError(f"update operator {op}")
+
+
+def _upsert_seed(query):
+    seed = {}
+    for key, cond in (query or {}).items():
+        if key.startswith('$'):
+            continue
+        if _is_operator_dict(cond):
+            if '$eq' in cond:
+                _set(seed, key, cond['$eq'])
+            continue
+        _set(seed, key, copy.deepcopy(cond))
+    return seed
+
+
+def project(doc, projection):
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    include = [f for f, on in projection.items() if on and f != '_id']
+    if include:
+        result = {}
+        for field in include:
+            value = _get(doc, field)
+            if value is not _MISSING:
+                _set(result, field, value)
+        if projection.get('_id', 1) and '_id' in doc:
+            result['_id'] = doc['_id']
+        return result
+    for field, on in projection.items():
+        if not on:
+            _unset(doc, field)
+    return doc
+
+
+def _sort_key(sort):
+    """Key for list.sort: missing/None sort first ascending (last descending)."""
+    def compare(a, b):
+        for field, direction in sort:
+            va, vb = _get(a, field), _get(b, field)
+            va = None if va is _MISSING else va
+            vb = None if vb is _MISSING else vb
+            if va == vb:
+                continue
+            if va is None or vb is None:
+                result = -1 if va is None else 1
+            else:
+                result = -1 if va < vb else 1
+            return result * direction
+        return 0
+    return functools.cmp_to_key(compare)
+
+
+def _normalize_sort(key_or_list, direction=1):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction)]
+    return list(key_or_list)
+
+
+# ---------------------------------------------------------------- cursors
+
+class FakeCursor:
+    def __init__(self, load):
+        self._load = load
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._docs = None
+        self._position = 0
+
+    def sort(self, key_or_list, direction=1):
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def _materialize(self):
+        if self._docs is None:
+            docs = self._load(self._sort)
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            self._docs = docs
+        return self._docs
+
+    async def to_list(self, length=None):
+        docs = self._materialize()
+        end = len(docs) if not length else self._position + length
+        chunk = docs[self._position:end]
+        self._position += len(chunk)
+        return chunk
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        docs = self._materialize()
+        if self._position >= len(docs):
+            raise StopAsyncIteration
+        self._position += 1
+        return docs[self._position - 1]
+
+    async def close(self):
+        pass
+
+
+# ------------------------------------------------------------- collection
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self.docs = []
+        self._unique = []  # [(fields, partial filter)]
+
+    # -- indexes
+
+    async def create_index(self, keys, unique=False, partialFilterExpression=None, **kwargs):
+        fields = [keys] if isinstance(keys, str) else [field for field, _ in keys]
+        if unique:
+            self._unique.append((fields, partialFilterExpression))
+        return "_".join(fields)
+
+    def _check_unique(self, doc, exclude=None):
+        for fields, partial in self._unique:
+            if partial is not None and not matches(doc, partial):
+                continue
+            key = tuple(_get(doc, f) for f in fields)
+            key = tuple(None if v is _MISSING else v for v in key)
+            for other in self.docs:
+                if other is exclude or other is doc:
+                    continue
+                if partial is not None and not matches(other, partial):
+                    continue
+                other_key = tuple(None if v is _MISSING else v for v in (_get(other, f) for f in fields))
+                if other_key == key:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} {fields}")
+
+    # -- reads
+
+    def _find_docs(self, query, sort=None):
+        docs = [d for d in self.docs if matches(d, query)]
+        if sort:
+            docs.sort(key=_sort_key(sort))
+        return docs
+
+    def find(self, query=None, projection=None):
+        return FakeCursor(lambda sort: [project(d, projection) for d in self._find_docs(query, sort)])
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        docs = self._find_docs(query, _normalize_sort(sort) if sort else None)
+        return project(docs[0], projection) if docs else None
+
+    async def count_documents(self, query):
+        return len(self._find_docs(query))
+
+    async def distinct(self, field, query=None):
+        values = []
+        for doc in self._find_docs(query):
+            value = _get(doc, field)
+            for v in value if isinstance(value, list) else [value]:
+                if v is not _MISSING and v not in values:
+                    values.append(v)
+        return values
+
+    def aggregate(self, pipeline):
+        return FakeCursor(lambda sort: _run_pipeline(self.docs, pipeline))
+
+    # -- writes
+
+    async def insert_one(self, doc):
+        doc.setdefault('_id', ObjectId())
+        stored = copy.deepcopy(doc)
+        self._check_unique(stored)
+        self.docs.append(stored)
+        return SimpleNamespace(inserted_id=doc['_id'])
+
+    async def insert_many(self, docs, ordered=True):
+        ids = [(await self.insert_one(doc)).inserted_id for doc in docs]
+        return SimpleNamespace(inserted_ids=ids)
+
+    def _update(self, query, update, upsert, multi, sort=None):
+        """Returns (matched, modified, upserted doc or None, [(before, after)])."""
+        targets = self._find_docs(query, sort)
+        if not multi:
+            targets = targets[:1]
+        if not targets:
+            if not upsert:
+                return 0, 0, None, []
+            doc = _upsert_seed(query)
+            apply_update(doc, update, is_insert=True)
+            doc.setdefault('_id', ObjectId())
+            self._check_unique(doc)
+            self.docs.append(doc)
+            return 0, 0, doc, [(None, doc)]
+        changed = []
+        modified = 0
+        for doc in targets:
+            before = copy.deepcopy(doc)
+            after = copy.deepcopy(doc)
+            apply_update(after, update)
+            self._check_unique(after, exclude=doc)
+            doc.clear()
+            doc.update(after)
+            modified += int(before != after)
+            changed.append((before, doc))
+        return len(targets), modified, None, changed
+
+    async def update_one(self, query, update, upsert=False):
+        matched, modified, upserted, _ = self._update(query, update, upsert, multi=False)
+        return SimpleNamespace(matched_count=matched, modified_count=modified,
+                               upserted_id=upserted['_id'] if upserted else None)
+
+    async def update_many(self, query, update, upsert=False):
+        matched, modified, upserted, _ = self._update(query, update, upsert, multi=True)
+        return SimpleNamespace(matched_count=matched, modified_count=modified,
+                               upserted_id=upserted['_id'] if upserted else None)
+
+    async def find_one_and_update(self, query, update, projection=None, sort=None, upsert=False,
+                                  return_document=False):
+        _, _, upserted, changed = self._update(
+            query, update, upsert, multi=False, sort=_normalize_sort(sort) if sort else None
+        )
+        if not changed:
+            return None
+        before, after = changed[0]
+        result = after if return_document else before
+        return project(result, projection) if result is not None else None
+
+    async def replace_one(self, query, replacement, upsert=False):
+        targets = self._find_docs(query)[:1]
+        if not targets:
+            if upsert:
+                await self.insert_one(dict(replacement))
+            return SimpleNamespace(matched_count=0, modified_count=0)
+        doc = targets[0]
+        keep_id = doc.get('_id')
+        doc.clear()
+        doc.update(copy.deepcopy(replacement))
+        doc['_id'] = keep_id
+        return SimpleNamespace(matched_count=1, modified_count=1)
+
+    async def delete_one(self, query):
+        docs = self._find_docs(query)[:1]
+        for doc in docs:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=len(docs))
+
+    async def delete_many(self, query):
+        docs = self._find_docs(query)
+        for doc in docs:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=len(docs))
+
+    async def find_one_and_delete(self, query, projection=None):
+        docs = self._find_docs(query)[:1]
+        for doc in docs:
+            self.docs.remove(doc)
+        return project(docs[0], projection) if docs else None
+
+    async def bulk_write(self, requests, ordered=True):
+        counts = dict(nInserted=0, nMatched=0, nModified=0, nUpserted=0, nRemoved=0)
+        errors = []
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, (UpdateOne, UpdateMany)):
+                    matched, modified, upserted, _ = self._update(
+                        request._filter, request._doc, request._upsert, multi=isinstance(request, UpdateMany)
+                    )
+                    counts['nMatched'] += matched
+                    counts['nModified'] += modified
+                    counts['nUpserted'] += int(upserted is not None)
+                elif isinstance(request, InsertOne):
+                    await self.insert_one(request._doc)
+                    counts['nInserted'] += 1
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    delete = self.delete_many if isinstance(request, DeleteMany) else self.delete_one
+                    counts['nRemoved'] += (await delete(request._filter)).deleted_count
+                elif isinstance(request, ReplaceOne):
+                    result = await self.replace_one(request._filter, request._doc, request._upsert)
+                    counts['nMatched'] += result.matched_count
+                    counts['nModified'] += result.modified_count
+                else:
+                    raise NotImplementedError(f"bulk request {type(request).__name__}")
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError(dict(counts, writeErrors=errors))
+        return SimpleNamespace(
+            inserted_count=counts['nInserted'], matched_count=counts['nMatched'],
+            modified_count=counts['nModified'], upserted_count=counts['nUpserted'],
+            deleted_count=counts['nRemoved'], bulk_api_result=counts
+        )
+
+
+# ------------------------------------------------------------ aggregation
+
+def _run_pipeline(docs, pipeline):
+    docs = [copy.deepcopy(d) for d in docs]
+    for stage in pipeline:
+        (op, spec), = stage.items()
+        if op == '$match':
+            docs = [d for d in docs if matches(d, spec)]
+        elif op in ('$set', '$addFields'):
+            for doc in docs:
+                values = {field: evaluate(expr, doc) for field, expr in spec.items()}
+                for field, value in values.items():
+                    _set(doc, field, value)
+        elif op == '$project':
+            docs = [_project_stage(d, spec) for d in docs]
+        elif op == '$sort':
+            docs.sort(key=_sort_key(list(spec.items())))
+        elif op == '$limit':
+            docs = docs[:spec]
+        elif op == '$skip':
+            docs = docs[spec:]
+        elif op == '$group':
+            docs = _group(docs, spec)
+        else:
+            raise NotImplementedError(f"aggregation stage {op}")
+    return docs
+
+
+def _project_stage(doc, spec):
+    if all(v in (0, False) for v in spec.values()):
+        return project(doc, spec)
+    result = {}
+    if spec.get('_id', 1) and '_id' in doc:
+        result['_id'] = doc['_id']
+    for field, expr in spec.items():
+        if field == '_id':
+            continue
+        if expr in (1, True):
+            value = _get(doc, field)
+            if value is not _MISSING:
+                _set(result, field, value)
+        else:
+            _set(result, field, evaluate(expr, doc))
+    return result
+
+
+def _group(docs, spec):
+    groups = {}
+    order = []
+    for doc in docs:
+        key = evaluate(spec['_id'], doc)
+        marker = repr(key)
+        if marker not in groups:
+            groups[marker] = {'_id': key}
+            order.append(marker)
+        group = groups[marker]
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            (op, expr), = accumulator.items()
+            value = evaluate(expr, doc)
+            if op == '$sum':
+                group[field] = group.get(field, 0) + (value or 0)
+            elif op == '$push':
+                group.setdefault(field, []).append(value)
+            elif op == '$addToSet':
+                group.setdefault(field, [])
+                if value not in group[field]:
+                    group[field].append(value)
+            elif op == '$first':
+                group.setdefault(field, value)
+            elif op == '$last':
+                group[field] = value
+            elif op in ('$max', '$min'):
+                if value is not None:
+                    current = group.get(field)
+                    pick = max if op == '$max' else min
+                    group[field] = value if current is None else pick(current, value)
+            else:
+                raise NotImplementedError(f"group accumulator {op}")
+    return [groups[m] for m in order]
+
+
+# -------------------------------------------------------------- database
+
+class FakeDB:
+    """db.<name> / db[<name>] -> FakeCollection, created on first use."""
+
+    def __init__(self, **collections):
+        self._collections = {}
+        for name, docs in collections.items():
+            self[name].docs = [dict(d, _id=d.get('_id', ObjectId())) for d in copy.deepcopy(docs)]
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self):
+        return list(self._collections)
+
+
+def docs_of(collection, projection=None):
+    """Stored docs without _id, for assertions."""
+    return [project(d, projection or {"_id": 0}) for d in collection.docs]
+
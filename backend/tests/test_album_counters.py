@@ -0,0 +1,61 @@
+"""
+Unit tests for the per-album member counters (album_counters.py)
+Tests:
+- Joining an album that has members but no counter doc counts every member
+- Leaving such an album does not go negative
+- Reads and the startup backfill create missing counters without
+  overwriting existing ones
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import album_counters
+from album_counters import ALBUM_STATS_COLLECTION
+from fake_mongo import FakeDB
+
+
+def _members(album_id, *user_ids):
+    return [{"album_id": album_id, "user_id": uid} for uid in user_ids]
+
+
+def _count(db, album_id):
+    doc = next(d for d in db[ALBUM_STATS_COLLECTION].docs if d["album_id"] == album_id)
+    return doc["member_count"]
+
+
+class TestMissingCounter:
+    """Albums that predate the counters"""
+
+    def test_join_counts_existing_members(self):
+        async def run():
+            # u1 and u2 joined before counters existed; u3 has just been inserted
+            db = FakeDB(album_members=_members("a1", "u1", "u2", "u3"))
+            await album_counters.member_joined(db, "a1")
+            assert _count(db, "a1") == 3
+            await album_counters.member_joined(db, "a1")  # Counter exists now: plain $inc
+            assert _count(db, "a1") == 4
+        asyncio.run(run())
+
+    def test_leave_counts_remaining_members(self):
+        async def run():
+            db = FakeDB(album_members=_members("a1", "u1", "u2"))
+            await album_counters.member_left(db, "a1")
+            assert _count(db, "a1") == 2
+        asyncio.run(run())
+
+    def test_read_and_backfill_keep_existing_counters(self):
+        async def run():
+            db = FakeDB(
+                albums=[{"id": "a1"}, {"id": "a2"}, {"id": "a3"}],
+                album_members=_members("a1", "u1", "u2") + _members("a2", "u1"),
+                album_stats=[{"album_id": "a2", "member_count": 5}]
+            )
+            assert await album_counters.get_member_counts(db, ["a1", "a2"]) == {"a1": 2, "a2": 5}
+            assert await album_counters.backfill(db) == 1  # Only a3 was missing
+            assert _count(db, "a3") == 0
+            assert _count(db, "a2") == 5
+            assert await album_counters.backfill(db) == 0
+        asyncio.run(run())
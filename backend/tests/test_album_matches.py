@@ -0,0 +1,139 @@
+"""
+Unit tests for ranked, paginated album matches (GET /api/albums/{album_id}/matches),
+on an in-memory database
+Tests:
+- Ties on swap count are broken by distance, then reputation, then user id
+- Following X-Next-Cursor walks every match exactly once
+- A cursor at or past the last match returns an empty page without a next cursor
+- A malformed cursor is rejected with 400
+"""
+import asyncio
+import base64
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException, Response
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+
+import catalog_cache
+import match_index
+import server
+from fake_mongo import FakeDB
+
+ALBUM = "a1"
+KM = 1 / 111.195  # Degrees of latitude per km
+ORIGIN_LAT = 10.0
+
+# partner id -> (swap_count, km north of u0 or None for no location)
+PARTNERS = {
+    "p1": (3, 4.0),
+    "p2": (2, 1.0),
+    "p3": (2, 1.0),   # Trusted: ranks before p2 at the same distance
+    "p4": (2, 0.5),
+    "p5": (2, None),  # Unknown distance sorts after every known one
+    "p6": (1, 0.1),
+    "p7": (2, 1.0),   # Same swap count, distance and reputation as p2: id decides
+    "p8": (2, 9.0),   # Outside u0's 5 km radius
+}
+EXPECTED_ORDER = ["p1", "p4", "p3", "p2", "p7", "p5", "p6"]
+
+
+def user(user_id, km=None):
+    doc = {"id": user_id, "email": f"{user_id}@example.com", "display_name": user_id.upper()}
+    if km is not None:
+        doc.update(latitude=ORIGIN_LAT + km * KM, longitude=20.0)
+    return doc
+
+
+@pytest.fixture(autouse=True)
+def fake_db(monkeypatch):
+    catalog_cache.invalidate()
+    catalog_cache._versions_checked_at = 0.0
+    match_index._built_albums.clear()
+    db = FakeDB(
+        users=[user("u0", 0.0)] + [user(pid, km) for pid, (_, km) in PARTNERS.items()],
+        user_album_activations=[{"user_id": "u0", "album_id": ALBUM}],
+        user_reputation=[{"user_id": "p3", "successful_exchanges": 5, "failed_exchanges": 0}],
+        stickers=[{"id": "s1", "album_id": ALBUM, "number": 1}],
+        match_index_albums=[{"album_id": ALBUM, "version": match_index.INDEX_VERSION, "catalog_version": 0}],
+        match_index_pairs=[
+            {"album_id": ALBUM, "user_id": "u0", "partner_id": pid,
+             "give_count": swap, "get_count": swap + 1, "swap_count": swap}
+            for pid, (swap, _) in PARTNERS.items()
+        ],
+    )
+    monkeypatch.setattr(server, "db", db)
+    # The in-memory database has no $geoWithin; the in-process radius check still applies
+    monkeypatch.setattr(server, "within_radius_query", lambda current_user, radius_km: None)
+    yield db
+    catalog_cache.invalidate()
+    match_index._built_albums.clear()
+
+
+async def get_page(limit, cursor=None):
+    response = Response()
+    matches = await server.get_album_matches(ALBUM, response, limit=limit, cursor=cursor, user_id="u0")
+    return [m['user']['id'] for m in matches], response.headers.get("X-Next-Cursor")
+
+
+class TestRanking:
+    """Order of the ranked matches"""
+
+    def test_tie_ordering(self):
+        async def run():
+            ids, cursor = await get_page(limit=20)
+            assert ids == EXPECTED_ORDER
+            assert cursor is None
+        asyncio.run(run())
+
+    @pytest.mark.parametrize("limit", [1, 2, 3, 6, 7])
+    def test_pages_cover_every_match_once(self, limit):
+        async def run():
+            seen, cursor = await get_page(limit)
+            while cursor:
+                ids, cursor = await get_page(limit, cursor)
+                assert ids  # A next cursor is only sent when more matches exist
+                seen += ids
+            assert seen == EXPECTED_ORDER
+        asyncio.run(run())
+
+
+class TestCursor:
+    """Cursor edge cases"""
+
+    def test_past_last_page(self):
+        async def run():
+            # Cursor for the last match: nothing ranks after it
+            ranked, _ = await server.rank_album_matches(ALBUM, user("u0", 0.0), 20)
+            last_key = ranked[-1][0]
+            cursor = server.encode_match_cursor((-last_key[0],) + last_key[1:])
+            assert await get_page(5, cursor) == ([], None)
+            # Worse than any possible match
+            beyond = server.encode_match_cursor((0, server.UNKNOWN_DISTANCE_KM, 99, "zzz"))
+            assert await get_page(5, beyond) == ([], None)
+        asyncio.run(run())
+
+    def test_round_trip(self):
+        key = (2, 1.0, 1, "p2")
+        assert server.decode_match_cursor(server.encode_match_cursor(key)) == key
+
+    @pytest.mark.parametrize("cursor", [
+        "not base64!",
+        base64.urlsafe_b64encode(b"not json").decode(),
+        base64.urlsafe_b64encode(b"[1, 2.0, 0]").decode(),          # Missing the partner id
+        base64.urlsafe_b64encode(b'["x", 2.0, 0, "p1"]').decode(),  # Swap count not a number
+        base64.urlsafe_b64encode(b'{"swap": 1}').decode(),
+    ])
+    def test_invalid_cursor(self, cursor):
+        with pytest.raises(HTTPException) as exc:
+            server.decode_match_cursor(cursor)
+        assert exc.value.status_code == 400 and exc.value.detail == "INVALID_CURSOR"
+
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(get_page(5, cursor))
+        assert exc.value.status_code == 400
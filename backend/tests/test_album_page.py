@@ -0,0 +1,68 @@
+"""
+Unit tests for the album page endpoint (GET /api/albums/{album_id}), on an in-memory database
+Tests:
+- While the album's first match index build runs, the page is served with a
+  null exchange_count flagged as pending instead of a 503
+- Once the index is built the count is filled in
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+
+import catalog_cache
+import match_index
+import server
+from fake_mongo import FakeDB
+
+ALBUM = "a1"
+
+
+@pytest.fixture(autouse=True)
+def fake_db(monkeypatch):
+    catalog_cache.invalidate()
+    catalog_cache._versions_checked_at = 0.0
+    match_index._built_albums.clear()
+    db = FakeDB(
+        albums=[{"id": ALBUM, "name": "Album", "status": "active"}],
+        stickers=[{"id": sid, "album_id": ALBUM, "number": n} for n, sid in enumerate(["s1", "s2"], 1)],
+        users=[{"id": "u1", "email": "u1@example.com"}, {"id": "u2", "email": "u2@example.com"}],
+        user_album_activations=[{"user_id": uid, "album_id": ALBUM} for uid in ("u1", "u2")],
+        album_members=[{"album_id": ALBUM, "user_id": uid} for uid in ("u1", "u2")],
+        user_inventory=[
+            {"user_id": "u1", "album_id": ALBUM, "sticker_id": "s1", "owned_qty": 2},
+            {"user_id": "u2", "album_id": ALBUM, "sticker_id": "s2", "owned_qty": 2},
+        ],
+    )
+    monkeypatch.setattr(server, "db", db)
+    yield db
+    catalog_cache.invalidate()
+    match_index._built_albums.clear()
+
+
+class TestExchangeCount:
+    """exchange_count while the match index is (not yet) built"""
+
+    def test_pending_while_first_build_runs(self, fake_db):
+        async def run():
+            await match_index.ensure_indexes(fake_db)
+            assert await match_index._claim_build(fake_db, ALBUM) is not None  # Build in progress
+            album = await server.get_album(ALBUM, user_id="u1")
+            assert album['exchange_count'] is None
+            assert album['exchange_count_pending'] is True
+            assert album['progress'] == 50
+        asyncio.run(run())
+
+    def test_count_once_built(self, fake_db):
+        async def run():
+            await match_index.rebuild_album_index(fake_db, ALBUM)
+            album = await server.get_album(ALBUM, user_id="u1")
+            assert album['exchange_count'] == 1
+            assert album['exchange_count_pending'] is False
+        asyncio.run(run())
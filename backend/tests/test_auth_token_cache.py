@@ -0,0 +1,105 @@
+"""
+Unit tests for the verified-token claims cache and CurrentUser (auth.py)
+Tests:
+- A verified token is decoded once, then served from the cache
+- Cached claims stop being accepted once `exp` passes
+- Invalid tokens are rejected and never cached; the cache is LRU-bounded
+- CurrentUser loads the user document at most once
+- Stream tokens only open the event stream and session tokens cannot
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import auth
+from auth import (
+    CurrentUser, create_stream_token, create_token, decode_stream_token, decode_token, get_current_user
+)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    auth._token_cache.clear()
+    yield
+    auth._token_cache.clear()
+
+
+def _token(exp: float) -> str:
+    return jwt.encode({"user_id": "u1", "exp": int(exp)}, auth.JWT_SECRET, algorithm=auth.JWT_ALGORITHM)
+
+
+class TestTokenCache:
+    """Test the token -> claims cache"""
+
+    def test_decoded_once(self, monkeypatch):
+        token = create_token("u1")
+        assert decode_token(token)['user_id'] == "u1"
+        monkeypatch.setattr(auth.jwt, "decode", lambda *a, **k: pytest.fail("decoded again"))
+        assert decode_token(token)['user_id'] == "u1"
+
+    def test_respects_exp(self, monkeypatch):
+        token = _token(time.time() + 60)
+        decode_token(token)
+        later = time.time() + 120
+        monkeypatch.setattr(auth.time, "time", lambda: later)
+        with pytest.raises(HTTPException) as exc:
+            decode_token(token)
+        assert exc.value.detail == "Token expired"
+        assert token not in auth._token_cache
+
+    def test_invalid_not_cached(self):
+        with pytest.raises(HTTPException):
+            decode_token("not-a-token")
+        assert not auth._token_cache
+
+    def test_bounded(self, monkeypatch):
+        monkeypatch.setattr(auth, "TOKEN_CACHE_SIZE", 2)
+        tokens = [_token(time.time() + 60 + i) for i in range(3)]
+        for token in tokens:
+            decode_token(token)
+        assert list(auth._token_cache) == tokens[1:]
+
+
+class TestCurrentUser:
+    """Test the lazily loaded request user"""
+
+    def test_loads_once(self):
+        calls = []
+
+        async def loader(user_id):
+            calls.append(user_id)
+            return {"id": user_id}
+
+        async def run():
+            current_user = CurrentUser("u1", loader)
+            assert calls == []
+            assert await current_user.load() == {"id": "u1"}
+            assert await current_user.load() == {"id": "u1"}
+        asyncio.run(run())
+        assert calls == ["u1"]
+
+
+class TestStreamToken:
+    """Test the single-purpose event stream token"""
+
+    def test_stream_token_accepted(self):
+        claims = decode_stream_token(create_stream_token("u1"))
+        assert claims['user_id'] == "u1"
+        assert claims['exp'] <= time.time() + auth.STREAM_TOKEN_TTL_SECONDS + 1
+
+    def test_session_token_rejected_on_stream(self):
+        with pytest.raises(HTTPException) as exc:
+            decode_stream_token(create_token("u1"))
+        assert exc.value.status_code == 401
+
+    def test_stream_token_rejected_as_session(self):
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(get_current_user(f"Bearer {create_stream_token('u1')}"))
+        assert exc.value.status_code == 401
@@ -0,0 +1,47 @@
+"""
+Unit tests for the sticker catalog cache (catalog_cache.py)
+Tests:
+- Catalog is sorted by sticker number with a matching dense index
+- Copies handed to callers never leak mutations back into the cache
+- stickers_by_ids keeps the requested order and skips unknown ids
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from catalog_cache import AlbumCatalog
+
+
+def make_catalog():
+    stickers = [
+        {"id": "c", "album_id": "a1", "number": 3, "name": "Three"},
+        {"id": "a", "album_id": "a1", "number": 1, "name": "One"},
+        {"id": "b", "album_id": "a1", "number": 2, "name": "Two"},
+    ]
+    return AlbumCatalog("a1", stickers, version=4)
+
+
+class TestAlbumCatalog:
+    """Test the in-memory catalog snapshot"""
+
+    def test_sorted_by_number(self):
+        catalog = make_catalog()
+        assert [s['id'] for s in catalog.stickers] == ["a", "b", "c"]
+        assert catalog.sticker_index.sticker_ids == ["a", "b", "c"]
+        assert len(catalog) == 3
+        assert catalog.version == 4
+        assert "b" in catalog and "z" not in catalog
+
+    def test_copies_are_isolated(self):
+        catalog = make_catalog()
+        copies = catalog.copy_stickers()
+        copies[0]['owned_qty'] = 2
+        assert 'owned_qty' not in catalog.get("a")
+
+    def test_stickers_by_ids_order(self):
+        catalog = make_catalog()
+        result = catalog.stickers_by_ids(["c", "missing", "a"])
+        assert [s['id'] for s in result] == ["c", "a"]
+        result[0]['name'] = "changed"
+        assert catalog.get("c")['name'] == "Three"
@@ -0,0 +1,151 @@
+"""
+Unit tests for the per-user change feed (change_feed.py), on an in-memory database
+Tests:
+- Nothing recorded after `since`: None, which GET /api/me/changes turns into a 204
+- Reset when the cursor is ahead of the counter or its events expired
+- Paging with `has_more`
+- Gaps: a recent missing seq (insert still in flight) ends the batch and is
+  returned once it lands; an old one (failed insert) is skipped
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+
+import change_feed
+from fake_mongo import FakeDB
+
+
+def make_db():
+    db = FakeDB()
+    asyncio.run(change_feed.ensure_indexes(db))
+    return db
+
+
+async def record(db, count, user_id="u1"):
+    for i in range(count):
+        await change_feed.record(db, [user_id], "chat_message", {"n": i})
+
+
+async def allocate(db, user_id="u1", age_seconds=0):
+    """Allocate a seq whose insert has not landed; returns a function inserting it."""
+    seq = await change_feed._next_seq(db, user_id)
+
+    async def land():
+        await db[change_feed.EVENTS_COLLECTION].insert_one({
+            "user_id": user_id, "seq": seq, "type": "chat_message", "data": {},
+            "created_at": datetime.now(timezone.utc) - timedelta(seconds=age_seconds)
+        })
+    return land
+
+
+def age_events(db, seconds):
+    for event in db[change_feed.EVENTS_COLLECTION].docs:
+        event['created_at'] -= timedelta(seconds=seconds)
+
+
+def seqs(changes):
+    return [e['seq'] for e in changes['events']]
+
+
+class TestIdleAndReset:
+    """No changes and unusable cursors"""
+
+    def test_idle(self, monkeypatch):
+        db = make_db()
+
+        async def run():
+            assert await change_feed.get_changes(db, "u1", 0, 10) is None  # Nothing ever recorded
+            await record(db, 2)
+            assert await change_feed.get_changes(db, "u1", 2, 10) is None
+
+            import server
+            monkeypatch.setattr(server, "db", db)
+            response = await server.get_my_changes(since=2, limit=10, user_id="u1")
+            assert response.status_code == 204
+        asyncio.run(run())
+
+    def test_cursor_ahead_of_counter(self):
+        db = make_db()
+
+        async def run():
+            await record(db, 2)
+            changes = await change_feed.get_changes(db, "u1", 7, 10)
+            assert changes == {"events": [], "latest_seq": 2, "has_more": False, "reset": True}
+        asyncio.run(run())
+
+    def test_expired(self):
+        db = make_db()
+
+        async def run():
+            await record(db, 5)
+            await db[change_feed.EVENTS_COLLECTION].delete_many({"seq": {"$lte": 3}})  # TTL expiry
+            changes = await change_feed.get_changes(db, "u1", 2, 10)
+            assert changes['reset'] and seqs(changes) == [4, 5]
+
+            await db[change_feed.EVENTS_COLLECTION].delete_many({})
+            changes = await change_feed.get_changes(db, "u1", 2, 10)
+            assert changes == {"events": [], "latest_seq": 5, "has_more": False, "reset": True}
+        asyncio.run(run())
+
+
+class TestPaging:
+    """Batches of at most `limit` events"""
+
+    def test_has_more(self):
+        db = make_db()
+
+        async def run():
+            await record(db, 5)
+            first = await change_feed.get_changes(db, "u1", 0, 3)
+            assert seqs(first) == [1, 2, 3] and first['has_more'] and first['latest_seq'] == 3
+            second = await change_feed.get_changes(db, "u1", first['latest_seq'], 3)
+            assert seqs(second) == [4, 5] and not second['has_more'] and not second['reset']
+            assert await change_feed.get_changes(db, "u1", second['latest_seq'], 3) is None
+        asyncio.run(run())
+
+
+class TestGaps:
+    """Seqs allocated but not (yet) inserted"""
+
+    def test_recent_gap_waits_for_insert(self):
+        db = make_db()
+
+        async def run():
+            await record(db, 1)
+            land = await allocate(db)  # seq 2 still being inserted
+            await record(db, 1)        # seq 3 committed first
+            changes = await change_feed.get_changes(db, "u1", 0, 10)
+            assert seqs(changes) == [1] and changes['latest_seq'] == 1 and not changes['has_more']
+            assert await change_feed.get_changes(db, "u1", 1, 10) is None
+            await land()
+            assert seqs(await change_feed.get_changes(db, "u1", 1, 10)) == [2, 3]
+        asyncio.run(run())
+
+    def test_old_gap_skipped(self):
+        db = make_db()
+
+        async def run():
+            await record(db, 1)
+            await allocate(db)  # seq 2's insert failed
+            await record(db, 2)
+            age_events(db, change_feed.GAP_GRACE_SECONDS + 1)
+            changes = await change_feed.get_changes(db, "u1", 1, 10)
+            assert seqs(changes) == [3, 4] and changes['latest_seq'] == 4 and not changes['reset']
+        asyncio.run(run())
+
+    def test_gap_at_latest_seq(self):
+        db = make_db()
+
+        async def run():
+            await record(db, 1)
+            land = await allocate(db)
+            assert await change_feed.get_changes(db, "u1", 1, 10) is None
+            await land()
+            assert seqs(await change_feed.get_changes(db, "u1", 1, 10)) == [2]
+        asyncio.run(run())
@@ -0,0 +1,89 @@
+"""
+Unit tests for the daily new-chat quota (chat_quota.py), on an in-memory database
+Tests:
+- Chats are allowed up to the limit and denied after it
+- A new day starts from zero
+- release() gives a chat back and never goes below zero
+- A concurrent first chat of the day (losing the insert race) is still allowed
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import chat_quota
+from fake_mongo import FakeDB
+
+
+def make_db():
+    db = FakeDB()
+    asyncio.run(chat_quota.ensure_indexes(db))
+    return db
+
+
+class TestConsume:
+    """Taking chats from today's quota"""
+
+    def test_limit(self):
+        db = make_db()
+
+        async def run():
+            assert await chat_quota.consume(db, "u1", 2) == (True, 1)
+            assert await chat_quota.consume(db, "u1", 2) == (True, 2)
+            assert await chat_quota.consume(db, "u1", 2) == (False, 2)
+            assert await chat_quota.consume(db, "u2", 2) == (True, 1)  # Quotas are per user
+        asyncio.run(run())
+
+    def test_date_rollover(self, monkeypatch):
+        db = make_db()
+        monkeypatch.setattr(chat_quota, "today_str", lambda: "2026-01-01")
+
+        async def run():
+            assert await chat_quota.consume(db, "u1", 1) == (True, 1)
+            assert await chat_quota.consume(db, "u1", 1) == (False, 1)
+            monkeypatch.setattr(chat_quota, "today_str", lambda: "2026-01-02")
+            assert await chat_quota.get_used(db, "u1") == 0
+            assert await chat_quota.consume(db, "u1", 1) == (True, 1)
+        asyncio.run(run())
+
+    def test_release(self):
+        db = make_db()
+
+        async def run():
+            await chat_quota.release(db, "u1")  # Nothing taken yet: no doc, no negative count
+            assert await chat_quota.get_used(db, "u1") == 0
+            await chat_quota.consume(db, "u1", 1)
+            assert await chat_quota.consume(db, "u1", 1) == (False, 1)
+            await chat_quota.release(db, "u1")
+            assert await chat_quota.get_used(db, "u1") == 0
+            await chat_quota.release(db, "u1")
+            assert await chat_quota.get_used(db, "u1") == 0
+            assert await chat_quota.consume(db, "u1", 1) == (True, 1)
+        asyncio.run(run())
+
+    @pytest.mark.parametrize("limit, allowed", [(5, True), (1, False)])
+    def test_concurrent_first_chat(self, limit, allowed):
+        db = make_db()
+        collection = db[chat_quota.QUOTA_COLLECTION]
+        upsert = collection.find_one_and_update
+        calls = []
+
+        async def racing_upsert(query, update, **kwargs):
+            calls.append(query)
+            if len(calls) == 1:
+                # Another request inserted today's doc first; our insert loses the race
+                await collection.insert_one({"user_id": "u1", "date": query["date"], "used": 1})
+                raise DuplicateKeyError("E11000 duplicate key error")
+            return await upsert(query, update, **kwargs)
+
+        collection.find_one_and_update = racing_upsert
+
+        async def run():
+            result = await chat_quota.consume(db, "u1", limit)
+            assert result == ((True, 2) if allowed else (False, 1))
+            assert len(calls) == 2
+        asyncio.run(run())
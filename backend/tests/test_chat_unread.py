@@ -0,0 +1,180 @@
+"""
+Unit tests for the per-participant chat unread counters, on an in-memory database
+Tests:
+- Sending a message counts it as unread for the other participant only
+- Reading the newest messages resets the reader's counter and last_read;
+  reading older history does not
+- A message counted while a read is running is not cleared unseen
+- The backfill migration (migrate_chat_unread_counters.py) counts messages
+  from the other participant newer than last_read, and skips chats that
+  already have counters
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+
+import server
+from fake_mongo import FakeDB
+from migrate_chat_unread_counters import backfill_unread_counters, count_unread
+
+EXCHANGE = {"id": "e1", "album_id": "a1", "user_a_id": "ua", "user_b_id": "ub", "status": "pending"}
+
+
+def message(n, sender_id):
+    return {"id": f"m{n:02d}", "chat_id": "c1", "sender_id": sender_id, "content": f"hi {n}",
+            "is_system": False, "created_at": f"2026-01-01T00:00:{n:02d}+00:00"}
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDB(
+        exchanges=[dict(EXCHANGE)],
+        chats=[{"id": "c1", "exchange_id": "e1", "user_a_id": "ua", "user_b_id": "ub",
+                "user_a_unread": 0, "user_b_unread": 0}],
+    )
+    monkeypatch.setattr(server, "db", db)
+    return db
+
+
+async def chat_doc(db):
+    return await db.chats.find_one({"id": "c1"}, {"_id": 0})
+
+
+async def receive(db, n, sender_id="ua"):
+    """A message from `sender_id` as send_chat_message stores and counts it."""
+    await db.chat_messages.insert_one(message(n, sender_id))
+    reader_id = "ub" if sender_id == "ua" else "ua"
+    await server.mark_unread_for("c1", EXCHANGE, reader_id)
+
+
+class TestCounters:
+    """Counting and clearing unread messages"""
+
+    def test_send_counts_for_the_other_participant(self, fake_db):
+        async def run():
+            await server.send_chat_message("e1", content="hello", user_id="ua")
+            await server.send_chat_message("e1", content="again", user_id="ua")
+            chat = await chat_doc(fake_db)
+            assert (chat['user_a_unread'], chat['user_b_unread']) == (0, 2)
+            exchanges = await server.get_user_exchanges("a1", user_id="ub")
+            assert exchanges[0]['unread_count'] == 2 and exchanges[0]['has_unread']
+        asyncio.run(run())
+
+    def test_read_resets(self, fake_db):
+        async def run():
+            for n in range(1, 4):
+                await receive(fake_db, n)
+            page = await server.get_exchange_chat("e1", limit=2, user_id="ub")
+            assert [m['id'] for m in page['messages']] == ["m02", "m03"]
+            chat = await chat_doc(fake_db)
+            assert chat['user_b_unread'] == 0
+            assert chat['user_b_last_read'] == message(3, "ua")['created_at']
+            assert chat['user_a_unread'] == 0 and 'user_a_last_read' not in chat
+        asyncio.run(run())
+
+    def test_older_history_does_not_reset(self, fake_db):
+        async def run():
+            for n in range(1, 4):
+                await receive(fake_db, n)
+            await server.get_exchange_chat("e1", before="m03", user_id="ub")
+            assert (await chat_doc(fake_db))['user_b_unread'] == 3
+        asyncio.run(run())
+
+    def test_polling_since_resets(self, fake_db):
+        async def run():
+            await receive(fake_db, 1)
+            await server.get_exchange_chat("e1", user_id="ub")
+            await receive(fake_db, 2)
+            page = await server.get_exchange_chat("e1", since="m01", user_id="ub")
+            assert [m['id'] for m in page['messages']] == ["m02"]
+            chat = await chat_doc(fake_db)
+            assert chat['user_b_unread'] == 0 and chat['user_b_last_read'] == message(2, "ua")['created_at']
+        asyncio.run(run())
+
+
+class TestMessageDuringRead:
+    """A message arriving after the messages query was read"""
+
+    def _after_query(self, db, write):
+        """Run `write` right after the chat messages were queried; returns a function undoing it."""
+        collection = db.chat_messages
+        find = collection.find
+
+        def find_then_write(*args, **kwargs):
+            cursor = find(*args, **kwargs)
+            to_list = cursor.to_list
+
+            async def to_list_then_write(length):
+                docs = await to_list(length)
+                await write()
+                return docs
+            cursor.to_list = to_list_then_write
+            return cursor
+
+        collection.find = find_then_write
+        return lambda: setattr(collection, "find", find)
+
+    def test_counted_during_read(self, fake_db):
+        async def run():
+            await receive(fake_db, 1)
+            restore = self._after_query(fake_db, lambda: receive(fake_db, 2))
+            page = await server.get_exchange_chat("e1", user_id="ub")
+            assert [m['id'] for m in page['messages']] == ["m01"]
+            chat = await chat_doc(fake_db)
+            assert chat['user_b_unread'] >= 1  # m02 was not returned: not cleared
+            assert chat['user_b_last_read'] == message(1, "ua")['created_at']
+
+            restore()
+            await server.get_exchange_chat("e1", user_id="ub")
+            assert (await chat_doc(fake_db))['user_b_unread'] == 0
+        asyncio.run(run())
+
+    def test_counted_after_read(self, fake_db):
+        async def run():
+            await receive(fake_db, 1)
+            # Stored during the read, counted only after the reset
+            self._after_query(fake_db, lambda: fake_db.chat_messages.insert_one(message(2, "ua")))
+            await server.get_exchange_chat("e1", user_id="ub")
+            await server.mark_unread_for("c1", EXCHANGE, "ub")
+            assert (await chat_doc(fake_db))['user_b_unread'] == 1
+        asyncio.run(run())
+
+
+class TestMigration:
+    """Backfilling counters on chats created before them"""
+
+    def test_count_unread(self):
+        async def run():
+            db = FakeDB(chat_messages=[message(1, "ua"), message(2, "ub"), message(3, "ua"), message(4, "system")])
+            chat = {"id": "c1"}
+            assert await count_unread(db, chat, "ub", None) == 3
+            assert await count_unread(db, chat, "ub", message(1, "ua")['created_at']) == 2
+            assert await count_unread(db, chat, "ua", message(2, "ub")['created_at']) == 1
+            assert await count_unread(db, chat, "ua", message(4, "system")['created_at']) == 0
+        asyncio.run(run())
+
+    def test_backfill(self):
+        async def run():
+            db = FakeDB(
+                chats=[
+                    {"id": "c1", "user_a_id": "ua", "user_b_id": "ub",
+                     "user_b_last_read": message(1, "ua")['created_at']},
+                    {"id": "c2", "user_a_id": "ua", "user_b_id": "uc", "user_a_unread": 7, "user_b_unread": 0},
+                ],
+                chat_messages=[message(1, "ua"), message(2, "ub"), message(3, "ua")]
+                + [dict(message(5, "uc"), chat_id="c2")],
+            )
+            assert await backfill_unread_counters(db) == 1
+            c1 = await db.chats.find_one({"id": "c1"})
+            assert (c1['user_a_unread'], c1['user_b_unread']) == (1, 1)
+            c2 = await db.chats.find_one({"id": "c2"})
+            assert c2['user_a_unread'] == 7  # Already migrated: left alone
+            assert await backfill_unread_counters(db) == 0
+        asyncio.run(run())
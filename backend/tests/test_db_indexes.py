@@ -0,0 +1,51 @@
+"""
+Unit tests for the declarative index spec (db_indexes.py)
+Tests:
+- Spec names match MongoDB's default index names
+- explain() plan parsing finds COLLSCAN stages at any depth
+- Every hot query has an index whose leading field it filters on
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db_indexes import INDEX_SPECS, HOT_QUERIES, IndexSpec, _plan_stages
+
+
+def _filter_fields(query_filter: dict) -> list:
+    """Field sets the planner can use: one per $or branch, merged with top-level equality fields."""
+    top = {k for k in query_filter if not k.startswith("$")}
+    branches = query_filter.get("$or")
+    if not branches:
+        return [top]
+    return [top | set(branch) for branch in branches]
+
+
+class TestIndexSpec:
+    """Test spec helpers"""
+
+    def test_default_names(self):
+        assert IndexSpec("users", [("email", 1)], unique=True, sparse=True).name == "email_1"
+        assert IndexSpec("users", [("location_point", "2dsphere")]).name == "location_point_2dsphere"
+        assert IndexSpec("x", [("a", 1), ("b", -1)]).options() == {"name": "a_1_b_-1"}
+
+    def test_partial_options(self):
+        spec = IndexSpec("exchanges", [("pair_key", 1)], unique=True, partial={"status": "pending"})
+        assert spec.options() == {
+            "name": "pair_key_1", "unique": True, "partialFilterExpression": {"status": "pending"}
+        }
+
+    def test_plan_stages_nested(self):
+        plan = {"stage": "FETCH", "inputStage": {"stage": "OR", "inputStages": [
+            {"stage": "IXSCAN"}, {"stage": "COLLSCAN"}
+        ]}}
+        assert _plan_stages(plan) == ["FETCH", "OR", "IXSCAN", "COLLSCAN"]
+
+    def test_hot_queries_have_leading_index(self):
+        leading = {}
+        for spec in INDEX_SPECS:
+            leading.setdefault(spec.collection, set()).add(spec.keys[0][0])
+        for query in HOT_QUERIES:
+            for fields in _filter_fields(query.filter):
+                assert fields & leading.get(query.collection, set()), query.name
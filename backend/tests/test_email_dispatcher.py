@@ -0,0 +1,81 @@
+"""
+Unit tests for the email dispatcher (email_dispatcher.py) with the fake provider
+Tests:
+- send() reports delivery status, transient failures are retried
+- Quota errors are not retried and map to the OTP 'quota_exceeded' status
+- Queued messages are sent in batches, a full queue drops instead of blocking
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from email_dispatcher import EmailDispatcher
+from email_service import FakeEmailProvider, build_otp_email, build_invite_email, send_otp_email
+
+
+class TestEmailDispatcher:
+    """Test queueing, retries and batching"""
+
+    def test_retries_then_sent(self):
+        async def run():
+            provider = FakeEmailProvider(fail_times=2)
+            dispatcher = EmailDispatcher(provider, workers=1, backoff_seconds=0)
+            await dispatcher.start()
+            result = await dispatcher.send(build_otp_email("a@x.com", "123456"))
+            await dispatcher.stop()
+            assert result.status == "sent" and result.attempts == 3
+            assert [m.to for m in provider.sent] == ["a@x.com"]
+        asyncio.run(run())
+
+    def test_gives_up_after_max_attempts(self):
+        async def run():
+            provider = FakeEmailProvider(fail_times=5)
+            dispatcher = EmailDispatcher(provider, workers=1, max_attempts=2, backoff_seconds=0)
+            await dispatcher.start()
+            result = await dispatcher.send(build_otp_email("a@x.com", "123456"))
+            await dispatcher.stop()
+            assert result.status == "failed" and result.attempts == 2
+            assert "ConnectionError" in result.error
+        asyncio.run(run())
+
+    def test_quota_not_retried(self, monkeypatch):
+        monkeypatch.delenv("DEV_MODE", raising=False)
+        monkeypatch.delenv("DEV_OTP_MODE", raising=False)
+
+        async def run():
+            provider = FakeEmailProvider(quota_exceeded=True)
+            dispatcher = EmailDispatcher(provider, workers=1, backoff_seconds=0)
+            await dispatcher.start()
+            outcome = await send_otp_email(dispatcher, "a@x.com", "123456")
+            await dispatcher.stop()
+            assert outcome == (False, "quota_exceeded")
+            assert provider.calls == 1
+        asyncio.run(run())
+
+    def test_batches_queued_messages(self):
+        async def run():
+            provider = FakeEmailProvider()
+            dispatcher = EmailDispatcher(provider, workers=1, batch_size=10)
+            await dispatcher.start()
+            futures = [
+                dispatcher.submit(build_invite_email(f"u{i}@x.com", "654321", "Group", "Ana"))
+                for i in range(4)
+            ]
+            results = await asyncio.gather(*futures)
+            await dispatcher.stop()
+            assert [r.status for r in results] == ["sent"] * 4
+            assert [len(batch) for batch in provider.batches] == [4]
+        asyncio.run(run())
+
+    def test_full_queue_drops(self):
+        async def run():
+            dispatcher = EmailDispatcher(FakeEmailProvider(), workers=1, queue_size=1)
+            await dispatcher.start()
+            first = dispatcher.submit(build_otp_email("a@x.com", "1"))
+            second = dispatcher.submit(build_otp_email("b@x.com", "2"))
+            assert (await second).status == "dropped"
+            assert (await first).status == "sent"
+            await dispatcher.stop()
+        asyncio.run(run())
@@ -0,0 +1,24 @@
+"""
+Unit tests for the canonical exchange pair key (models.exchange_pair_key)
+Tests:
+- Same key whichever user starts the exchange
+- Different albums or partners give different keys
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from models import exchange_pair_key
+
+
+class TestExchangePairKey:
+    """Test the pending-exchange uniqueness key"""
+
+    def test_symmetric(self):
+        assert exchange_pair_key("album", "u1", "u2") == exchange_pair_key("album", "u2", "u1")
+
+    def test_distinct(self):
+        key = exchange_pair_key("album", "u1", "u2")
+        assert key != exchange_pair_key("other", "u1", "u2")
+        assert key != exchange_pair_key("album", "u1", "u3")
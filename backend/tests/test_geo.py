@@ -0,0 +1,66 @@
+"""
+Unit tests for geo helpers (geo.py)
+Tests:
+- Coordinates prefer structured fields, fall back to legacy fields
+- GeoJSON points use [lng, lat] order and reject out-of-range values
+- Radius query is skipped when the viewer has no location
+- Vectorized radius filter agrees with the scalar haversine check
+"""
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest
+
+import geo
+from geo import (
+    get_user_coordinates, build_location_point, within_radius_query,
+    haversine_distance, filter_within_radius, EARTH_RADIUS_KM
+)
+
+
+class TestGeoHelpers:
+    """Test location point helpers"""
+
+    def test_coordinates_fallback_to_legacy(self):
+        assert get_user_coordinates({"latitude": -34.6, "longitude": -58.4}) == (-34.6, -58.4)
+        assert get_user_coordinates({"location_lat": 40.4, "location_lng": -3.7}) == (40.4, -3.7)
+        assert get_user_coordinates({"latitude": -34.6}) is None
+        print("✓ Coordinates fall back to legacy fields")
+
+    def test_location_point_order_and_validation(self):
+        assert build_location_point(-34.6, -58.4) == {"type": "Point", "coordinates": [-58.4, -34.6]}
+        assert build_location_point(95, 10) is None
+        assert build_location_point("x", 10) is None
+        print("✓ GeoJSON points are [lng, lat] and validated")
+
+    def test_radius_query(self):
+        assert within_radius_query({}, 5) is None
+        query = within_radius_query({"latitude": 10.0, "longitude": 20.0}, 10)
+        geo = query["$or"][0]["location_point"]["$geoWithin"]["$centerSphere"]
+        assert geo == [[20.0, 10.0], 10 / EARTH_RADIUS_KM]
+        assert {"location_point": None} in query["$or"]
+        print("✓ Radius query uses $centerSphere and keeps users without location")
+
+    def test_filter_matches_scalar_check(self):
+        pytest.importorskip("numpy")
+        rng = random.Random(7)
+        me = {"latitude": -34.6, "longitude": -58.4}
+        candidates = [{"id": "no-location"}, {"id": "legacy", "location_lat": -34.61, "location_lng": -58.41}]
+        for i in range(200):
+            candidates.append({"id": str(i), "latitude": -34.6 + rng.uniform(-0.3, 0.3),
+                               "longitude": -58.4 + rng.uniform(-0.3, 0.3)})
+        expected = [c["id"] for c in candidates
+                    if get_user_coordinates(c) is None
+                    or haversine_distance(-34.6, -58.4, *get_user_coordinates(c)) <= 10]
+        assert len(candidates) >= geo.VECTORIZE_MIN_CANDIDATES
+        assert [c["id"] for c in filter_within_radius(me, candidates, 10)] == expected
+        assert "no-location" in expected and "legacy" in expected
+        print("✓ Vectorized filter keeps the same candidates as the scalar check")
+
+    def test_filter_without_viewer_location_keeps_all(self):
+        candidates = [{"id": "a", "latitude": 0, "longitude": 1}, {"id": "b"}]
+        assert filter_within_radius({}, candidates, 5) == candidates
+        print("✓ Viewer without location matches everyone")
@@ -0,0 +1,179 @@
+"""
+Unit tests for batch inventory updates (PUT /api/inventory/batch and
+PUT /api/groups/{group_id}/inventory/batch), on an in-memory database
+Tests:
+- Folding a sticker's items into one update clamps at 0 like applying them in order
+- Unknown stickers and malformed items are reported per item
+- With a match index, the exact (sticker, old, new) deltas reach
+  match_index.stickers_changed
+- Without one (and for group inventories) the bulk path reports the same
+  results and changed count
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+
+import catalog_cache
+import match_index
+import server
+from fake_mongo import FakeDB, docs_of, evaluate
+from models import GroupInventoryBatchUpdate, InventoryBatchItem, InventoryBatchUpdate
+
+ALBUM = "a1"
+
+
+def item(sticker_id, owned_qty=None, delta=None):
+    return InventoryBatchItem(sticker_id=sticker_id, owned_qty=owned_qty, delta=delta)
+
+
+@pytest.fixture(autouse=True)
+def fake_db(monkeypatch):
+    catalog_cache.invalidate()
+    catalog_cache._versions_checked_at = 0.0
+    match_index._built_albums.clear()
+    db = FakeDB(
+        albums=[{"id": ALBUM}],
+        stickers=[{"id": sid, "album_id": ALBUM, "number": n} for n, sid in enumerate(["s1", "s2", "s3"], 1)],
+        album_members=[{"album_id": ALBUM, "user_id": uid} for uid in ("u1", "u2")],
+        groups=[{"id": "g1", "album_id": ALBUM}],
+        group_members=[{"group_id": "g1", "user_id": "u1"}],
+        user_inventory=[
+            {"user_id": "u1", "album_id": ALBUM, "sticker_id": "s1", "owned_qty": 2},
+            {"user_id": "u1", "group_id": "g1", "sticker_id": "s1", "owned_qty": 2},
+            {"user_id": "u2", "album_id": ALBUM, "sticker_id": "s2", "owned_qty": 2},
+        ],
+    )
+    monkeypatch.setattr(server, "db", db)
+    yield db
+    catalog_cache.invalidate()
+    match_index._built_albums.clear()
+
+
+@pytest.fixture
+def index_calls(monkeypatch):
+    calls = []
+
+    async def stickers_changed(db, album_id, user_id, changes):
+        calls.append(("stickers_changed", user_id, sorted(changes)))
+
+    async def member_changed(db, album_id, user_id):
+        calls.append(("member_changed", user_id))
+
+    monkeypatch.setattr(match_index, "stickers_changed", stickers_changed)
+    monkeypatch.setattr(match_index, "member_changed", member_changed)
+    return calls
+
+
+def qty_of(db, user_id, sticker_id, **scope):
+    scope = scope or {"album_id": ALBUM}
+    docs = docs_of(db.user_inventory)
+    return next(d['owned_qty'] for d in docs
+                if d['user_id'] == user_id and d['sticker_id'] == sticker_id
+                and all(d.get(k) == v for k, v in scope.items()))
+
+
+BATCH = [
+    item("s1", delta=-5),            # 2 -> 0, clamped
+    item("s2", delta=-1),            # missing -> 0, clamped
+    item("s2", delta=3),             # 0 -> 3
+    item("s3", owned_qty=-4),        # clamped absolute
+    item("nope", delta=1),
+    item("s1"),                      # neither owned_qty nor delta
+    item("s1", owned_qty=1, delta=1),
+]
+
+EXPECTED_RESULTS = [
+    {"sticker_id": "s1", "status": "ok", "owned_qty": 0},
+    {"sticker_id": "s2", "status": "ok", "owned_qty": 0},
+    {"sticker_id": "s2", "status": "ok", "owned_qty": 3},
+    {"sticker_id": "s3", "status": "ok", "owned_qty": 0},
+    {"sticker_id": "nope", "status": "error", "error": "STICKER_NOT_FOUND"},
+    {"sticker_id": "s1", "status": "error", "error": "INVALID_ITEM"},
+    {"sticker_id": "s1", "status": "error", "error": "INVALID_ITEM"},
+]
+
+
+class TestQtyUpdate:
+    """inventory_qty_update folds items like applying them one by one"""
+
+    @pytest.mark.parametrize("start", [None, 0, 1, 4])
+    @pytest.mark.parametrize("sequence", [
+        [item("s1", delta=-3), item("s1", delta=1)],
+        [item("s1", delta=2), item("s1", delta=-5), item("s1", delta=1)],
+        [item("s1", delta=1), item("s1", owned_qty=2), item("s1", delta=-3)],
+        [item("s1", owned_qty=-1), item("s1", delta=2)],
+    ])
+    def test_matches_sequential(self, start, sequence):
+        expected = start or 0
+        for i in sequence:
+            expected = max(0, i.owned_qty if i.owned_qty is not None else expected + i.delta)
+        doc = {} if start is None else {"owned_qty": start}
+        assert evaluate(server.inventory_qty_update(sequence), doc) == expected
+
+
+class TestAlbumBatch:
+    """PUT /inventory/batch"""
+
+    def test_deltas_with_index(self, fake_db, index_calls):
+        async def run():
+            await match_index.rebuild_album_index(fake_db, ALBUM)
+            response = await server.update_inventory_batch(
+                InventoryBatchUpdate(album_id=ALBUM, items=BATCH), user_id="u1"
+            )
+            assert response == {"results": EXPECTED_RESULTS, "updated": 2}
+            # s3: missing -> 0 is no change
+            assert index_calls == [("stickers_changed", "u1", [("s1", 2, 0), ("s2", 0, 3)])]
+            assert qty_of(fake_db, "u1", "s1") == 0 and qty_of(fake_db, "u1", "s2") == 3
+        asyncio.run(run())
+
+    def test_bulk_without_index(self, fake_db, index_calls):
+        async def run():
+            response = await server.update_inventory_batch(
+                InventoryBatchUpdate(album_id=ALBUM, items=BATCH), user_id="u1"
+            )
+            assert response == {"results": EXPECTED_RESULTS, "updated": 2}
+            assert index_calls == [("member_changed", "u1")]
+            assert qty_of(fake_db, "u1", "s1") == 0 and qty_of(fake_db, "u1", "s2") == 3
+
+            response = await server.update_inventory_batch(
+                InventoryBatchUpdate(album_id=ALBUM, items=[item("s1", owned_qty=0)]), user_id="u1"
+            )
+            assert response["updated"] == 0 and len(index_calls) == 1
+        asyncio.run(run())
+
+    def test_real_index_stays_exact(self, fake_db):
+        async def run():
+            await match_index.rebuild_album_index(fake_db, ALBUM)
+            await server.update_inventory_batch(
+                InventoryBatchUpdate(album_id=ALBUM, items=[item("s1", delta=-1), item("s2", owned_qty=0)]),
+                user_id="u1"
+            )
+            incremental = await fake_db.match_index_pairs.find({}, {"_id": 0, "build": 0}).to_list(None)
+            match_index._built_albums.clear()
+            await match_index.rebuild_album_index(fake_db, ALBUM)
+            rebuilt = await fake_db.match_index_pairs.find({}, {"_id": 0, "build": 0}).to_list(None)
+            key = lambda p: (p['user_id'], p['partner_id'])
+            assert sorted(incremental, key=key) == sorted(rebuilt, key=key)
+        asyncio.run(run())
+
+
+class TestGroupBatch:
+    """PUT /groups/{group_id}/inventory/batch uses the bulk path"""
+
+    def test_bulk(self, fake_db, index_calls):
+        async def run():
+            response = await server.update_group_inventory_batch(
+                "g1", GroupInventoryBatchUpdate(items=BATCH), user_id="u1"
+            )
+            assert response == {"results": EXPECTED_RESULTS, "updated": 2}
+            assert index_calls == []
+            assert qty_of(fake_db, "u1", "s1", group_id="g1") == 0
+            assert qty_of(fake_db, "u1", "s1") == 2  # Album inventory untouched
+        asyncio.run(run())
@@ -0,0 +1,71 @@
+"""
+Unit tests for the bitset match engine (match_engine.py)
+Tests:
+- Sticker ids map to dense positions and decode back in catalog order
+- Duplicates (qty >= 2) and missing (qty == 0) bitmaps match the old list logic
+- Mutual match requires both directions
+- Unknown sticker ids are ignored
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from match_engine import AlbumStickerIndex, compare, can_match_anyone, mutual_counts
+
+STICKERS = ["s1", "s2", "s3", "s4", "s5"]
+
+
+def legacy_lists(inv_map):
+    duplicates = [sid for sid in STICKERS if inv_map.get(sid, 0) >= 2]
+    missing = [sid for sid in STICKERS if inv_map.get(sid, 0) == 0]
+    return duplicates, missing
+
+
+class TestMatchEngine:
+    """Test bitmap encoding and mutual-match comparison"""
+
+    def test_encode_matches_legacy_lists(self):
+        index = AlbumStickerIndex(STICKERS)
+        inv = {"s1": 3, "s2": 1, "s4": 2}
+        bits = index.encode(inv)
+        duplicates, missing = legacy_lists(inv)
+        assert index.decode(bits.duplicates) == duplicates
+        assert index.decode(bits.missing) == missing
+        print("✓ Bitmaps decode to the same duplicates/missing lists")
+
+    def test_mutual_match_both_directions(self):
+        index = AlbumStickerIndex(STICKERS)
+        me = index.encode({"s1": 2, "s2": 1, "s3": 1})
+        them = index.encode({"s4": 3, "s2": 1, "s3": 1})
+        match = compare(me, them)
+        assert match.is_mutual
+        assert index.decode(match.give_bits) == ["s1"]
+        assert index.decode(match.get_bits) == ["s4"]
+        assert (match.give_count, match.get_count) == (1, 1)
+        print("✓ Mutual match found in both directions")
+
+    def test_one_direction_is_not_mutual(self):
+        index = AlbumStickerIndex(STICKERS)
+        me = index.encode({"s1": 2, "s2": 1, "s3": 1, "s4": 1, "s5": 1})  # nothing missing
+        them = index.encode({"s2": 2})
+        assert not can_match_anyone(me)
+        assert not compare(me, them).is_mutual
+        print("✓ One-way matches are not mutual")
+
+    def test_unknown_stickers_ignored(self):
+        index = AlbumStickerIndex(STICKERS)
+        bits = index.encode({"other-album": 5, "s1": 2})
+        assert index.decode(bits.duplicates) == ["s1"]
+        assert len(index.decode(bits.missing)) == 4
+        print("✓ Stickers from other albums are ignored")
+
+    def test_mutual_counts_matches_compare(self):
+        index = AlbumStickerIndex(STICKERS)
+        me = index.encode({"s1": 2, "s2": 2})
+        them = index.encode({"s3": 2, "s4": 4})
+        match = compare(me, them)
+        assert mutual_counts(me, them) == (match.give_count, match.get_count) == (2, 2)
+        assert index.decode(match.give_bits) == ["s1", "s2"]
+        assert index.decode(match.get_bits) == ["s3", "s4"]
+        print("✓ mutual_counts() agrees with compare()")
@@ -0,0 +1,250 @@
+"""
+Unit tests for the persisted match index (match_index.py), on an in-memory database
+Tests:
+- Incremental give/get deltas (duplicate and missing transitions, batches,
+  joins and leaves) leave the same pairs as a full rebuild
+- Writes made while a build runs (inventory change, join, leave) are kept
+- A second build of the same album is refused while the first holds the claim
+- Writes keep maintaining an index served for an older catalog
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import catalog_cache
+import match_index
+from fake_mongo import FakeDB
+
+ALBUM = "a1"
+STICKERS = ["s1", "s2", "s3", "s4"]
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    catalog_cache.invalidate()
+    catalog_cache._versions_checked_at = 0.0
+    match_index._built_albums.clear()
+    yield
+    catalog_cache.invalidate()
+    match_index._built_albums.clear()
+
+
+async def make_db(inventories):
+    """inventories: {user_id: {sticker_id: owned_qty}}, every user an album member."""
+    db = FakeDB(
+        albums=[{"id": ALBUM}],
+        stickers=[{"id": sid, "album_id": ALBUM, "number": n} for n, sid in enumerate(STICKERS, 1)],
+        album_members=[{"album_id": ALBUM, "user_id": uid} for uid in inventories],
+        user_inventory=[
+            {"user_id": uid, "album_id": ALBUM, "sticker_id": sid, "owned_qty": qty}
+            for uid, items in inventories.items() for sid, qty in items.items()
+        ],
+    )
+    await match_index.ensure_indexes(db)
+    return db
+
+
+async def set_qty(db, user_id, sticker_id, qty, notify=True):
+    previous = await db.user_inventory.find_one_and_update(
+        {"user_id": user_id, "album_id": ALBUM, "sticker_id": sticker_id},
+        {"$set": {"owned_qty": qty}}, upsert=True
+    )
+    old_qty = previous.get('owned_qty', 0) if previous else 0
+    if notify:
+        await match_index.sticker_changed(db, ALBUM, user_id, sticker_id, old_qty, qty)
+    return old_qty
+
+
+async def join(db, user_id):
+    await db.album_members.insert_one({"album_id": ALBUM, "user_id": user_id})
+    await match_index.member_added(db, ALBUM, user_id)
+
+
+async def leave(db, user_id):
+    await db.album_members.delete_one({"album_id": ALBUM, "user_id": user_id})
+    await match_index.member_removed(db, ALBUM, user_id)
+
+
+async def pairs(db):
+    docs = await db.match_index_pairs.find({"album_id": ALBUM}).to_list(None)
+    return {
+        (d['user_id'], d['partner_id']): (d['give_count'], d['get_count'], d['swap_count'])
+        for d in docs if d['give_count'] or d['get_count']
+    }
+
+
+async def rebuilt_pairs(db):
+    """Pairs a from-scratch build produces for the current data."""
+    match_index._built_albums.clear()
+    assert await match_index.rebuild_album_index(db, ALBUM) is not None
+    return await pairs(db)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestIncrementalDeltas:
+    """Incremental updates must match a full rebuild"""
+
+    def test_build(self):
+        async def go():
+            db = await make_db({"u1": {"s1": 2, "s2": 1}, "u2": {"s3": 3}})
+            assert await match_index.rebuild_album_index(db, ALBUM) == 2
+            # u1 gives s1 (u2 misses it), u2 gives s3 (u1 misses it)
+            assert await pairs(db) == {("u1", "u2"): (1, 1, 1), ("u2", "u1"): (1, 1, 1)}
+            assert await match_index.get_mutual_pairs(db, ALBUM, "u1") == [
+                {"partner_id": "u2", "give_count": 1, "get_count": 1}
+            ]
+        run(go())
+
+    def test_duplicate_and_missing_transitions(self):
+        async def go():
+            db = await make_db({"u1": {"s1": 2, "s2": 1}, "u2": {"s3": 3}, "u3": {"s2": 2}})
+            await match_index.rebuild_album_index(db, ALBUM)
+            await set_qty(db, "u1", "s2", 2)  # u1's s2 becomes a duplicate
+            await set_qty(db, "u2", "s1", 1)  # u2 no longer misses s1
+            await set_qty(db, "u3", "s2", 0)  # u3's duplicate s2 is gone, s2 now missing
+            await set_qty(db, "u3", "s3", 1)  # u3 no longer misses s3
+            incremental = await pairs(db)
+            assert incremental == await rebuilt_pairs(db)
+        run(go())
+
+    def test_batch_changes(self):
+        async def go():
+            db = await make_db({"u1": {"s1": 2}, "u2": {"s2": 2}, "u3": {}})
+            await match_index.rebuild_album_index(db, ALBUM)
+            changes = []
+            for sid, qty in (("s2", 1), ("s3", 2), ("s4", 3)):
+                changes.append((sid, await set_qty(db, "u1", sid, qty, notify=False), qty))
+            await match_index.stickers_changed(db, ALBUM, "u1", changes)
+            incremental = await pairs(db)
+            assert incremental == await rebuilt_pairs(db)
+            assert incremental[("u1", "u3")][0] == 3  # s1, s3, s4 to u3
+        run(go())
+
+    def test_join_and_leave(self):
+        async def go():
+            db = await make_db({"u1": {"s1": 2}, "u2": {"s2": 2}})
+            await match_index.rebuild_album_index(db, ALBUM)
+            await db.user_inventory.insert_one({"user_id": "u3", "album_id": ALBUM, "sticker_id": "s3", "owned_qty": 2})
+            await join(db, "u3")
+            assert ("u3", "u1") in await pairs(db)
+            assert await pairs(db) == await rebuilt_pairs(db)
+            await leave(db, "u1")
+            assert not any("u1" in key for key in await pairs(db))
+            assert await pairs(db) == await rebuilt_pairs(db)
+        run(go())
+
+
+class TestWritesDuringBuild:
+    """Writes that race a build's snapshot are replayed before it finishes"""
+
+    def _during_build(self, monkeypatch, write):
+        """Run `write` right after the build has read its snapshot."""
+        original = match_index._compute_row
+        state = {"done": False}
+
+        async def compute_row(db, member):
+            if not state["done"]:
+                state["done"] = True
+                await write()
+            return await original(db, member)
+
+        monkeypatch.setattr(match_index, "_compute_row", compute_row)
+        return state
+
+    def _check(self, monkeypatch, inventories, write, built_before):
+        async def go():
+            db = await make_db(inventories)
+            if built_before:
+                await match_index.rebuild_album_index(db, ALBUM)
+            state = self._during_build(monkeypatch, lambda: write(db))
+            match_index._built_albums.clear()
+            await match_index.rebuild_album_index(db, ALBUM)
+            assert state["done"]
+            monkeypatch.undo()
+            after_build = await pairs(db)
+            assert after_build == await rebuilt_pairs(db)
+            return after_build
+        return run(go())
+
+    @pytest.mark.parametrize("built_before", [False, True])
+    def test_inventory_change(self, monkeypatch, built_before):
+        result = self._check(
+            monkeypatch, {"u1": {"s1": 2}, "u2": {"s2": 2}},
+            lambda db: set_qty(db, "u2", "s1", 1), built_before
+        )
+        assert result[("u1", "u2")][0] == 0  # u2 no longer misses s1
+
+    @pytest.mark.parametrize("built_before", [False, True])
+    def test_join(self, monkeypatch, built_before):
+        async def write(db):
+            await db.user_inventory.insert_one({"user_id": "u3", "album_id": ALBUM, "sticker_id": "s3", "owned_qty": 2})
+            await join(db, "u3")
+        result = self._check(monkeypatch, {"u1": {"s1": 2}, "u2": {"s2": 2}}, write, built_before)
+        assert ("u3", "u1") in result
+
+    @pytest.mark.parametrize("built_before", [False, True])
+    def test_leave(self, monkeypatch, built_before):
+        result = self._check(
+            monkeypatch, {"u1": {"s1": 2}, "u2": {"s2": 2}, "u3": {"s3": 2}},
+            lambda db: leave(db, "u3"), built_before
+        )
+        assert not any("u3" in key for key in result)
+
+
+class TestBuildClaim:
+    """Only one build per album at a time"""
+
+    def test_second_build_refused(self, monkeypatch):
+        async def go():
+            db = await make_db({"u1": {"s1": 2}, "u2": {"s2": 2}})
+            results = []
+
+            async def nested():
+                results.append(await match_index.rebuild_album_index(db, ALBUM))
+
+            original = match_index._compute_row
+            calls = []
+
+            async def compute_row(db_, member):
+                if not calls:
+                    calls.append(1)
+                    await nested()
+                return await original(db_, member)
+
+            monkeypatch.setattr(match_index, "_compute_row", compute_row)
+            assert await match_index.rebuild_album_index(db, ALBUM) == 2
+            assert results == [None]
+            marker = await db.match_index_albums.find_one({"album_id": ALBUM})
+            assert "building_token" not in marker and marker['version'] == match_index.INDEX_VERSION
+        run(go())
+
+    def test_first_build_raises_index_building(self):
+        async def go():
+            db = await make_db({"u1": {"s1": 2}})
+            assert await match_index._claim_build(db, ALBUM) is not None
+            with pytest.raises(match_index.IndexBuilding):
+                await match_index.ensure_album_index(db, ALBUM)
+            await asyncio.sleep(0)  # Scheduled build finds the claim taken
+        run(go())
+
+
+class TestStaleCatalog:
+    """An index served for an older catalog keeps receiving writes"""
+
+    def test_writes_applied_while_stale(self):
+        async def go():
+            db = await make_db({"u1": {"s1": 2}, "u2": {"s2": 2}})
+            await match_index.rebuild_album_index(db, ALBUM)
+            await db.catalog_versions.insert_one({"album_id": ALBUM, "version": 1})
+            catalog_cache._versions_checked_at = 0.0
+            assert not await match_index.is_album_indexed(db, ALBUM)
+            await set_qty(db, "u2", "s1", 1)
+            assert (await pairs(db))[("u1", "u2")] == (0, 1, 0)
+        run(go())
@@ -0,0 +1,58 @@
+"""
+Unit tests for the in-memory OTP store (otp_store.py)
+Tests:
+- Attempts are counted and a code is single use
+- A new code replaces the previous one and resets attempts
+- Expired codes are evicted and the size stays capped
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from otp_store import MemoryOTPStore
+
+
+def _in(minutes: int) -> datetime:
+    return datetime.now(timezone.utc) + timedelta(minutes=minutes)
+
+
+class TestMemoryOTPStore:
+    """Test the single-worker backend"""
+
+    def test_attempts_and_single_use(self):
+        async def run():
+            store = MemoryOTPStore()
+            assert await store.attempt("a@x.com") is None
+            await store.put("a@x.com", "h1", _in(10))
+            assert (await store.attempt("a@x.com"))['attempts'] == 1
+            assert (await store.attempt("a@x.com"))['attempts'] == 2
+            assert not await store.consume("a@x.com", "wrong")
+            assert await store.consume("a@x.com", "h1")
+            assert not await store.consume("a@x.com", "h1")
+            assert await store.attempt("a@x.com") is None
+        asyncio.run(run())
+
+    def test_put_replaces_code(self):
+        async def run():
+            store = MemoryOTPStore()
+            await store.put("a@x.com", "h1", _in(10))
+            await store.attempt("a@x.com")
+            await store.put("a@x.com", "h2", _in(10))
+            entry = await store.attempt("a@x.com")
+            assert entry['hash'] == "h2" and entry['attempts'] == 1
+        asyncio.run(run())
+
+    def test_eviction(self):
+        async def run():
+            store = MemoryOTPStore(max_entries=3)
+            await store.put("old@x.com", "h", _in(-1))
+            await store.put("b@x.com", "h", _in(10))
+            assert await store.attempt("old@x.com") is None
+            for i in range(5):
+                await store.put(f"user{i}@x.com", "h", _in(10))
+            assert len(store) == 3
+            assert await store.attempt("b@x.com") is None
+        asyncio.run(run())
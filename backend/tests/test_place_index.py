@@ -0,0 +1,89 @@
+"""
+Unit tests for the place search index (place_index.py / location_data.search_places)
+Tests:
+- Accent-insensitive matching ("Bogota" finds "Bogotá")
+- Ranking: name prefix > word prefix > substring > fuzzy
+- Two-character queries also match inside names
+- Typos and swapped letters within the edit-distance bound
+- Country filter, limit and PlaceSearchResult shape
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from place_index import PlaceIndex, fold, prefix_edit_distance
+from location_data import search_places
+
+
+def _place(place_id, city, region, cc="AR"):
+    return {
+        "place_id": place_id, "label": f"{city}, {region}", "city_name": city,
+        "region_name": region, "country_code": cc, "latitude": 0.0, "longitude": 0.0
+    }
+
+
+INDEX = PlaceIndex([
+    _place("mdp", "Mar del Plata", "Buenos Aires"),
+    _place("lp", "La Plata", "Buenos Aires"),
+    _place("pl", "Platanos", "Buenos Aires"),
+    _place("bog", "Bogotá", "Bogotá D.C.", "CO"),
+    _place("mar", "Marbella", "Andalucía", "ES"),
+])
+
+
+def _ids(query, country=None, limit=10):
+    return [r['place_id'] for r in INDEX.search(query, country, limit)]
+
+
+class TestHelpers:
+    """Test folding and distance"""
+
+    def test_fold(self):
+        assert fold("  Bogotá D.C. ") == "bogota d c"
+        assert fold("São Paulo") == "sao paulo"
+
+    def test_prefix_edit_distance(self):
+        assert prefix_edit_distance("bogot", "bogota", 1) == 0
+        assert prefix_edit_distance("bgota", "bogota", 1) == 1
+        assert prefix_edit_distance("bogtoa", "bogota", 1) == 1  # Swapped letters
+        assert prefix_edit_distance("xyzw", "bogota", 1) is None
+
+
+class TestPlaceIndex:
+    """Test matching and ranking"""
+
+    def test_accent_insensitive(self):
+        assert _ids("Bogota") == ["bog"]
+        assert _ids("andalucia") == ["mar"]
+
+    def test_ranking(self):
+        # Name prefix (Platanos) before word prefix (La Plata, Mar del Plata)
+        assert _ids("plat") == ["pl", "mdp", "lp"]
+        assert _ids("mar") == ["mdp", "mar"]
+        # Substring after prefixes
+        assert _ids("gota") == ["bog"]
+
+    def test_short_substring(self):
+        # Shorter than a trigram: found by the linear scan
+        assert _ids("ta") == ["mdp", "lp", "pl", "bog"]
+        assert _ids("ta", "co") == ["bog"]
+        assert search_places("ta")
+
+    def test_fuzzy(self):
+        assert _ids("bogtoa") == ["bog"]
+        assert _ids("marbela") == ["mar"]
+        assert _ids("zzzz") == []
+
+    def test_country_and_limit(self):
+        assert _ids("mar", "es") == ["mar"]
+        assert len(_ids("a", limit=2)) <= 2
+
+    def test_search_places_shape(self):
+        results = search_places("Bogota")
+        assert results and results[0]['city_name'] == "Bogotá"
+        assert set(results[0]) == {
+            "place_id", "label", "city_name", "region_name", "country_code", "latitude", "longitude"
+        }
+        results[0]['label'] = "changed"
+        assert search_places("Bogota")[0]['label'] != "changed"
@@ -0,0 +1,102 @@
+"""
+Unit tests for token-bucket rate limiting (rate_limit.py)
+Tests:
+- A bucket allows its burst, then reports Retry-After until it refills
+- IP and identity buckets are independent
+- Requests rejected by the identity bucket do not spend the IP budget
+- The client IP is read behind the trusted proxies only
+- Storage errors fail open
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import rate_limit
+from rate_limit import MemoryRateLimiter, RateLimit, forwarded_client_ip
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMemoryRateLimiter:
+    """Test the in-process token bucket"""
+
+    def test_burst_then_refill(self):
+        async def run():
+            clock = FakeClock()
+            limiter = MemoryRateLimiter(clock=clock)
+            limit = RateLimit(capacity=3, per_seconds=60)  # One token every 20s
+            assert [await limiter.take("k", limit) for _ in range(3)] == [0, 0, 0]
+            assert await limiter.take("k", limit) == 20
+            clock.now += 10
+            assert await limiter.take("k", limit) == 10
+            clock.now += 10
+            assert await limiter.take("k", limit) == 0
+        asyncio.run(run())
+
+    def test_key_cap(self):
+        async def run():
+            limiter = MemoryRateLimiter(max_keys=2, clock=FakeClock())
+            limit = RateLimit(capacity=1, per_seconds=60)
+            for key in ("a", "b", "c"):
+                await limiter.take(key, limit)
+            assert len(limiter._buckets) == 2
+        asyncio.run(run())
+
+
+class TestCheck:
+    """Test per-IP and per-identity checks"""
+
+    def test_ip_and_identity(self):
+        async def run():
+            limiter = MemoryRateLimiter(clock=FakeClock())
+            limits = (RateLimit(capacity=2, per_seconds=60), RateLimit(capacity=1, per_seconds=60))
+            assert await rate_limit.check(limiter, "otp", limits, "1.1.1.1", "a@x.com") == 0
+            # Same identity from another IP: identity bucket is empty
+            assert await rate_limit.check(limiter, "otp", limits, "2.2.2.2", "a@x.com") > 0
+            # Another identity from the first IP: IP bucket has one token left
+            assert await rate_limit.check(limiter, "otp", limits, "1.1.1.1", "b@x.com") == 0
+            assert await rate_limit.check(limiter, "otp", limits, "1.1.1.1", "c@x.com") > 0
+        asyncio.run(run())
+
+    def test_identity_rejection_keeps_ip_budget(self):
+        async def run():
+            limiter = MemoryRateLimiter(clock=FakeClock())
+            limits = (RateLimit(capacity=2, per_seconds=60), RateLimit(capacity=1, per_seconds=60))
+            assert await rate_limit.check(limiter, "otp", limits, "1.1.1.1", "a@x.com") == 0
+            for _ in range(3):
+                assert await rate_limit.check(limiter, "otp", limits, "1.1.1.1", "a@x.com") > 0
+            # The rejected retries gave their IP tokens back
+            assert await rate_limit.check(limiter, "otp", limits, "1.1.1.1", "b@x.com") == 0
+        asyncio.run(run())
+
+    def test_fails_open(self):
+        class BrokenLimiter:
+            async def take(self, key, limit):
+                raise RuntimeError("storage down")
+
+        async def run():
+            limits = (RateLimit(1, 60), RateLimit(1, 60))
+            assert await rate_limit.check(BrokenLimiter(), "otp", limits, "1.1.1.1", "a@x.com") == 0
+        asyncio.run(run())
+
+
+class TestForwardedClientIp:
+    """Test X-Forwarded-For parsing behind trusted proxies"""
+
+    def test_ignores_spoofed_hops(self):
+        # Client sent "6.6.6.6" itself; the ingress appended the real address
+        assert forwarded_client_ip("6.6.6.6, 1.2.3.4", "10.0.0.1", 1) == "1.2.3.4"
+        assert forwarded_client_ip("6.6.6.6, 1.2.3.4, 10.0.0.2", "10.0.0.1", 2) == "1.2.3.4"
+
+    def test_falls_back_to_peer(self):
+        assert forwarded_client_ip(None, "10.0.0.1", 1) == "10.0.0.1"
+        assert forwarded_client_ip("6.6.6.6", "1.2.3.4", 0) == "1.2.3.4"
+        assert forwarded_client_ip("1.2.3.4", "10.0.0.1", 2) == "1.2.3.4"
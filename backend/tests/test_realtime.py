@@ -0,0 +1,65 @@
+"""
+Unit tests for the real-time push hub (realtime.py)
+Tests:
+- Events reach every subscriber of the target users only
+- Slow subscribers drop the oldest events instead of blocking publishers
+- The SSE stream emits formatted frames and unsubscribes on close
+"""
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import realtime
+from realtime import RealtimeHub, LocalBroker, format_sse, stream_events
+
+
+class TestRealtimeHub:
+    """Test pub/sub through the local broker"""
+
+    def test_publish_to_participants(self):
+        async def run():
+            hub = RealtimeHub(LocalBroker())
+            await hub.start()
+            alice_1, alice_2 = hub.subscribe("alice"), hub.subscribe("alice")
+            bob = hub.subscribe("bob")
+            await hub.publish(["alice", "alice"], "chat_message", {"exchange_id": "e1"})
+            assert alice_1.get_nowait() == {"type": "chat_message", "data": {"exchange_id": "e1"}}
+            assert alice_2.qsize() == 1
+            assert bob.empty()
+            hub.unsubscribe("alice", alice_1)
+            assert hub.subscriber_count("alice") == 1
+        asyncio.run(run())
+
+    def test_slow_subscriber_drops_oldest(self, monkeypatch):
+        monkeypatch.setattr(realtime, "SUBSCRIBER_QUEUE_SIZE", 2)
+
+        async def run():
+            hub = RealtimeHub(LocalBroker())
+            await hub.start()
+            queue = hub.subscribe("alice")
+            for i in range(3):
+                await hub.publish(["alice"], "chat_message", {"n": i})
+            assert [queue.get_nowait()["data"]["n"] for _ in range(2)] == [1, 2]
+        asyncio.run(run())
+
+    def test_stream_frames(self):
+        async def run():
+            hub = RealtimeHub(LocalBroker())
+            await hub.start()
+            stream = stream_events(hub, "alice")
+            assert await stream.__anext__() == "retry: 3000\n\n"
+            next_frame = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0)
+            await hub.publish(["alice"], "exchange_updated", {"status": "completed"})
+            frame = await next_frame
+            assert frame.startswith("event: exchange_updated\n")
+            assert json.loads(frame.split("data: ")[1]) == {"status": "completed"}
+            await stream.aclose()
+            assert hub.subscriber_count("alice") == 0
+        asyncio.run(run())
+
+    def test_format_sse(self):
+        assert format_sse({"type": "x", "data": {"a": 1}}) == 'event: x\ndata: {"a": 1}\n\n'
@@ -0,0 +1,88 @@
+"""
+Unit tests for request-scoped loaders (request_loader.py)
+Tests:
+- Loads issued concurrently are batched into one call
+- Repeated loads are served from the cache
+- prime/clear control what later loads return
+- prime/clear while a load is queued still resolve that load
+- A failed batch is retried by the next caller
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest
+
+from request_loader import BatchLoader
+
+
+def make_loader(calls, fail_first=False):
+    async def batch_fn(keys):
+        calls.append(list(keys))
+        if fail_first and len(calls) == 1:
+            raise RuntimeError("db down")
+        return {k: f"doc-{k}" for k in keys if k != "missing"}
+    return BatchLoader(batch_fn)
+
+
+class TestBatchLoader:
+    """Test batching and caching"""
+
+    def test_concurrent_loads_are_batched(self):
+        async def run():
+            calls = []
+            loader = make_loader(calls)
+            results = await asyncio.gather(loader.load("a"), loader.load("b"), loader.load("a"))
+            assert results == ["doc-a", "doc-b", "doc-a"]
+            assert calls == [["a", "b"]]
+            assert await loader.load("b") == "doc-b"
+            assert await loader.load("missing") is None
+            assert calls == [["a", "b"], ["missing"]]
+        asyncio.run(run())
+
+    def test_prime_and_clear(self):
+        async def run():
+            calls = []
+            loader = make_loader(calls)
+            loader.prime("a", "primed")
+            assert await loader.load("a") == "primed"
+            loader.clear("a")
+            assert await loader.load("a") == "doc-a"
+            assert calls == [["a"]]
+        asyncio.run(run())
+
+    def test_prime_while_queued(self):
+        async def run():
+            calls = []
+            loader = make_loader(calls)
+            queued = asyncio.ensure_future(loader.load("a"))
+            await asyncio.sleep(0)  # "a" is queued for the next batch
+            loader.prime("a", "primed")
+            assert await asyncio.wait_for(queued, 1) == "doc-a"
+            assert await loader.load("a") == "primed"
+            assert calls == [["a"]]
+        asyncio.run(run())
+
+    def test_clear_while_queued(self):
+        async def run():
+            calls = []
+            loader = make_loader(calls)
+            queued = asyncio.ensure_future(loader.load("b"))
+            await asyncio.sleep(0)
+            loader.clear("b")
+            assert await asyncio.wait_for(queued, 1) == "doc-b"
+            assert await loader.load("b") == "doc-b"
+            assert calls == [["b"], ["b"]]
+        asyncio.run(run())
+
+    def test_failed_batch_is_retried(self):
+        async def run():
+            calls = []
+            loader = make_loader(calls, fail_first=True)
+            with pytest.raises(RuntimeError):
+                await loader.load("a")
+            assert await loader.load("a") == "doc-a"
+            assert len(calls) == 2
+        asyncio.run(run())
@@ -318,7 +318,8 @@ const resources = {
       system: {
         exchangeStarted: 'Intercambio iniciado. Coordina tu encuentro presencial aquí.',
         exchangeCompleted: '✅ ¡Intercambio completado exitosamente!',
-        exchangeFailed: '❌ El intercambio no se completó.'
+        exchangeFailed: '❌ El intercambio no se completó.',
+        exchangeExpired: '⌛ El intercambio expiró sin confirmarse.'
       },
       reputation: {
         new: 'Nuevo',
@@ -329,7 +330,8 @@ const resources = {
       chat: {
         placeholder: 'Escribí un mensaje...',
         readOnly: 'Solo lectura',
-        chatClosed: 'El chat está cerrado para este intercambio'
+        chatClosed: 'El chat está cerrado para este intercambio',
+        loadOlder: 'Ver mensajes anteriores'
       },
       offers: {
         title: 'Ofertas',
@@ -834,7 +836,8 @@ const resources = {
       system: {
         exchangeStarted: 'Exchange started. Coordinate your in-person meeting here.',
         exchangeCompleted: '✅ Exchange completed successfully!',
-        exchangeFailed: '❌ Exchange was not completed.'
+        exchangeFailed: '❌ Exchange was not completed.',
+        exchangeExpired: '⌛ Exchange expired before being confirmed.'
       },
       reputation: {
         new: 'New',
@@ -845,7 +848,8 @@ const resources = {
       chat: {
         placeholder: 'Write a message...',
         readOnly: 'Read only',
-        chatClosed: 'Chat is closed for this exchange'
+        chatClosed: 'Chat is closed for this exchange',
+        loadOlder: 'Load older messages'
       },
       offers: {
         title: 'Offers',
@@ -1350,7 +1354,8 @@ const resources = {
       system: {
         exchangeStarted: 'Troca iniciada. Combine seu encontro presencial aqui.',
         exchangeCompleted: '✅ Troca completada com sucesso!',
-        exchangeFailed: '❌ A troca não foi completada.'
+        exchangeFailed: '❌ A troca não foi completada.',
+        exchangeExpired: '⌛ A troca expirou sem ser confirmada.'
       },
       reputation: {
         new: 'Novo',
@@ -1361,7 +1366,8 @@ const resources = {
       chat: {
         placeholder: 'Escreva uma mensagem...',
         readOnly: 'Somente leitura',
-        chatClosed: 'O chat está fechado para esta troca'
+        chatClosed: 'O chat está fechado para esta troca',
+        loadOlder: 'Ver mensagens anteriores'
       },
       offers: {
         title: 'Ofertas',
@@ -1866,7 +1872,8 @@ const resources = {
       system: {
         exchangeStarted: 'Échange commencé. Coordonnez votre rencontre en personne ici.',
         exchangeCompleted: '✅ Échange complété avec succès!',
-        exchangeFailed: '❌ L\'échange n\'a pas été complété.'
+        exchangeFailed: '❌ L\'échange n\'a pas été complété.',
+        exchangeExpired: '⌛ L\'échange a expiré sans être confirmé.'
       },
       reputation: {
         new: 'Nouveau',
@@ -1877,7 +1884,8 @@ const resources = {
       chat: {
         placeholder: 'Écrivez un message...',
         readOnly: 'Lecture seule',
-        chatClosed: 'Le chat est fermé pour cet échange'
+        chatClosed: 'Le chat est fermé pour cet échange',
+        loadOlder: 'Charger les messages précédents'
       },
       offers: {
         title: 'Offres',
@@ -2390,7 +2398,8 @@ const resources = {
       system: {
         exchangeStarted: 'Tausch gestartet. Koordiniere hier euer persönliches Treffen.',
         exchangeCompleted: '✅ Tausch erfolgreich abgeschlossen!',
-        exchangeFailed: '❌ Der Tausch wurde nicht abgeschlossen.'
+        exchangeFailed: '❌ Der Tausch wurde nicht abgeschlossen.',
+        exchangeExpired: '⌛ Der Tausch ist ohne Bestätigung abgelaufen.'
       },
       reputation: {
         new: 'Neu',
@@ -2401,7 +2410,8 @@ const resources = {
       chat: {
         placeholder: 'Nachricht schreiben...',
         readOnly: 'Nur lesen',
-        chatClosed: 'Der Chat ist für diesen Tausch geschlossen'
+        chatClosed: 'Der Chat ist für diesen Tausch geschlossen',
+        loadOlder: 'Ältere Nachrichten laden'
       },
       offers: {
         title: 'Angebote',
@@ -2914,7 +2924,8 @@ const resources = {
       system: {
         exchangeStarted: 'Scambio iniziato. Coordina qui il vostro incontro di persona.',
         exchangeCompleted: '✅ Scambio completato con successo!',
-        exchangeFailed: '❌ Lo scambio non è stato completato.'
+        exchangeFailed: '❌ Lo scambio non è stato completato.',
+        exchangeExpired: '⌛ Lo scambio è scaduto senza essere confermato.'
       },
       reputation: {
         new: 'Nuovo',
@@ -2925,7 +2936,8 @@ const resources = {
       chat: {
         placeholder: 'Scrivi un messaggio...',
         readOnly: 'Solo lettura',
-        chatClosed: 'La chat è chiusa per questo scambio'
+        chatClosed: 'La chat è chiusa per questo scambio',
+        loadOlder: 'Carica messaggi precedenti'
       },
       offers: {
         title: 'Offerte',
@@ -12,6 +12,8 @@ import { UpgradeModal } from '../components/UpgradeModal';
 
 // Polling interval in milliseconds
 const POLL_INTERVAL = 2000;
+// While the push channel is connected, polling is only a safety net
+const POLL_INTERVAL_WITH_PUSH = 15000;
 
 // Helper to get display name with i18n fallback
 const getDisplayName = (user, t) => {
@@ -47,6 +49,10 @@ export const ExchangeChat = () => {
   const [showUpgradeModal, setShowUpgradeModal] = useState(false);
   const [currentUserPlan, setCurrentUserPlan] = useState('free');
   const messagesEndRef = useRef(null);
+  const lastMessageIdRef = useRef(null); // Cursor for incremental polling
+  const [hasOlder, setHasOlder] = useState(false); // Older history beyond the first page
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  const [pushConnected, setPushConnected] = useState(false);
   const messagesContainerRef = useRef(null);
   const isAtBottomRef = useRef(true);
   const navigate = useNavigate();
@@ -73,8 +79,17 @@ export const ExchangeChat = () => {
     
     const pollMessages = async () => {
       try {
-        const chatRes = await api.get(`/exchanges/${exchangeId}/chat`);
+        // Only ask for messages after the last one we have
+        const since = lastMessageIdRef.current;
+        const chatRes = await api.get(`/exchanges/${exchangeId}/chat`, {
+          params: since ? { since } : {}
+        });
         const newMessages = chatRes.data.messages || [];
+        // Cursor only follows server responses: a message we just sent may be
+        // newer than a partner message we have not fetched yet
+        if (newMessages.length > 0) {
+          lastMessageIdRef.current = newMessages[newMessages.length - 1].id;
+        }
         
         // Only update if there are new messages
         setMessages(prevMessages => {
@@ -101,10 +116,71 @@ export const ExchangeChat = () => {
       }
     };
 
-    const intervalId = setInterval(pollMessages, POLL_INTERVAL);
+    const intervalId = setInterval(pollMessages, pushConnected ? POLL_INTERVAL_WITH_PUSH : POLL_INTERVAL);
     
     // Cleanup: stop polling when component unmounts or exchangeId changes
     return () => clearInterval(intervalId);
+  }, [exchangeId, loading, checkIfAtBottom, pushConnected]);
+
+  // Server push (SSE): new messages and status changes arrive without polling
+  useEffect(() => {
+    if (loading) return;
+    if (!localStorage.getItem('token') || typeof EventSource === 'undefined') return;
+    
+    let source = null;
+    let reconnectTimer = null;
+    let closed = false;
+    
+    // The stream authenticates with a short-lived stream token (never the
+    // session token), so every (re)connect asks for a fresh one
+    const connect = async () => {
+      let streamToken;
+      try {
+        const response = await api.post('/events/stream-token');
+        streamToken = response.data.stream_token;
+      } catch (error) {
+        reconnectTimer = setTimeout(connect, POLL_INTERVAL);
+        return;
+      }
+      if (closed) return;
+      
+      source = new EventSource(
+        `${api.defaults.baseURL}/events/stream?stream_token=${encodeURIComponent(streamToken)}`
+      );
+      source.onopen = () => setPushConnected(true);
+      source.onerror = () => {
+        setPushConnected(false);
+        // EventSource retries by itself, but gives up (CLOSED) once the
+        // server rejects the expired token - reconnect with a new one
+        if (source.readyState === EventSource.CLOSED && !closed) {
+          reconnectTimer = setTimeout(connect, POLL_INTERVAL);
+        }
+      };
+      
+      source.addEventListener('chat_message', (event) => {
+        const { exchange_id, message } = JSON.parse(event.data);
+        if (exchange_id !== exchangeId) return;
+        setMessages(prevMessages => {
+          if (prevMessages.some(m => m.id === message.id)) return prevMessages;
+          checkIfAtBottom();
+          return [...prevMessages, message];
+        });
+      });
+      
+      source.addEventListener('exchange_updated', (event) => {
+        const { exchange_id, status } = JSON.parse(event.data);
+        if (exchange_id !== exchangeId) return;
+        setChatData(prev => (prev ? { ...prev, is_read_only: status !== 'pending' } : prev));
+      });
+    };
+    connect();
+    
+    return () => {
+      closed = true;
+      clearTimeout(reconnectTimer);
+      if (source) source.close();
+      setPushConnected(false);
+    };
   }, [exchangeId, loading, checkIfAtBottom]);
 
   // Auto-scroll when new messages arrive (only if user was at bottom)
@@ -123,7 +199,10 @@ export const ExchangeChat = () => {
       ]);
       setExchange(exchangeRes.data);
       setChatData(chatRes.data);
-      setMessages(chatRes.data.messages || []);
+      const initialMessages = chatRes.data.messages || [];
+      setMessages(initialMessages);
+      setHasOlder(Boolean(chatRes.data.has_more));
+      lastMessageIdRef.current = initialMessages.length > 0 ? initialMessages[initialMessages.length - 1].id : null;
       setCurrentUserPlan(planRes.data.plan || 'free');
     } catch (error) {
       // Don't show raw backend error - use generic message
@@ -135,6 +214,35 @@ export const ExchangeChat = () => {
     }
   };
 
+  // Prepend the page before the oldest loaded message, keeping the scroll position
+  const loadOlderMessages = async () => {
+    if (loadingOlder || messages.length === 0) return;
+    setLoadingOlder(true);
+    try {
+      const container = messagesContainerRef.current;
+      const previousHeight = container ? container.scrollHeight : 0;
+      const response = await api.get(`/exchanges/${exchangeId}/chat`, {
+        params: { before: messages[0].id }
+      });
+      const olderMessages = response.data.messages || [];
+      isAtBottomRef.current = false; // Don't auto-scroll away from the older messages
+      setMessages(prevMessages => {
+        const existingIds = new Set(prevMessages.map(m => m.id));
+        return [...olderMessages.filter(m => !existingIds.has(m.id)), ...prevMessages];
+      });
+      setHasOlder(Boolean(response.data.has_more));
+      requestAnimationFrame(() => {
+        if (container) {
+          container.scrollTop += container.scrollHeight - previousHeight;
+        }
+      });
+    } catch (error) {
+      toast.error(t('common.error'));
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   };
@@ -220,6 +328,18 @@ export const ExchangeChat = () => {
         onScroll={checkIfAtBottom}
         className="flex-1 overflow-y-auto p-4 space-y-4"
       >
+        {hasOlder && (
+          <div className="flex justify-center">
+            <Button
+              variant="outline"
+              size="sm"
+              onClick={loadOlderMessages}
+              disabled={loadingOlder}
+            >
+              {loadingOlder ? t('common.loading') : t('chat.loadOlder')}
+            </Button>
+          </div>
+        )}
         {messages.map((msg) => {
           const isSystem = msg.is_system;
           const isMe = msg.sender_id === user?.id;
@@ -229,7 +349,8 @@ export const ExchangeChat = () => {
             const systemMessageKeys = {
               'SYSTEM_EXCHANGE_STARTED': t('system.exchangeStarted'),
               'SYSTEM_EXCHANGE_COMPLETED': t('system.exchangeCompleted'),
-              'SYSTEM_EXCHANGE_FAILED': t('system.exchangeFailed')
+              'SYSTEM_EXCHANGE_FAILED': t('system.exchangeFailed'),
+              'SYSTEM_EXCHANGE_EXPIRED': t('system.exchangeExpired')
             };
             const displayContent = systemMessageKeys[msg.content] || msg.content;
             